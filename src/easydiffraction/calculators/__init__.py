@@ -2,21 +2,60 @@
 # SPDX-License-Identifier: BSD-3-Clause
 # © 2021-2024 Contributors to the EasyDiffraction project <https://github.com/EasyScience/EasyDiffraction>
 
-try:
-    from easydiffraction.calculators.cryspy.wrapper import CryspyWrapper  # noqa: F401
-except ImportError:
-    print('Warning: CrysPy is not installed')
-
-# Temporarily disabling the PyCrysFML interface
-# try:
-#     from easydiffraction.calculators.pycrysfml.wrapper import PycrysfmlWrapper  # noqa: F401
-# except ImportError:
-#     print('Warning: CrysFML is not installed')
-
-try:
-    from easydiffraction.calculators.pdffit2.wrapper import Pdffit2Wrapper  # noqa: F401
-except ImportError:
-    pass
-    # print('Warning: PdfFit2 is not installed')
+import importlib
+import importlib.util
+from typing import List
 
 from easydiffraction.calculators.wrapper_base import WrapperBase  # noqa: F401
+
+# Calculator wrappers are imported on first use, so only the selected backends are loaded.
+# Calculator name -> (wrapper module, package required by the backend). The first one is the default.
+CALCULATORS = {
+    'CrysPy': ('easydiffraction.calculators.cryspy.wrapper', 'cryspy'),
+    # Temporarily disabling the PyCrysFML interface
+    # 'CrysFML': ('easydiffraction.calculators.pycrysfml.wrapper', 'CFML_api'),
+    'Pdffit2': ('easydiffraction.calculators.pdffit2.wrapper', 'diffpy.pdffit2'),
+}
+
+_MISSING_WARNINGS = {
+    'CrysPy': 'Warning: CrysPy is not installed',
+    'CrysFML': 'Warning: CrysFML is not installed',
+}
+
+
+def _is_installed(package: str) -> bool:
+    try:
+        return importlib.util.find_spec(package) is not None
+    except ImportError:
+        # the parent package is missing
+        return False
+
+
+def installed_calculators() -> List[str]:
+    """
+    Names of the calculators whose backend is installed, without importing them.
+    """
+    return [name for name, (_, package) in CALCULATORS.items() if _is_installed(package)]
+
+
+def load_calculator(name: str) -> bool:
+    """
+    Import the wrapper of calculator `name`, which registers it with `WrapperBase`.
+
+    :param name: calculator name, one of `CALCULATORS`
+    :return: True if the calculator is available
+    """
+    if name not in CALCULATORS:
+        return False
+    module, package = CALCULATORS[name]
+    if not _is_installed(package):
+        if name in _MISSING_WARNINGS:
+            print(_MISSING_WARNINGS[name])
+        return False
+    try:
+        importlib.import_module(module)
+    except ImportError:
+        if name in _MISSING_WARNINGS:
+            print(_MISSING_WARNINGS[name])
+        return False
+    return True
@@ -0,0 +1,75 @@
+# SPDX-FileCopyrightText: 2024 EasyDiffraction contributors
+# SPDX-License-Identifier: BSD-3-Clause
+# © 2021-2024 Contributors to the EasyDiffraction project <https://github.com/EasyScience/EasyDiffraction>
+
+from typing import Dict
+from typing import Optional
+
+
+class PhaseCifCache:
+    """
+    CIF text of each phase, regenerated lazily when read after one of its components changed.
+
+    Calculators which consume CIF text (pdffit2, CrysFML) call `invalidate` from their
+    `ItemContainer` setters instead of regenerating the CIF on every parameter update.
+    """
+
+    def __init__(self, phases=None):
+        self._phases = phases
+        # phase unique name -> CIF text, absent when the phase is dirty
+        self._text: Dict[str, str] = {}
+        # unique name of every phase component (phase, cell, space group, site) -> phase unique name
+        self._owners: Dict[str, str] = {}
+
+    @property
+    def phases(self):
+        return self._phases
+
+    @phases.setter
+    def phases(self, phases):
+        self._phases = phases
+        self._text = {}
+        self._owners = {}
+
+    def owner(self, key: str) -> Optional[str]:
+        """
+        Unique name of the phase which contains the component `key`.
+        """
+        if self._phases is None:
+            return None
+        if key not in self._owners:
+            # a component was added since the index was built
+            self._owners = {}
+            for phase in self._phases:
+                for component in [phase, phase.cell, phase._spacegroup, *phase.atoms]:
+                    self._owners[component.unique_name] = phase.unique_name
+        return self._owners.get(key)
+
+    def invalidate(self, key: Optional[str] = None):
+        """
+        Mark the phase owning the component `key` as changed. All phases are marked if `key` is None.
+        Components which do not belong to a phase (e.g. instrument parameters) are ignored.
+        """
+        if key is None:
+            self._text = {}
+            return
+        owner = self.owner(key)
+        if owner is not None:
+            self._text.pop(owner, None)
+
+    def phase_cif(self, phase) -> str:
+        """
+        CIF text of a single phase. The same string object is returned until the phase changes.
+        """
+        key = phase.unique_name
+        if key not in self._text:
+            self._text[key] = str(phase.cif)
+        return self._text[key]
+
+    def cif(self) -> str:
+        """
+        CIF text of all phases.
+        """
+        if self._phases is None:
+            return ''
+        return '\n\n'.join(self.phase_cif(phase) for phase in self._phases)
@@ -2,7 +2,9 @@
 # SPDX-License-Identifier: BSD-3-Clause
 # © 2021-2024 Contributors to the EasyDiffraction project <https://github.com/EasyScience/EasyDiffraction>
 
+import functools
 import warnings
+from copy import deepcopy
 from typing import Any
 from typing import Callable
 from typing import Dict
@@ -20,9 +22,15 @@ from gemmi import find_spacegroup_by_name
 from easydiffraction.calculators.cryspy.parser import calcObjAndDictToEdExperiments
 from easydiffraction.calculators.cryspy.parser import cifV2ToV1
 from easydiffraction.calculators.cryspy.parser import cifV2ToV1_tof
+from easydiffraction.calculators.reflections import empty_reflections
+from easydiffraction.calculators.reflections import integrate
+from easydiffraction.calculators.reflections import peak_widths
 
-warnings.filterwarnings('ignore')
+# silence the numerical warnings of cryspy, but not those of other libraries or of easydiffraction itself
+warnings.filterwarnings('ignore', module='cryspy')
+warnings.filterwarnings('ignore', module=__name__)
 
+# default normalization of the phase scales, see `Cryspy.normalization`
 normalization = 0.5
 
 RAD_MAP = {
@@ -76,6 +84,32 @@ CRYSPY_MODEL_COORD_INDEX = {
 }
 
 
+# Constructing a `cryspy.SpaceGroup` (symmetry operations and Wyckoff table) is expensive, so one
+# template per (H-M symbol, setting) is kept for the whole process. Crystals get their own copy.
+_SPACE_GROUPS: Dict[Tuple[str, str], cryspy.SpaceGroup] = {}
+
+
+@functools.lru_cache(maxsize=None)
+def _default_it_code(name_hm_alt: str) -> str:
+    sg = find_spacegroup_by_name(name_hm_alt)
+    return get_default_it_coordinate_system_code_by_it_number(sg.number)
+
+
+def _space_group(name_hm_alt: str, it_code: str) -> cryspy.SpaceGroup:
+    key = (name_hm_alt, it_code)
+    if key not in _SPACE_GROUPS:
+        opts = {'name_hm_alt': name_hm_alt}
+        if it_code:
+            opts['it_coordinate_system_code'] = it_code
+        try:
+            sg = cryspy.SpaceGroup(**opts)
+        except Exception as e:
+            print(e)
+            sg = cryspy.SpaceGroup(**{'name_hm_alt': name_hm_alt})
+        _SPACE_GROUPS[key] = sg
+    return deepcopy(_SPACE_GROUPS[key])
+
+
 class Cryspy:
     def __init__(self):
         # temporary cludge before `beta` branch merged properly
@@ -117,7 +151,29 @@ class Cryspy:
         self.exp_obj = None
         self.chisq = None
         self.name_hm_alt = ''
+        # the phase scales are divided by this, kept per calculator so that jobs don't share it
+        self.normalization = normalization
         self.it_code = ''
+        # space group key -> (H-M symbol, setting) it was built from
+        self._space_group_ids = {}
+        # space group key -> key of the crystal it is assigned to
+        self._space_group_crystals = {}
+        # id(atom) -> (atom, space group and id of the Wyckoff position it was formed with)
+        self._atom_space_groups = {}
+        # id(atom) -> storage key of the atom
+        self._atom_keys = {}
+        # atom storage key -> {susceptibility type: cryspy object}
+        self._atom_msps = {}
+        # phase label -> cryspy phase in `self.phases`
+        self._phase_labels = {}
+        # id(crystal) -> (crystal, magnetic sites its susceptibility lists were built from)
+        self._msp_scaffolds = {}
+        # id(model) -> index of the `PhaseL` slot in `model.items`
+        self._phase_slots = {}
+        # (item, key, value) changes made before the first calculation
+        self._pending_dict_updates = []
+        # storage key of a cell or atom site -> (crystal, index of the atom site)
+        self._crystal_locations = {}
         self.excluded_points = []
         self._cryspyData = Data()  # {phase_name: CryspyPhase, exp_name: CryspyExperiment}
         self._cryspyObject = self._cryspyData._cryspyObj
@@ -166,6 +222,7 @@ class Cryspy:
     def assignPhase(self, model_name: str, phase_name: str):
         phase = self.storage[phase_name]
         self.phases.items.append(phase)
+        self._phase_labels[phase.label] = phase
 
     def removePhase(self, model_name: str, phase_name: str):
         # NEED FIX: Check if all phases are removed!
@@ -177,7 +234,10 @@ class Cryspy:
         del self.storage[phase_name]
         del self.storage[f'{short_phase_name}_scale']
         self.phases.items.pop(self.phases.items.index(phase))
+        if self._phase_labels.get(phase.label) is phase:
+            del self._phase_labels[phase.label]
         name = self.current_crystal.pop(short_phase_name)
+        self._forget_crystal(short_phase_name)
         if name in self.additional_data['phases'].keys():
             del self.additional_data['phases'][name]
         cryspyObjBlockNames = [item.data_name for item in self._cryspyObject.items]
@@ -227,23 +287,19 @@ class Cryspy:
         name_hm_alt = self.name_hm_alt
 
         if not it_code:
-            sg = find_spacegroup_by_name(name_hm_alt)
-            self.it_code = get_default_it_coordinate_system_code_by_it_number(sg.number)
+            self.it_code = _default_it_code(name_hm_alt)
         it_code = it_code or self.it_code
 
         if it_code:
             name_hm_alt += ':' + it_code
 
         sg_split = name_hm_alt.split(':')
-        opts = {'name_hm_alt': sg_split[0]}
-        if len(sg_split) > 1:
-            opts['it_coordinate_system_code'] = sg_split[1]
-        try:
-            sg = cryspy.SpaceGroup(**opts)
-        except Exception as e:
-            print(e)
-            sg = cryspy.SpaceGroup(**{'name_hm_alt': sg_split[0]})
-        self.storage[key] = sg
+        sg_id = (sg_split[0], sg_split[1] if len(sg_split) > 1 else '')
+        if key in self.storage and self._space_group_ids.get(key) == sg_id:
+            # same group and setting, keep the object the crystal and atoms already use
+            return key
+        self.storage[key] = _space_group(*sg_id)
+        self._space_group_ids[key] = sg_id
         return key
 
     def getSpaceGroupSymbol(self, spacegroup_name: str, *args, **kwargs) -> str:
@@ -260,21 +316,36 @@ class Cryspy:
         crystal = self.storage[crystal_name]
         space_group: cryspy.SpaceGroup = self.storage[spacegroup_name]
         setattr(crystal, 'space_group', space_group)
+        self._space_group_crystals[spacegroup_name] = crystal_name
         for atom in crystal.atom_site.items:
-            atom.define_space_group_wyckoff(space_group.space_group_wyckoff)
-            atom.form_object()
+            self._form_atom(atom, space_group)
+
+    def _form_atom(self, atom: cryspy.AtomSite, space_group: cryspy.SpaceGroup):
+        """
+        Place the atom on its Wyckoff position, unless it is already on this position of this space group.
+        """
+        wyckoffs = space_group.space_group_wyckoff
+        wyckoff_id = wyckoffs.get_id_for_fract(float(atom.fract_x), float(atom.fract_y), float(atom.fract_z))
+        formed = self._atom_space_groups.get(id(atom))
+        if formed is not None and formed[0] is atom and formed[1] is space_group and formed[2] == wyckoff_id:
+            return
+        atom.define_space_group_wyckoff(wyckoffs)
+        atom.form_object()
+        self._atom_space_groups[id(atom)] = (atom, space_group, wyckoff_id)
 
     def updateSpacegroup(self, sg_key: str, **kwargs):
         # This has to be done as sg.name_hm_alt = 'blah' doesn't work :-(
-        keys = list(self.current_crystal.keys())
-        previous_key = ''
-        for key in keys:
-            if key in self.storage.keys():
-                previous_sg = getattr(self.storage[key], 'space_group', None)
-                if previous_sg == self.storage[sg_key]:
+        previous_sg = self.storage.get(sg_key)
+        previous_key = self._space_group_crystals.get(sg_key, '')
+        if not previous_key:
+            for key in self.current_crystal.keys():
+                if key in self.storage.keys() and getattr(self.storage[key], 'space_group', None) is previous_sg:
                     previous_key = key
                     break
         sg_key = self.createSpaceGroup(key=sg_key, **kwargs)
+        if self.storage[sg_key] is previous_sg:
+            # neither the group nor the setting changed
+            return
         self.assignSpaceGroup_toCrystal(sg_key, previous_key)
         # here, the CIF has the new group, so reload
         if not self.current_crystal:
@@ -286,13 +357,20 @@ class Cryspy:
 
     def createAtom(self, atom_name: str, **kwargs) -> str:
         atom = cryspy.AtomSite(**kwargs)
+        previous = self.storage.get(atom_name)
+        if isinstance(previous, cryspy.AtomSite):
+            # replaced, e.g. when the phase is rebuilt, its susceptibilities stay with the name
+            self._atom_space_groups.pop(id(previous), None)
+            self._atom_keys.pop(id(previous), None)
         self.storage[atom_name] = atom
+        self._atom_keys[id(atom)] = atom_name
         return atom_name
 
     def attachMSP(self, atom_name: str, msp_name: str, msp_args: Dict[str, float]):
         msp = cryspy.AtomSiteSusceptibility(chi_type=msp_name, **msp_args)
         ref_name = str(atom_name) + '_' + msp_name
         self.storage[ref_name] = msp
+        self._atom_msps.setdefault(str(atom_name), {})[msp_name] = msp
         return ref_name
 
     def attachADP(self, atom_name: str, adp_args: Dict[str, float]):
@@ -304,9 +382,7 @@ class Cryspy:
     def assignAtom_toCrystal(self, atom_label: str, crystal_name: str):
         crystal = self.storage[crystal_name]
         atom = self.storage[atom_label]
-        wyckoff = crystal.space_group.space_group_wyckoff
-        atom.define_space_group_wyckoff(wyckoff)
-        atom.form_object()
+        self._form_atom(atom, crystal.space_group)
         for item in crystal.items:
             if not isinstance(item, cryspy.AtomSiteL):
                 continue
@@ -320,6 +396,36 @@ class Cryspy:
                 continue
             idx = item.items.index(atom)
             del item.items[idx]
+        self._forget_atom(atom)
+        # the indices of the following atom sites changed
+        self._forget_locations(crystal)
+
+    def _forget_atom(self, atom: cryspy.AtomSite):
+        """
+        Drop the atom from the indices, which are keyed by `id()` and must not outlive it.
+        """
+        self._atom_space_groups.pop(id(atom), None)
+        atom_key = self._atom_keys.pop(id(atom), None)
+        if atom_key is not None:
+            self._atom_msps.pop(str(atom_key), None)
+
+    def _forget_locations(self, crystal: cryspy.Crystal):
+        for item in [item for item, (owner, _) in self._crystal_locations.items() if owner is crystal]:
+            del self._crystal_locations[item]
+
+    def _forget_crystal(self, crystal_key: str):
+        """
+        Drop the crystal stored as `crystal_key` and its atoms from the indices.
+        """
+        crystal = self.storage.get(crystal_key)
+        for sg_key in [sg_key for sg_key, key in self._space_group_crystals.items() if key == crystal_key]:
+            del self._space_group_crystals[sg_key]
+        if crystal is None:
+            return
+        for atom in getattr(getattr(crystal, 'atom_site', None), 'items', []):
+            self._forget_atom(atom)
+        self._forget_locations(crystal)
+        self._msp_scaffolds.pop(id(crystal), None)
 
     def createBackground(self, background_obj) -> str:
         key = 'background'
@@ -430,7 +536,7 @@ class Cryspy:
         for key_inner in ['pd_instr_resolution', 'pd_instr_reflex_asymmetry', 'setup']:
             if not hasattr(self.model, key_inner):
                 setattr(self.model, key_inner, self.storage[key_inner])
-        norm = normalization
+        norm = self.normalization
         if self.polarized:
             norm = 1.0
             if 'pol_fn' in kwargs.keys():
@@ -453,6 +559,7 @@ class Cryspy:
             offset = self.pattern.zero_shift.raw_value
 
         this_x_array = x_array - offset
+        self.additional_data['offset'] = offset
 
         if 'excluded_points' in kwargs:
             setattr(self.model, 'excluded_points', kwargs['excluded_points'])
@@ -492,11 +599,12 @@ class Cryspy:
             scale = 1.0
             offset = 0
         else:
-            scale = self.pattern.scale.raw_value / normalization
+            scale = self.pattern.scale.raw_value / self.normalization
             offset = self.pattern.zero_shift.raw_value
         self.model['tof_parameters'].zero = offset
 
         this_x_array = x_array - offset
+        self.additional_data['offset'] = offset
         # background
         self.model['tof_background'].time_max = this_x_array[-1]
 
@@ -527,40 +635,10 @@ class Cryspy:
         phase_lists = []
         profiles = []
         peak_dat = []
-        storage_invert = {v: k for k, v in self.storage.items()}
         for crystal in crystals:
             phasesL = cryspy.PhaseL()
-            atoms = crystal.atom_site
-            pol_atoms = []
-            ass = []
-            for atom in atoms:
-                i = None
-                l_key = str(storage_invert[atom]) + '_Cani'
-                if l_key in self.storage.keys():
-                    i = self.storage[l_key]
-                l_key = str(storage_invert[atom]) + '_Ciso'
-                if l_key in self.storage.keys():
-                    i = self.storage[l_key]
-                if i is not None:
-                    i.label = atom.label
-                    pol_atoms.append(i)
-                    ii = cryspy.AtomSiteScat()
-                    ii.label = atom.label
-                    ass.append(ii)
-            if pol_atoms:
-                asl = cryspy.AtomSiteSusceptibilityL()
-                asl.items = pol_atoms
-                sl = cryspy.AtomSiteScatL()
-                sl.items = ass
-                setattr(crystal, 'atom_site_susceptibility', asl)
-                setattr(crystal, 'atom_site_scat', sl)
-            else:
-                if hasattr(crystal, 'atom_site_susceptibility'):
-                    delattr(crystal, 'atom_site_susceptibility')
-                if hasattr(crystal, 'atom_site_scat'):
-                    delattr(crystal, 'atom_site_scat')
-            idx = [idx for idx, item in enumerate(self.phases.items) if item.label == crystal.data_name][0]
-            phasesL.items.append(self.phases.items[idx])
+            self._update_msp_scaffold(crystal)
+            phasesL.items.append(self._phase(crystal.data_name))
             phase_lists.append(phasesL)
             profile, peak = self._do_run(self.model, self.polarized, this_x_array, crystal, phasesL, bg)
             profiles.append(profile)
@@ -580,7 +658,7 @@ class Cryspy:
         x_str = 'ttheta'
         if self.type == 'powder1DTOF':
             x_str = 'time'
-        norm = normalization
+        norm = self.normalization
         if self.polarized:
             norm = 1.0
             # TODO *REPLACE PLACEHOLDER FN*
@@ -595,7 +673,9 @@ class Cryspy:
 
             new_bg = pol_fn(bg, bg)  # Scale the bg for the components requested
         else:
-            dependents, additional_data = self.nonPolarized_update(crystals, profiles, peak_dat, phase_scales, x_str)
+            dependents, additional_data = self.nonPolarized_update(
+                crystals, profiles, peak_dat, phase_scales, x_str, self.normalization
+            )
         self.additional_data['phases'].update(additional_data)
         self.additional_data['global_scale'] = scale
         self.additional_data['background'] = new_bg
@@ -652,6 +732,45 @@ class Cryspy:
             data = self.additional_data['phases'][phase_name].copy()
         return data
 
+    def get_reflections(self, phase_name: str) -> np.ndarray:
+        """
+        Reflection table of a phase from the last calculation, with the positions on the x axis
+        of the pattern and the intensities integrated over the calculated points.
+        Nothing is recalculated: the columns are taken from the CrysPy output of the last run.
+        :param phase_name: name of the phase
+        :return: structured array of `REFLECTION_DTYPE`, one row per reflection
+        """
+        if phase_name not in self.additional_data.get('phase_names', []):
+            raise ValueError(f'No calculated reflections for phase: {phase_name}')
+        phase = self.additional_data['phases'][phase_name]
+        peaks = phase['reflections']
+        x = self.additional_data['ivar_run']
+        offset = self.additional_data.get('offset', 0)
+
+        table = empty_reflections(len(peaks['multiplicity_hkl']))
+        table['h'], table['k'], table['l'] = peaks['index_hkl']
+        table['multiplicity'] = peaks['multiplicity_hkl']
+        table['f_squared'] = np.abs(peaks['f_nucl']) ** 2
+        if 'time_hkl' in peaks:
+            table['position'] = peaks['time_hkl'] + offset
+            table['d'] = peaks['d_hkl']
+            shapes = peaks['profile_tof']
+        else:
+            table['position'] = np.degrees(peaks['ttheta_hkl']) + offset
+            table['d'] = 0.5 / peaks['sthovl']
+            shapes = peaks['profile_pv']
+        table['fwhm'] = peak_widths(x, shapes)
+
+        # the share of every reflection in the phase profile
+        areas = integrate(x, shapes)
+        up = peaks['iint_plus_with_factors'] * areas
+        if 'func' in phase:
+            down = peaks['iint_minus_with_factors'] * areas
+            table['intensity'] = phase['profile_scale'] * phase['func'](up, down)
+        else:
+            table['intensity'] = phase['profile_scale'] * up / self.normalization
+        return table
+
     def get_calculated_y_for_phase(self, phase_idx: int) -> List[np.ndarray]:
         """
         For a given phase index, return the calculated y
@@ -786,20 +905,38 @@ class Cryspy:
         Update the input cryspy dictionary with the key
             referenced by the item-key pair
         """
-        if not self._cryspyData._inOutDict:
-            return
         if not self._cryspyData._cryspyDict:
             return
+        if not self._cryspyData._inOutDict:
+            # nothing was calculated yet and the dictionary may still miss blocks,
+            # apply the change just before the first calculation
+            self._pending_dict_updates.append((item, key, value))
+            return
+        self._setCryspyDictValue(item, key, value)
+
+    def _applyPendingDictUpdates(self):
+        pending, self._pending_dict_updates = self._pending_dict_updates, []
+        for item, key, value in pending:
+            try:
+                self._setCryspyDictValue(item, key, value)
+            except (IndexError, KeyError):
+                # the block of this item is not in the dictionary
+                pass
+
+    def _setCryspyDictValue(self, item, key, value):
         # check the direct mapping first
         if key in CRYSPY_MODEL_PHASE_KEYS:
             # phase param
-            # TODO: remove assumption that the phase is the first block
-            phase_name = list(self._cryspyData._cryspyDict.keys())[0]
+            location = self._crystalLocation(item)
+            if location is None:
+                return
+            crystal, atom_index = location
+            phase_name = 'crystal_' + crystal.data_name.lower()
+            if phase_name not in self._cryspyData._cryspyDict:
+                return
             cryspy_dict = self._cryspyData._cryspyDict[phase_name]
             cryspy_key = CRYSPY_MODEL_PHASE_KEYS[key]
             loc = cryspy_dict[cryspy_key]
-            # find the text in `item` after the last underscore
-            atom_index = int(item[item.rfind('_') + 1 :])
             # is this a fractional coordinate?
             if 'fract' in key:
                 coord_index = CRYSPY_MODEL_COORD_INDEX[key]
@@ -824,6 +961,36 @@ class Cryspy:
         else:
             return
 
+    def _crystalLocation(self, item: str) -> Optional[Tuple[cryspy.Crystal, Optional[int]]]:
+        """
+        Crystal holding the cell or atom site stored as `item`, with the index of the atom site.
+        """
+        obj = self.storage.get(item)
+        cached = self._crystal_locations.get(item)
+        if cached is not None:
+            crystal, index = cached
+            if index is None and getattr(crystal, 'cell', None) is obj:
+                return cached
+            atoms = crystal.atom_site.items if index is not None else []
+            if index is not None and index < len(atoms) and atoms[index] is obj:
+                return cached
+        for key in self.current_crystal.keys():
+            crystal = self.storage.get(key)
+            if crystal is None:
+                continue
+            location = None
+            if getattr(crystal, 'cell', None) is obj:
+                location = (crystal, None)
+            elif hasattr(crystal, 'atom_site'):
+                for index, atom in enumerate(crystal.atom_site.items):
+                    if atom is obj:
+                        location = (crystal, index)
+                        break
+            if location is not None:
+                self._crystal_locations[item] = location
+                return location
+        return None
+
     def calculate_profile(self):
         # use data from the current dictionary to calculate profile
         result = rhochi_calc_chi_sq_by_dictionary(
@@ -835,7 +1002,7 @@ class Cryspy:
         return result
 
     @staticmethod
-    def nonPolarized_update(crystals, profiles, peak_dat, scales, x_str):
+    def nonPolarized_update(crystals, profiles, peak_dat, scales, x_str, norm=normalization):
         dependent = np.array([profile[0] for profile in profiles])
         output = {}
         for idx, profile in enumerate(profiles):
@@ -848,9 +1015,10 @@ class Cryspy:
                             'k': peak_dat[idx]['index_hkl'][1],
                             'l': peak_dat[idx]['index_hkl'][2],
                         },
-                        'profile': scales[idx] * dependent[idx, :] / normalization,
+                        'profile': scales[idx] * dependent[idx, :] / norm,
                         'components': {'total': dependent[idx, :]},
                         'profile_scale': scales[idx],
+                        'reflections': peak_dat[idx],
                     }
                 }
             )
@@ -882,15 +1050,70 @@ class Cryspy:
                         },
                         'profile_scale': scales[idx],
                         'func': func,
+                        'reflections': peak_dat[idx],
                     }
                 }
             )
 
         return dependent, output
 
+    def _update_msp_scaffold(self, crystal: cryspy.Crystal):
+        """
+        Attach the susceptibility and scattering lists of the magnetic sites to the crystal.
+        The lists are kept between calculations and only rebuilt when the sites, their labels
+        or their susceptibility objects change. Parameter updates act on the same objects in place.
+        """
+        sites = []
+        for atom in crystal.atom_site:
+            msps = self._atom_msps.get(self._atom_keys.get(id(atom)), {})
+            msp = msps.get('Ciso', msps.get('Cani'))
+            if msp is not None:
+                sites.append((atom.label, msp))
+        signature = tuple((label, id(msp)) for label, msp in sites)
+        scaffold = self._msp_scaffolds.get(id(crystal))
+        if scaffold is not None and scaffold[0] is crystal and scaffold[1] == signature:
+            return
+
+        if sites:
+            for label, msp in sites:
+                msp.label = label
+            asl = cryspy.AtomSiteSusceptibilityL()
+            asl.items = [msp for _, msp in sites]
+            sl = cryspy.AtomSiteScatL()
+            sl.items = []
+            for label, _ in sites:
+                scat = cryspy.AtomSiteScat()
+                scat.label = label
+                sl.items.append(scat)
+            setattr(crystal, 'atom_site_susceptibility', asl)
+            setattr(crystal, 'atom_site_scat', sl)
+        else:
+            # cryspy keeps the lists in the items of the crystal, not as attributes
+            lists = (cryspy.AtomSiteSusceptibilityL, cryspy.AtomSiteScatL)
+            crystal.items[:] = [item for item in crystal.items if not isinstance(item, lists)]
+        self._msp_scaffolds[id(crystal)] = (crystal, signature)
+
+    def _phase(self, label: str) -> cryspy.Phase:
+        """
+        Phase with the given label, looked up in the label index and rebuilt if the index is stale.
+        """
+        phase = self._phase_labels.get(label)
+        if phase is None or phase.label != label:
+            self._phase_labels = {}
+            for item in self.phases.items:
+                self._phase_labels.setdefault(item.label, item)
+            phase = self._phase_labels[label]
+        return phase
+
+    def _phase_slot(self, model) -> int:
+        idx = self._phase_slots.get(id(model))
+        if idx is None or idx >= len(model.items) or not isinstance(model.items[idx], cryspy.PhaseL):
+            idx = [idx for idx, item in enumerate(model.items) if isinstance(item, cryspy.PhaseL)][0]
+            self._phase_slots[id(model)] = idx
+        return idx
+
     def _do_run(self, model, polarized, x_array, crystals, phase_list, bg):
-        idx = [idx for idx, item in enumerate(model.items) if isinstance(item, cryspy.PhaseL)][0]
-        model.items[idx] = phase_list
+        model.items[self._phase_slot(model)] = phase_list
 
         data_name = crystals.data_name
         setattr(self.model, 'data_name', data_name)
@@ -910,6 +1133,8 @@ class Cryspy:
 
         if not self._cryspyData._cryspyDict:
             return None
+        if self._pending_dict_updates:
+            self._applyPendingDictUpdates()
 
         self._cryspyDict = self._cryspyData._cryspyDict
         self._cryspyDict[exp_name_model] = experiment_dict_model
@@ -9,6 +9,7 @@ from typing import TYPE_CHECKING
 from typing import Callable
 from typing import List
 from typing import Optional
+from typing import Sequence
 from typing import Union
 
 import numpy as np
@@ -232,6 +233,12 @@ class CryspyBase(Neutron_type, metaclass=ABCMeta):
     def get_component(self, component_name):
         return self.calculator.get_component(component_name)
 
+    def get_reflections(self, phase_name: str) -> np.ndarray:
+        """
+        Reflection table of a phase from the last calculation.
+        """
+        return self.calculator.get_reflections(phase_name)
+
     def get_phase_components(self, phase_name: str) -> dict:
         """
         Get all the components of a phase as specified by the phase name.
@@ -424,6 +431,14 @@ class POL(Pol_type):
         'down': 'down',
     }
 
+    # channel name -> (coefficient of spin up, coefficient of spin down)
+    CHANNELS = {
+        'sum': (1.0, 1.0),
+        'diff': (1.0, -1.0),
+        'up': (1.0, 0.0),
+        'down': (0.0, 1.0),
+    }
+
     def create(self, model: B) -> List[ItemContainer]:
         r_list = []
         t_ = type(model)
@@ -548,6 +563,75 @@ class POL(Pol_type):
             pol_fn = self.up_plus_down
         return self.calculator.full_calculate(x_array, pol_fn=pol_fn, **kwargs)
 
+    @classmethod
+    def combine_channels(
+        cls,
+        up: np.ndarray,
+        down: np.ndarray,
+        channels: Sequence[Union[str, Callable]],
+        weights: Optional[Sequence[float]] = None,
+        bg: Optional[np.ndarray] = None,
+        out: Optional[np.ndarray] = None,
+    ) -> np.ndarray:
+        """
+        Combine the spin up and down signals into several weighted channels.
+        :param up: Spin UP
+        :param down: Spin DOWN
+        :param channels: channel names (`sum`, `diff`, `up`, `down`) or functions `fn(up, down)`
+        :param weights: weight of each channel, 1 if not given
+        :param bg: background, combined in the same way as the signals
+        :param out: array of shape (n_channels, n_points) to write into
+        :return: array of shape (n_channels, n_points)
+        """
+        if weights is None:
+            weights = [1.0] * len(channels)
+        if len(weights) != len(channels):
+            raise ValueError(f'Expected {len(channels)} channel weights, got {len(weights)}')
+        if out is None:
+            out = np.empty((len(channels),) + np.shape(up))
+        for row, channel, weight in zip(out, channels, weights):
+            if callable(channel):
+                row[...] = channel(up, down)
+                if bg is not None:
+                    row += channel(bg, bg)
+            elif channel in cls.CHANNELS:
+                a, b = cls.CHANNELS[channel]
+                np.multiply(up, a, out=row)
+                if b:
+                    row += b * down
+                if bg is not None and a + b:
+                    row += (a + b) * bg
+            else:
+                raise ValueError(f'Unknown polarization channel: {channel}')
+            if weight != 1.0:
+                row *= weight
+        return out
+
+    def channels_func(
+        self,
+        x_array: np.ndarray,
+        channels: Sequence[Union[str, Callable]] = ('sum', 'diff'),
+        weights: Optional[Sequence[float]] = None,
+        out: Optional[np.ndarray] = None,
+        **kwargs,
+    ) -> np.ndarray:
+        """
+        Calculate several polarization channels from a single calculator pass.
+        :param x_array: points to be calculated at
+        :param channels: channel names (`sum`, `diff`, `up`, `down`) or functions `fn(up, down)`
+        :param weights: weight of each channel, 1 if not given
+        :param out: array of shape (n_channels, n_points) to write into
+        :return: array of shape (n_channels, n_points)
+        """
+        _, results = self.calculator.full_calculate(x_array, pol_fn=self.up_plus_down, **kwargs)
+        phases = results['phases'].values()
+        if phases:
+            up = np.sum([phase['components']['up'] for phase in phases], axis=0)
+            down = np.sum([phase['components']['down'] for phase in phases], axis=0)
+        else:
+            up = down = np.zeros_like(x_array, dtype=float)
+        return self.combine_channels(up, down, channels, weights, bg=results['f_background'], out=out)
+
 
 class UPol(UPol_type):
     def create(self, model: B) -> List[ItemContainer]:
@@ -728,29 +812,54 @@ class CryspyWrapper(WrapperBase):
     def set_experiment_type(self, tof: bool, pol: bool) -> None:
         self.calculator.set_experiment_type(tof, pol)
 
+    def calculate_channels(
+        self,
+        x_array: np.ndarray,
+        channels: Sequence[Union[str, Callable]] = ('sum', 'diff'),
+        weights: Optional[Sequence[float]] = None,
+        out: Optional[np.ndarray] = None,
+        **kwargs,
+    ) -> np.ndarray:
+        """
+        Calculate several polarization channels from a single calculator pass.
+        :param x_array: points to be calculated at
+        :param channels: channel names (`sum`, `diff`, `up`, `down`) or functions `fn(up, down)`
+        :param weights: weight of each channel, 1 if not given
+        :param out: array of shape (n_channels, n_points) to write into
+        :return: array of shape (n_channels, n_points)
+        """
+        if not isinstance(self._internal, POL):
+            raise AttributeError('Polarization channels are only available for polarized experiments')
+        return self._internal.channels_func(x_array, channels, weights, out=out, **kwargs)
+
     def generate_pol_fit_func(
         self,
         x_array: np.ndarray,
         spin_up: np.ndarray,
         spin_down: np.ndarray,
-        components: List[Callable],
+        components: List[Union[str, Callable]],
+        weights: Optional[Sequence[float]] = None,
     ) -> Callable:
+        """
+        Fit function refining several polarization channels at once. The data and the
+        calculated values are interleaved, the channels of each point after each other.
+        :param x_array: points to be calculated at
+        :param spin_up: measured spin UP
+        :param spin_down: measured spin DOWN
+        :param components: channel names (`sum`, `diff`, `up`, `down`) or functions `fn(up, down)`
+        :param weights: weight of each channel, 1 if not given
+        :return: flattened x, flattened measured channels and the fit function
+        """
         num_components = len(components)
-        dummy_x = np.repeat(x_array[..., np.newaxis], num_components, axis=x_array.ndim)
-        calculated_y = np.array([fun(spin_up, spin_down) for fun in components]).swapaxes(0, x_array.ndim)
+        dummy_x = np.repeat(x_array[..., np.newaxis], num_components, axis=x_array.ndim).flatten()
+        calculated_y = np.moveaxis(POL.combine_channels(spin_up, spin_down, components, weights), 0, -1).flatten()
 
         def pol_fit_fuction(dummy_x: np.ndarray, **kwargs) -> np.ndarray:
-            results, results_dict = self.calculator.full_calculate(x_array, pol_fn=components[0], **kwargs)
-            phases = list(results_dict['phases'].keys())[0]
-            up, down = (
-                results_dict['phases'][phases]['components']['up'],
-                results_dict['phases'][phases]['components']['down'],
-            )
-            bg = results_dict['f_background']
-            sim_y = np.array([fun(up, down) + fun(bg, bg) for fun in components]).swapaxes(0, x_array.ndim)
-            return sim_y.flatten()
+            channels = self.calculate_channels(x_array, components, weights, **kwargs)
+            # a new array for every evaluation, callers may keep the previous ones
+            return np.moveaxis(channels, 0, -1).flatten()
 
-        return dummy_x.flatten(), calculated_y.flatten(), pol_fit_fuction
+        return dummy_x, calculated_y, pol_fit_fuction
 
     def get_hkl(
         self,
@@ -774,6 +883,13 @@ class CryspyWrapper(WrapperBase):
         if self._internal is not None:
             return self._internal.get_component(component_name)
 
+    def get_reflections(self, phase_name: str) -> np.ndarray:
+        """
+        Reflection table of a phase from the last calculation.
+        """
+        if self._internal is not None:
+            return self._internal.get_reflections(phase_name)
+
     def get_phase_components(self, phase_name: str) -> dict:
         """
         Get all the components of a phase as specified by the phase name.
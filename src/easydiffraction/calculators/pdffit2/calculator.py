@@ -8,6 +8,7 @@ import numpy as np
 from diffpy.pdffit2 import PdfFit as pdf_calc
 from diffpy.pdffit2 import redirect_stdout
 from diffpy.structure.parsers.p_cif import P_cif as cif_parser
+from diffpy.structure.symmetryutilities import ExpandAsymmetricUnit
 
 # silence the C++ engine output
 redirect_stdout(open(os.path.devnull, 'w'))
@@ -30,7 +31,32 @@ class Pdffit2:
         self.current_crystal = {}
         self.model = None
         self.type = 'N'
-        self.cif_string = ''
+        self._cif_string = ''
+        # lazily regenerated CIF of the phases, set by the wrapper
+        self.cif_cache = None
+        # long-lived engine, see `calculate`
+        self._engine = None
+        self._engine_vars = {}
+        self._structure_key = None
+        # the structure last parsed from the CIF, the topology of the phase it was parsed for,
+        # and its space group, tolerance and multiplicities of the atoms, see `_parse_structure`
+        self._structure = None
+        self._topology = None
+        self._spacegroup = None
+        self._eps = None
+        self._multiplicity = None
+        self._data_key = None
+        self._r_grid = None
+
+    @property
+    def cif_string(self) -> str:
+        if self.cif_cache is None:
+            return self._cif_string
+        return self.cif_cache.cif()
+
+    @cif_string.setter
+    def cif_string(self, value: str):
+        self._cif_string = value
 
     def conditionsSet(self, model):
         self.model = model
@@ -46,11 +72,6 @@ class Pdffit2:
         :param model_name: Name for the model
         :return: points calculated at `x`
         """
-        P = pdf_calc()
-
-        structure = cif_parser().parse(self.cif_string)
-        P.add_structure(structure)
-
         # extract conditions from the model
         qmax = self.model.qmax.raw_value
         qdamp = self.model.qdamp.raw_value
@@ -61,33 +82,157 @@ class Pdffit2:
 
         stype = self.type
 
+        # The engine is rebuilt only when the atoms of the structure or the r-grid change.
+        # Anything else is pushed with `setvar`, and only when its value changed.
+        phase = self.phases[0]
+        structure, atom_vars = self._parse_structure(phase)
+        structure_key = self._structure_signature(structure)
+        data_key = (stype, qmax)
+        if (
+            self._engine is None
+            or structure_key != self._structure_key
+            or data_key != self._data_key
+            or not np.array_equal(x_array, self._r_grid)
+        ):
+            self._load_engine(structure, x_array, stype, qmax, qdamp)
+            self._structure_key = structure_key
+            self._data_key = data_key
+
+        # coordinates, occupancies and Uiso (current limitation to isotropic ADP)
+        for name, value in atom_vars.items():
+            self._setvar(name, value)
+
+        lattice = phase.cell
+        for i, name in enumerate(['length_a', 'length_b', 'length_c', 'angle_alpha', 'angle_beta', 'angle_gamma']):
+            self._setvar('lat({})'.format(i + 1), getattr(lattice, name).raw_value)
+
         # scale
-        scale = self.phases[0].scale.raw_value
-        P.setvar('pscale', scale)
-        P.setvar('delta1', delta1)
-        P.setvar('delta2', delta2)
-        P.setvar('spdiameter', spdiameter)
-
-        # set the Uiso (current limitation to isotropic ADP)
-        for i_atom, atom in enumerate(self.phases[0].atoms):
-            if not hasattr(atom, 'adp'):
-                continue
-            Uiso = atom.adp.Uiso.raw_value
-            for i in range(1, 4):
-                u_str = 'u{}{}({})'.format(i, i, i_atom + 1)
-                P.setvar(u_str, Uiso)
+        self._setvar('pscale', phase.scale.raw_value)
+        self._setvar('delta1', delta1)
+        self._setvar('delta2', delta2)
+        self._setvar('spdiameter', spdiameter)
+        self._setvar('qdamp', qdamp)
+        # qbroad must be set after the data is read
+        self._setvar('qbroad', qbroad)
+
+        self._engine.calc()
+
+        pdf = np.array(self._engine.getpdf_fit())
+
+        return pdf
+
+    def _load_engine(self, structure, x_array: np.ndarray, stype: str, qmax: float, qdamp: float):
+        """
+        (Re)create the engine, load the structure and assign the r-grid.
+        """
+        P = pdf_calc()
+        P.add_structure(structure)
 
         # Errors
         noise_array = np.zeros(len(x_array))
 
-        # P.read_data_string(x_array, stype, qmax, qdamp)
         # Assign the data to the pdf calculator
         P.read_data_lists(stype, qmax, qdamp, list(x_array), list(noise_array))
-        # qbroad must be set after read_data_string
-        P.setvar('qbroad', qbroad)
 
-        P.calc()
+        self._engine = P
+        # the atoms are loaded as they are in the structure
+        self._engine_vars = self._structure_vars(structure)
+        self._r_grid = np.array(x_array, copy=True)
 
-        pdf = np.array(P.getpdf_fit())
+    def _setvar(self, name: str, value: float):
+        if self._engine_vars.get(name) == value:
+            return
+        self._engine.setvar(name, value)
+        self._engine_vars[name] = value
 
-        return pdf
+    def _parse_structure(self, phase) -> tuple:
+        """
+        Atoms of the unit cell and their coordinates, occupancies and Uiso by their engine variable names.
+        The CIF of the phases is parsed only when the topology of the phase changed, or an atom moved on or
+        off a special position. Otherwise the values are read from the phase and expanded with the space
+        group parsed last.
+        """
+        topology = self._phase_topology(phase)
+        if self._structure is None or topology != self._topology:
+            self._parse(topology)
+        expansion = self._expand(phase)
+        if expansion.multiplicity != self._multiplicity:
+            self._parse(topology)
+            expansion = self._expand(phase)
+        return self._structure, self._atom_vars(phase, expansion)
+
+    def _parse(self, topology: tuple):
+        parser = cif_parser()
+        self._structure = parser.parse(self.cif_string)
+        self._spacegroup = parser.spacegroup
+        self._eps = parser.eps
+        self._multiplicity = parser.eau.multiplicity
+        self._topology = topology
+
+    def _expand(self, phase) -> ExpandAsymmetricUnit:
+        """
+        Positions of the atoms of the phase expanded to the unit cell.
+        """
+        corepos = [[atom.fract_x.raw_value, atom.fract_y.raw_value, atom.fract_z.raw_value] for atom in phase.atoms]
+        return ExpandAsymmetricUnit(self._spacegroup, corepos, eps=self._eps)
+
+    @staticmethod
+    def _phase_topology(phase) -> tuple:
+        """
+        The space group and the labels and species of the atoms of the phase.
+        """
+        atoms = tuple((atom.label.raw_value, str(atom.specie)) for atom in phase.atoms)
+        return phase.space_group.space_group_HM_name.raw_value, atoms
+
+    @staticmethod
+    def _structure_signature(structure) -> tuple:
+        """
+        The number and the species of the atoms loaded into the engine.
+        Coordinates, occupancies, lattice parameters, scale and ADPs are set with `setvar`.
+        """
+        return tuple(atom.element for atom in structure)
+
+    @staticmethod
+    def _structure_vars(structure) -> dict:
+        """
+        Coordinates and occupancies of all the atoms of the unit cell, by their engine variable names.
+        """
+        atom_vars = {}
+        for i_atom, atom in enumerate(structure):
+            for name, value in zip(['x', 'y', 'z', 'occ'], [*atom.xyz, atom.occupancy]):
+                atom_vars['{}({})'.format(name, i_atom + 1)] = float(value)
+        return atom_vars
+
+    @staticmethod
+    def _atom_vars(phase, expansion: ExpandAsymmetricUnit) -> dict:
+        """
+        Coordinates, occupancies and Uiso of all the atoms of the unit cell, by their engine variable names,
+        from the atoms of the phase and their positions in the unit cell.
+        """
+        atom_vars = {}
+        i_atom = 0
+        for atom, positions in zip(phase.atoms, expansion.expandedpos):
+            uiso = Pdffit2._uiso(atom)
+            for xyz in positions:
+                i_atom += 1
+                for name, value in zip(['x', 'y', 'z', 'occ'], [*xyz, atom.occupancy.raw_value]):
+                    atom_vars['{}({})'.format(name, i_atom)] = float(value)
+                if uiso is None:
+                    continue
+                for i in range(1, 4):
+                    atom_vars['u{}{}({})'.format(i, i, i_atom)] = uiso
+        return atom_vars
+
+    @staticmethod
+    def _uiso(atom):
+        """
+        Isotropic ADP of the atom as Uiso, or None if it has none.
+        """
+        adp = getattr(atom, 'adp', None)
+        if adp is None:
+            return None
+        if hasattr(adp, 'Uiso'):
+            return adp.Uiso.raw_value
+        if hasattr(adp, 'Biso'):
+            return adp.Biso.raw_value / (8 * np.pi**2)
+        return None
@@ -12,6 +12,7 @@ from easycrystallography.Components.SpaceGroup import SpaceGroup
 from easyscience import global_object as borg
 from easyscience.Objects.Inferface import ItemContainer
 
+from easydiffraction.calculators.cif_cache import PhaseCifCache
 from easydiffraction.calculators.pdffit2.calculator import Pdffit2 as Pdffit2_calc
 from easydiffraction.calculators.wrapper_base import WrapperBase
 from easydiffraction.job.experiment.pd_1d import PDFParameters
@@ -76,6 +77,8 @@ class Pdffit2Wrapper(WrapperBase):
         self.calculator = Pdffit2_calc()
         self._namespace = {}
         self._phase = None
+        self._cif_cache = PhaseCifCache()
+        self.calculator.cif_cache = self._cif_cache
 
     def reset_storage(self):
         """
@@ -140,6 +143,7 @@ class Pdffit2Wrapper(WrapperBase):
 
         elif issubclass(t_, Phases):
             self._phase = model
+            self._cif_cache.phases = model
             self.calculator.phases = model
 
         elif issubclass(t_, Sample):
@@ -181,10 +185,9 @@ class Pdffit2Wrapper(WrapperBase):
             return getattr(getattr(item, 'adp'), item_key).raw_value
         return getattr(item, item_key).raw_value
 
-    def updateCif(self, *args, **kwargs):
-        if self._phase is not None:
-            self.calculator.cif_string = str(self._phase.cif)
-        pass
+    def updateCif(self, key=None, **kwargs):
+        # The CIF text is regenerated by the calculator when it is next read
+        self._cif_cache.invalidate(key)
 
     @staticmethod
     def __identify(obj):
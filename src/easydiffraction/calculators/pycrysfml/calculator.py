@@ -2,8 +2,6 @@
 # SPDX-License-Identifier: BSD-3-Clause
 # © 2021-2024 Contributors to the EasyDiffraction project <https://github.com/EasyScience/EasyDiffraction>
 
-import os
-import re
 from typing import Tuple
 
 import CFML_api
@@ -18,6 +16,8 @@ class Pycrysfml:
         self.background = None
         self.pattern = None
         self.known_phases = {}
+        # phase id -> scratch CIF file, maintained by the wrapper
+        self.phase_cifs = {}
         self.additional_data = {'phases': {}}
         self.storage = {}
 
@@ -98,8 +98,6 @@ class Pycrysfml:
                 reflection_list.compute_structure_factors(space_group, atom_list, job_info)
                 diffraction_pattern = CFML_api.DiffractionPattern(job_info, reflection_list, cell.reciprocal_cell_vol)
             except Exception:
-                for cif in cifs:
-                    os.remove(cif)
                 raise ArithmeticError
 
             item = list(self.known_phases.items())[idx]
@@ -241,8 +239,5 @@ class Pycrysfml:
         return self.storage.get(str(model_name) + '_scale', 1)
 
     def grab_cifs(self):
-        base, file = os.path.split(self.filename)
-        ext = file[-3:]
-        file = file[:-4]
-        files = [base + os.path.sep + f for f in os.listdir(base) if re.match(rf'{file}_[0-9]+.*\.{ext}', f)]
-        return files
+        # Same ordering as `known_phases`, so the phase scales line up with the files
+        return [self.phase_cifs[phase_id] for phase_id in self.known_phases if phase_id in self.phase_cifs]
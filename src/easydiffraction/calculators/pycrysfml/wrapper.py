@@ -2,7 +2,6 @@
 # SPDX-License-Identifier: BSD-3-Clause
 # © 2021-2024 Contributors to the EasyDiffraction project <https://github.com/EasyScience/EasyDiffraction>
 
-import glob
 import os
 
 import numpy as np
@@ -11,6 +10,7 @@ from easycrystallography.Components.SpaceGroup import SpaceGroup
 from easyscience import global_object as borg
 from easyscience.Objects.Inferface import ItemContainer
 
+from easydiffraction.calculators.cif_cache import PhaseCifCache
 from easydiffraction.calculators.pycrysfml.calculator import Pycrysfml
 from easydiffraction.calculators.wrapper_base import WrapperBase
 from easydiffraction.job.experiment.pd_1d import Instrument1DCWParameters
@@ -68,6 +68,9 @@ class PycrysfmlWrapper(WrapperBase):
         self.calculator = Pycrysfml()
         self._phase = None
         self._filename = None
+        self._cif_cache = PhaseCifCache()
+        # phase id -> CIF text last written to the scratch file
+        self._written_cifs = {}
 
     @staticmethod
     def feature_checker(
@@ -118,6 +121,7 @@ class PycrysfmlWrapper(WrapperBase):
             r_list.append(ItemContainer(model_key, keys, self.get_value, self.dump_cif))
         elif issubclass(t_, Phases):
             self._phase = model
+            self._cif_cache.phases = model
         elif issubclass(t_, Phase):
             r_list.append(
                 ItemContainer(
@@ -147,6 +151,7 @@ class PycrysfmlWrapper(WrapperBase):
     def remove_phase(self, phases_obj, phase_obj):
         ident = str(self.__identify(phase_obj))
         self.calculator.remove_phase(ident)
+        self.remove_cif(ident)
 
     def fit_func(self, x_array: np.ndarray) -> np.ndarray:
         """
@@ -156,43 +161,47 @@ class PycrysfmlWrapper(WrapperBase):
         :return: calculated points
         :rtype: np.ndarray
         """
+        self._write_dirty_cifs()
         return self.calculator.calculate(x_array)
 
     def get_hkl(self, x_array: np.ndarray = None, idx=None, phase_name=None, encoded_name=False) -> dict:
+        self._write_dirty_cifs()
         return self.calculator.get_hkl(x_array)
 
-    def dump_cif(self, *args, **kwargs):
-        if self._filename is None:
-            return
-        # delete preexising cif files
-        self.remove_cif()
-        # naive and silly workaround for something mysterious happening in easyCrystallography
-        content = str(self._phase.cif)
-        content = content.replace('H-M_ref', 'H-M_alt')
-        with open(self._filename, 'w') as fid:
-            # fid.write(str(self._phase.cif))
-            fid.write(content)
-        base, file = os.path.split(self._filename)
-        ext = file[-3:]
-        file = file[:-4]
-        for idx, phase in enumerate(self._phase):
-            content = str(phase.cif)
-            content = content.replace('H-M_ref', 'H-M_alt')
-            with open(f'{os.path.join(base, file)}_{idx}.{ext}', 'w') as fid:
-                # fid.write(str(phase.cif))
-                fid.write(content)
-
-    def remove_cif(self):
-        if self._filename is None:
+    def dump_cif(self, key=None, **kwargs):
+        """
+        Mark the phase owning `key` as changed, or all phases if `key` is None.
+        The scratch files are rewritten before the next calculation.
+        """
+        self._cif_cache.invalidate(key)
+
+    def _write_dirty_cifs(self):
+        if self._filename is None or self._phase is None:
             return
         base, file = os.path.split(self._filename)
         ext = file[-3:]
         file = file[:-4]
-        file_wildcarded = os.path.join(base, file) + '_*.' + ext
-        fileList = glob.glob(file_wildcarded)
-        for f in fileList:
+        for phase in self._phase:
+            phase_key = phase.unique_name
+            content = self._cif_cache.phase_cif(phase)
+            if self._written_cifs.get(phase_key) is content:
+                continue
+            # naive and silly workaround for something mysterious happening in easyCrystallography
+            phase_file = f'{os.path.join(base, file)}_{phase_key}.{ext}'
+            with open(phase_file, 'w') as fid:
+                fid.write(content.replace('H-M_ref', 'H-M_alt'))
+            self._written_cifs[phase_key] = content
+            self.calculator.phase_cifs[phase_key] = phase_file
+
+    def remove_cif(self, phase_key=None):
+        phase_keys = list(self.calculator.phase_cifs.keys()) if phase_key is None else [phase_key]
+        for key in phase_keys:
+            self._written_cifs.pop(key, None)
+            phase_file = self.calculator.phase_cifs.pop(key, None)
+            if phase_file is None:
+                continue
             try:
-                os.remove(f)
+                os.remove(phase_file)
             except OSError:
                 pass
 
@@ -219,6 +228,10 @@ class PycrysfmlWrapper(WrapperBase):
     def get_total_y_for_phases(self) -> list:
         return self.calculator.get_total_y_for_phases()
 
+    def is_tof(self) -> bool:
+        # constant wavelength only, see `feature_available`
+        return False
+
     @staticmethod
     def __identify(obj):
         return obj.unique_name
@@ -0,0 +1,71 @@
+# SPDX-FileCopyrightText: 2024 EasyDiffraction contributors
+# SPDX-License-Identifier: BSD-3-Clause
+# © 2021-2024 Contributors to the EasyDiffraction project <https://github.com/EasyScience/EasyDiffraction>
+
+import numpy as np
+
+# columns of a reflection table, one row per reflection
+REFLECTION_DTYPE = np.dtype(
+    [
+        ('h', np.int32),
+        ('k', np.int32),
+        ('l', np.int32),
+        ('position', np.float64),
+        ('d', np.float64),
+        ('f_squared', np.float64),
+        ('multiplicity', np.int32),
+        ('fwhm', np.float64),
+        ('intensity', np.float64),
+    ]
+)
+
+
+def empty_reflections(count: int = 0) -> np.ndarray:
+    """
+    Reflection table of `count` zeroed rows.
+    """
+    return np.zeros(count, dtype=REFLECTION_DTYPE)
+
+
+def peak_widths(x: np.ndarray, shapes: np.ndarray) -> np.ndarray:
+    """
+    Full width at half maximum of every peak shape, one column of `shapes` per reflection,
+    linearly interpolated between the points of `x`. NaN where the shape is empty or does not
+    fall below half of its maximum on both sides within `x`.
+
+    :param x: ascending points the shapes are calculated at
+    :param shapes: peak shapes, of shape (len(x), number of reflections)
+    """
+    x = np.asarray(x, dtype=float)
+    shapes = np.asarray(shapes, dtype=float)
+    n_points, count = shapes.shape
+    if count == 0 or n_points < 3:
+        return np.full(count, np.nan)
+    half = shapes.max(axis=0) / 2
+    above = shapes >= half
+    columns = np.arange(count)
+    first = np.argmax(above, axis=0)
+    last = n_points - 1 - np.argmax(above[::-1], axis=0)
+    resolved = (half > 0) & (first > 0) & (last < n_points - 1)
+    first = np.where(resolved, first, 1)
+    last = np.where(resolved, last, n_points - 2)
+
+    def crossing(below, upper):
+        y_below = shapes[below, columns]
+        y_upper = shapes[upper, columns]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            fraction = (half - y_below) / (y_upper - y_below)
+        return x[below] + fraction * (x[upper] - x[below])
+
+    widths = crossing(last + 1, last) - crossing(first - 1, first)
+    return np.where(resolved, widths, np.nan)
+
+
+def integrate(x: np.ndarray, shapes: np.ndarray) -> np.ndarray:
+    """
+    Trapezoidal integral over `x` of every column of `shapes`.
+    """
+    x = np.asarray(x, dtype=float)
+    shapes = np.asarray(shapes, dtype=float)
+    steps = np.diff(x)[:, np.newaxis]
+    return np.sum(steps * (shapes[1:] + shapes[:-1]), axis=0) / 2
@@ -157,6 +157,12 @@ class WrapperBase(ComponentSerializer, metaclass=ABCMeta):
     def get_calculated_y_for_phase(self, idx=None) -> list:
         pass
 
+    def get_reflections(self, phase_name: str) -> np.ndarray:
+        """
+        Reflection table of a phase from the last calculation, see `REFLECTION_DTYPE`.
+        """
+        raise AttributeError(f'{self.name} does not provide reflection tables')
+
     @abstractmethod
     def get_total_y_for_phases(self) -> list:
         pass
@@ -2,17 +2,151 @@
 # SPDX-License-Identifier: BSD-3-Clause
 # © 2021-2024 Contributors to the EasyDiffraction project <https://github.com/EasyScience/EasyDiffraction>
 
+from contextlib import contextmanager
+from typing import Callable
 from typing import List
 
 from easyscience.Objects.Inferface import InterfaceFactoryTemplate
+from easyscience.Objects.Inferface import ItemContainer
 
+from easydiffraction.calculators import CALCULATORS
+from easydiffraction.calculators import installed_calculators
+from easydiffraction.calculators import load_calculator
 from easydiffraction.calculators.wrapper_base import WrapperBase
 
 
+class _CoalescedUpdates:
+    """
+    Calculator updates issued while a batch is open. They are replayed once per
+    linked object, with the merged keyword arguments, when flushed.
+    """
+
+    def __init__(self):
+        self.depth = 0
+        # (setter, link_name) -> {inner_key: value}
+        self._pending = {}
+
+    def wrap(self, item: ItemContainer) -> ItemContainer:
+        setter_fn = item.setter_fn
+        getter_fn = item.getter_fn
+
+        def setter(link_name, **kwargs):
+            if self.depth == 0:
+                return setter_fn(link_name, **kwargs)
+            self._pending.setdefault((setter_fn, link_name), {}).update(kwargs)
+
+        def getter(link_name, inner_key):
+            # values not yet pushed to the calculator take precedence
+            pending = self._pending.get((setter_fn, link_name), {})
+            if inner_key in pending:
+                return pending[inner_key]
+            return getter_fn(link_name, inner_key)
+
+        return ItemContainer(item.link_name, item.name_conversion, getter, setter)
+
+    def flush(self):
+        pending, self._pending = self._pending, {}
+        for (setter_fn, link_name), kwargs in pending.items():
+            setter_fn(link_name, **kwargs)
+
+
 class WrapperFactory(InterfaceFactoryTemplate):
     def __init__(self, *args, **kwargs):
+        self._updates = _CoalescedUpdates()
         super(WrapperFactory, self).__init__(WrapperBase._interfaces, *args, **kwargs)
 
+    def _registered(self, name: str):
+        for interface in self._interfaces:
+            if self.return_name(interface) == name:
+                return interface
+        return None
+
+    def _load(self, name: str):
+        """
+        Return the wrapper class of calculator `name`, importing it on first use.
+        """
+        interface = self._registered(name)
+        if interface is None and load_calculator(name):
+            interface = self._registered(name)
+        return interface
+
+    @property
+    def available_interfaces(self) -> List[str]:
+        """
+        Names of all calculators which can be used, whether already imported or not.
+        The imported ones come first, in the order of `_interfaces`, as the base class expects.
+        """
+        names = [self.return_name(interface) for interface in self._interfaces]
+        names += [name for name in installed_calculators() if name not in names]
+        return names
+
+    def create(self, *args, **kwargs):
+        interface_name = kwargs.pop('interface_name', None)
+        if interface_name is None:
+            # Fallback name, the first installed calculator
+            available = installed_calculators() or self.available_interfaces
+            if len(available) == 0:
+                raise NotImplementedError
+            interface_name = available[0]
+        if self._load(interface_name) is not None:
+            kwargs['interface_name'] = interface_name
+        super(WrapperFactory, self).create(*args, **kwargs)
+
+    def switch(self, new_interface: str, fitter=None):
+        self._updates.flush()
+        if self._load(new_interface) is None:
+            raise AttributeError('The user supplied interface is not valid.')
+        super(WrapperFactory, self).switch(new_interface, fitter=fitter)
+
+    @contextmanager
+    def batch_update(self):
+        """
+        Defer calculator updates from parameter changes until the outermost batch exits
+        (or the calculator is next used), then push a single update per linked object.
+        """
+        self._updates.depth += 1
+        try:
+            yield self
+        finally:
+            self._updates.depth -= 1
+            if self._updates.depth == 0:
+                self._updates.flush()
+
+    def flush_updates(self) -> None:
+        """
+        Push all deferred parameter changes to the calculator.
+        """
+        self._updates.flush()
+
+    @property
+    def fit_func(self) -> Callable:
+        fit_func = super(WrapperFactory, self).fit_func
+
+        def __fit_func(*args, **kwargs):
+            self._updates.flush()
+            return fit_func(*args, **kwargs)
+
+        return __fit_func
+
+    def generate_bindings(self, model, *args, ifun=None, **kwargs):
+        """
+        Bind the parameters of `model` to the current calculator.
+        Same as the base implementation, with the setters routed through `batch_update`.
+        """
+        interface = self()
+        create = interface.create
+        # the links made by the calculator are wrapped before the base binds them
+        interface.create = lambda obj: [self._updates.wrap(item) for item in create(obj)]
+        try:
+            super(WrapperFactory, self).generate_bindings(model, *args, ifun=ifun, **kwargs)
+        finally:
+            del interface.create
+
+    def __call__(self, *args, **kwargs):
+        # the calculator is about to be used, bring it up to date
+        self._updates.flush()
+        return super(WrapperFactory, self).__call__(*args, **kwargs)
+
     def get_hkl(self, x_array=None, idx=None, phase_name=None, encoded_name=False) -> dict:
         return self().get_hkl(x_array, idx=idx, phase_name=phase_name, encoded_name=encoded_name)
 
@@ -28,6 +162,9 @@ class WrapperFactory(InterfaceFactoryTemplate):
     def get_component(self, component_name):
         return self().get_component(component_name)
 
+    def get_reflections(self, phase_name):
+        return self().get_reflections(phase_name)
+
     def is_tof(self) -> bool:
         return self().is_tof()
 
@@ -46,11 +183,16 @@ class WrapperFactory(InterfaceFactoryTemplate):
     def calculate_profile(self) -> dict:
         return self().calculate_profile()
 
+    def calculate_channels(self, x_array, channels=('sum', 'diff'), weights=None, out=None, **kwargs):
+        return self().calculate_channels(x_array, channels, weights, out=out, **kwargs)
+
     def data(self):
         return self().data()
 
     def interface_compatability(self, check_str: str) -> List[str]:
         compatible_interfaces = []
+        for name in CALCULATORS:
+            self._load(name)
         for interface in self._interfaces:
             if interface.feature_checker(test_str=check_str):
                 compatible_interfaces.append(self.return_name(interface))
@@ -0,0 +1,174 @@
+# SPDX-FileCopyrightText: 2024 EasyDiffraction contributors
+# SPDX-License-Identifier: BSD-3-Clause
+# © 2021-2024 Contributors to the EasyDiffraction project <https://github.com/EasyScience/EasyDiffraction>
+
+import importlib.util
+from typing import Iterable
+from typing import Optional
+from typing import Tuple
+
+import numpy as np
+
+# events read and histogrammed at once
+CHUNK_SIZE = 1_000_000
+
+
+class EventHistogram:
+    """
+    Neutron events histogrammed on a fine time-of-flight grid, from which patterns of any
+    coarser binning, in time-of-flight or d-spacing, are made without reading the events again.
+
+    Events are read in chunks of `chunk_size`, so the memory needed does not grow with the
+    number of events. Event weights (e.g. from a normalization) are summed, together with their
+    squares for the Poisson uncertainties. A pattern bin holds the fine bins whose centres fall
+    inside it, so its edges are accurate to the fine `resolution`.
+    """
+
+    def __init__(self, tof_min: float, tof_max: float, resolution: float = 1.0, chunk_size: int = CHUNK_SIZE):
+        """
+        :param tof_min: lowest time-of-flight kept
+        :param tof_max: highest time-of-flight kept
+        :param resolution: width of the fine time-of-flight bins
+        :param chunk_size: number of events read at once
+        """
+        if tof_max <= tof_min or resolution <= 0:
+            raise ValueError('The time-of-flight range and resolution must be positive')
+        self.tof_min = tof_min
+        self.resolution = resolution
+        self.chunk_size = chunk_size
+        bins = int(np.ceil((tof_max - tof_min) / resolution))
+        self.tof_max = tof_min + bins * resolution
+        self.counts = np.zeros(bins)
+        self.variances = np.zeros(bins)
+        # number of events read, including those outside the range or of other detectors
+        self.events = 0
+
+    @property
+    def centers(self) -> np.ndarray:
+        """
+        Centres of the fine time-of-flight bins.
+        """
+        return self.tof_min + (np.arange(len(self.counts)) + 0.5) * self.resolution
+
+    def add_events(self, tof, detector_id=None, weights=None, detectors: Optional[Iterable[int]] = None) -> None:
+        """
+        Add events from arrays, or anything sliceable like them, e.g. memory-mapped files.
+
+        :param tof: time-of-flight of every event
+        :param detector_id: detector of every event
+        :param weights: weight of every event, by default one
+        :param detectors: detectors whose events are kept, by default all
+        """
+        if detectors is not None:
+            if detector_id is None:
+                raise ValueError('Selecting detectors needs the detector of every event')
+            detectors = np.unique(np.asarray(list(detectors)))
+        for start in range(0, len(tof), self.chunk_size):
+            chunk = slice(start, start + self.chunk_size)
+            ids = None if detector_id is None else np.asarray(detector_id[chunk])
+            chunk_weights = None if weights is None else np.asarray(weights[chunk], dtype=float)
+            self._accumulate(np.asarray(tof[chunk], dtype=float), ids, chunk_weights, detectors)
+
+    def add_npy(self, tof: str, detector_id: Optional[str] = None, weights: Optional[str] = None, **kwargs) -> None:
+        """
+        Add events from `.npy` files, one per event array, see `add_events`.
+        """
+        arrays = [None if path is None else np.load(str(path), mmap_mode='r') for path in (tof, detector_id, weights)]
+        self.add_events(*arrays, **kwargs)
+
+    def add_hdf5(
+        self, file_url: str, tof: str, detector_id: Optional[str] = None, weights: Optional[str] = None, **kwargs
+    ) -> None:
+        """
+        Add events from datasets of an HDF5 file, given by their paths in the file, see `add_events`.
+        """
+        if importlib.util.find_spec('h5py') is None:
+            raise ImportError('Reading HDF5 files needs h5py')
+        import h5py
+
+        with h5py.File(str(file_url), 'r') as f:
+            arrays = [None if name is None else f[name] for name in (tof, detector_id, weights)]
+            self.add_events(*arrays, **kwargs)
+
+    def _accumulate(self, tof: np.ndarray, ids, weights, detectors) -> None:
+        self.events += len(tof)
+        index = np.floor((tof - self.tof_min) / self.resolution).astype(np.int64)
+        keep = (index >= 0) & (index < len(self.counts))
+        if detectors is not None:
+            keep &= np.isin(ids, detectors)
+        index = index[keep]
+        if weights is None:
+            counts = np.bincount(index, minlength=len(self.counts))
+            self.counts += counts
+            self.variances += counts
+            return
+        weights = weights[keep]
+        self.counts += np.bincount(index, weights=weights, minlength=len(self.counts))
+        self.variances += np.bincount(index, weights=weights**2, minlength=len(self.counts))
+
+    def histogram(
+        self,
+        width: Optional[float] = None,
+        edges: Optional[np.ndarray] = None,
+        relative: bool = False,
+        x_min: Optional[float] = None,
+        x_max: Optional[float] = None,
+        d_spacing: bool = False,
+        dtt1: Optional[float] = None,
+        dtt2: float = 0.0,
+        zero: float = 0.0,
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Pattern of the events on the time-of-flight axis, binned by `edges`, or by bins of
+        `width` between `x_min` and `x_max`. With `d_spacing` the binning is given in d-spacing
+        and converted with `tof = zero + dtt1 * d + dtt2 * d**2`.
+
+        :param width: bin width, relative to the bin position with `relative`
+        :param edges: bin edges, instead of `width`
+        :param relative: bins of constant `width * x`, as usual for time-of-flight
+        :param x_min: start of the binning, by default the start of the events
+        :param x_max: end of the binning, by default the end of the events
+        :param d_spacing: the binning is given in d-spacing
+        :param dtt1: linear time-of-flight to d-spacing conversion factor, needed with `d_spacing`
+        :param dtt2: quadratic conversion factor
+        :param zero: time-of-flight offset
+        :return: bin centres in time-of-flight, intensities and their uncertainties. Empty bins
+            have the uncertainty of one count.
+        """
+        if d_spacing and not dtt1:
+            raise ValueError('Binning in d-spacing needs the dtt1 conversion factor')
+
+        def to_tof(d):
+            return zero + dtt1 * d + dtt2 * d**2
+
+        def to_d(tof):
+            if not dtt2:
+                return (tof - zero) / dtt1
+            return (-dtt1 + np.sqrt(dtt1**2 + 4 * dtt2 * (tof - zero))) / (2 * dtt2)
+
+        if edges is None:
+            if width is None or width <= 0:
+                raise ValueError('Either the bin edges or a positive bin width are needed')
+            if x_min is None:
+                x_min = to_d(self.tof_min) if d_spacing else self.tof_min
+            if x_max is None:
+                x_max = to_d(self.tof_max) if d_spacing else self.tof_max
+            if relative:
+                if x_min <= 0:
+                    raise ValueError('Relative binning needs a positive start')
+                edges = x_min * (1 + width) ** np.arange(int(np.log(x_max / x_min) / np.log1p(width)) + 1)
+            else:
+                edges = x_min + width * np.arange(int((x_max - x_min) / width) + 1)
+        edges = np.asarray(edges, dtype=float)
+        if d_spacing:
+            edges = to_tof(edges)
+        if len(edges) < 2 or np.any(np.diff(edges) <= 0):
+            raise ValueError('Bin edges must be increasing')
+
+        # pattern bin of every fine bin, with the fine bins outside the pattern at the ends
+        index = np.searchsorted(edges, self.centers, side='right')
+        y = np.bincount(index, weights=self.counts, minlength=len(edges) + 1)[1:-1]
+        variances = np.bincount(index, weights=self.variances, minlength=len(edges) + 1)[1:-1]
+        x = (edges[1:] + edges[:-1]) / 2
+        e = np.where(variances > 0, np.sqrt(variances), 1.0)
+        return x, y, e
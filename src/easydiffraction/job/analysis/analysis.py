@@ -2,15 +2,34 @@
 # SPDX-License-Identifier: BSD-3-Clause
 # © 2021-2024 Contributors to the EasyDiffraction project <https://github.com/EasyScience/EasyDiffraction>
 
+from contextlib import contextmanager
+from typing import List
+from typing import Optional
 from typing import Union
 
 import numpy as np
 from easyscience.Datasets.xarray import xr  # type: ignore
 from easyscience.fitting.fitter import Fitter as CoreFitter
 from easyscience.fitting.minimizers.factory import AvailableMinimizers
+from easyscience.fitting.minimizers.utils import FitResults
 from easyscience.Objects.job.analysis import AnalysisBase as coreAnalysis
 
 from easydiffraction.calculators.wrapper_factory import WrapperFactory
+from easydiffraction.job.analysis.bootstrap import bootstrap
+from easydiffraction.job.analysis.budget import PartialFitResults
+from easydiffraction.job.analysis.fit_problem import FitProblem
+from easydiffraction.job.analysis.global_search import global_search
+from easydiffraction.job.analysis.jacobian import GroupedJacobian
+from easydiffraction.job.analysis.jacobian import LMFitJacobian
+from easydiffraction.job.analysis.multiresolution import coarse_levels
+from easydiffraction.job.analysis.multiresolution import coarse_to_fine
+from easydiffraction.job.analysis.parallel import ParallelEvaluator
+from easydiffraction.job.analysis.parallel import resolve_workers
+
+# methods of LMFit with a Jacobian hook
+JACOBIAN_METHODS = ['leastsq', 'least_squares']
+# Jacobians `Analysis.fit` makes by name
+JACOBIANS = ['grouped', '2-point']
 
 
 class Analysis(coreAnalysis):
@@ -36,7 +55,12 @@ class Analysis(coreAnalysis):
     def calculate_profile(self, x: Union[xr.DataArray, np.ndarray] = None, coord=None, **kwargs) -> np.ndarray:
         """
         Calculate the profile based on current phase.
+        Without `coord` the calculator is called directly and a plain `np.ndarray` is returned.
         """
+        if coord is None:
+            if isinstance(x, xr.DataArray):
+                x = x.values
+            return self.interface.fit_func(np.asarray(x), **kwargs)
         x_store, f = coord.EasyScience.fit_prep(
             self.interface.fit_func,
             bdims=xr.broadcast(coord.transpose()),
@@ -53,7 +77,48 @@ class Analysis(coreAnalysis):
     ):
         """
         Fit the profile based on current phase and experiment.
+
+        With `jacobian` the Jacobian of the profile is passed to the Jacobian hook of the current
+        minimizer, which only the least-squares methods of LMFit have: `'grouped'` uses
+        `GroupedJacobian`, which exploits the phase and background structure of the job, `'2-point'`
+        differences every column separately, and a callable is called with the values of the free
+        parameters and returns the Jacobian of the calculated profile over them.
+        With `workers` the finite-difference evaluations of the Jacobian are spread over that
+        many worker processes (one per CPU for 0); `jacobian` then defaults to '2-point'.
+        With `coarse_to_fine` the pattern is first fitted at lower resolution, rebinned by each
+        of the given factors (or by default ones for True) and with `coarse_tolerance`, see
+        `multiresolution.coarse_to_fine`.
+        With `checkpoint`, a `FitCheckpoint`, the progress of the fit is recorded while it runs.
+        With `progress`, a `FitProgress`, every evaluation of the fit is reported as it runs.
+        With `budget`, a `FitBudget`, the fit stops once it is out of evaluations or time, or is
+        cancelled. It then returns `PartialFitResults` and the free parameters are set to the
+        best values found.
+        With `tolerance` and `max_evaluations` the minimizer is run with these instead of the
+        settings of the fitter.
         """
+        levels = kwargs.pop('coarse_to_fine', None)
+        if levels:
+            if isinstance(x, xr.DataArray):
+                x = x.values
+            if isinstance(y, xr.DataArray):
+                y = y.values
+            if isinstance(e, xr.DataArray):
+                e = e.values
+            if levels is True:
+                levels = coarse_levels(len(x))
+            # the free parameters are those of the objects passed in
+            self._kwargs = dict(kwargs)
+            return coarse_to_fine(self.fit, self.get_fit_parameters, x, y, e, levels, self._fitter, **kwargs)
+        jacobian = kwargs.pop('jacobian', None)
+        checkpoint = kwargs.pop('checkpoint', None)
+        progress = kwargs.pop('progress', None)
+        budget = kwargs.pop('budget', None)
+        workers = resolve_workers(kwargs.pop('workers', None))
+        settings = {key: kwargs.pop(key) for key in ('tolerance', 'max_evaluations') if key in kwargs}
+        if workers and jacobian is None:
+            jacobian = '2-point'
+        if jacobian is not None:
+            self._check_jacobian(jacobian, workers, kwargs.get('method'))
         # cursory checks
         if x is None or y is None or e is None:
             return None
@@ -74,13 +139,202 @@ class Analysis(coreAnalysis):
                 x = x.values
             if isinstance(y, xr.DataArray):
                 y = y.values
-            res = self._fitter.fit(x, y, **kwargs)
+            if progress is not None:
+                progress.begin(y, weights)
+            if budget is not None:
+                budget.begin(y, weights)
+                p0 = [parameter.raw_value for parameter in budget.parameters]
+            # parameter changes made by the minimizer are pushed to the calculator
+            # once per evaluation, just before the profile is calculated
+            with self.interface.batch_update(), self._settings(**settings), self._recorded(checkpoint, progress, budget):
+                if jacobian is None:
+                    res = self._fitter.fit(x, y, **kwargs)
+                else:
+                    res = self._jacobian_fit(x, y, jacobian, workers, monitors=(checkpoint, progress, budget), **kwargs)
 
         except Exception as ex:
+            # the minimizer may wrap the exception stopping the fit in its own
+            if budget is not None and budget.reason:
+                return self._stopped(x, budget, p0)
             print(f'Error in fitting: {ex}')
             return None
+        finally:
+            if checkpoint is not None:
+                checkpoint.write()
         return res
 
+    def _stopped(self, x, budget, p0) -> PartialFitResults:
+        """
+        Partial results of a fit stopped by its budget, with the free parameters set to the best values found.
+        """
+        print(f'Warning: fit stopped ({budget.reason}) after {budget.evaluations} evaluations')
+        if isinstance(x, xr.DataArray):
+            x = x.values
+        with self.interface.batch_update():
+            for parameter, value in zip(budget.parameters, budget.best):
+                parameter.value = float(value)
+            for constraint in self._fitter.fit_constraints():
+                constraint()
+        return budget.result(x, p0)
+
+    @contextmanager
+    def _settings(self, **settings):
+        """
+        Set the given settings of the fitter, e.g. `tolerance`, while the block runs.
+        """
+        saved = {key: getattr(self._fitter, key) for key in settings}
+        for key, value in settings.items():
+            setattr(self._fitter, key, value)
+        try:
+            yield
+        finally:
+            for key, value in saved.items():
+                setattr(self._fitter, key, value)
+
+    @contextmanager
+    def _recorded(self, *monitors):
+        """
+        Pass the evaluations of the fitter through the given monitors, e.g. a `FitCheckpoint`,
+        a `FitProgress` or a `FitBudget`, skipping None. The last one wraps the others.
+        """
+        monitors = [monitor for monitor in monitors if monitor is not None]
+        if not monitors:
+            yield
+            return
+        fit_function = self._fitter.fit_function
+        constraints = self._fitter.fit_constraints()
+        wrapped = fit_function
+        for monitor in monitors:
+            wrapped = monitor.wrap(wrapped)
+        # a new fit function comes with a new minimizer, which needs the constraints again
+        self._fitter.fit_function = wrapped
+        for constraint in constraints:
+            self._fitter.add_fit_constraint(constraint)
+        try:
+            yield
+        finally:
+            self._fitter.fit_function = fit_function
+            for constraint in constraints:
+                self._fitter.add_fit_constraint(constraint)
+
+    def _check_jacobian(self, jacobian, workers: int, method: Optional[str] = None) -> None:
+        """
+        Raise `ValueError` unless the current minimizer takes a Jacobian and `jacobian` is one it can take.
+        """
+        minimizer = self._fitter._enum_current_minimizer
+        if minimizer.package != 'lm' or (method or minimizer.method) not in JACOBIAN_METHODS:
+            option = f'workers={workers}' if workers else f'jacobian={jacobian!r}'
+            raise ValueError(
+                f'{option} needs a minimizer with a Jacobian hook, one of the least-squares methods of LMFit, '
+                f'not {self.current_minimizer}'
+            )
+        if not callable(jacobian) and jacobian not in JACOBIANS:
+            raise ValueError(f'Unknown jacobian: {jacobian!r}, use a callable or one of {JACOBIANS}')
+        if workers and callable(jacobian):
+            raise ValueError(f'workers={workers} only evaluate the Jacobians made by name, one of {JACOBIANS}')
+
+    def _jacobian_fit(self, x: np.ndarray, y: np.ndarray, jacobian, workers: int = 0, monitors=(), **kwargs):
+        """
+        Fit with the current minimizer, whose Jacobian hook is given `jacobian`.
+        """
+        # the minimizer weights the Jacobian of the profile, see `LMFitJacobian`
+        problem = FitProblem(self, self.interface, x, y, np.ones(len(y)), constraints=self._fitter.fit_constraints())
+        # the evaluations for the Jacobian count as those of the minimizer
+        for monitor in monitors:
+            if monitor is not None:
+                problem.fit_func = monitor.wrap(problem.fit_func)
+        if jacobian == 'grouped':
+            jacobian = GroupedJacobian(problem, self._kwargs.get('_phases'), self._kwargs.get('_pattern'), sparse=False)
+        elif jacobian == '2-point':
+            # without the job structure every column is differenced separately
+            jacobian = GroupedJacobian(problem, sparse=False)
+        minimizer_kwargs = dict(kwargs.pop('minimizer_kwargs', None) or {})
+        minimizer_kwargs['Dfun'] = LMFitJacobian(problem, jacobian)
+        if not workers:
+            return self._fitter.fit(x, y, minimizer_kwargs=minimizer_kwargs, **kwargs)
+        with ParallelEvaluator(problem, workers) as evaluator:
+            jacobian.evaluator = evaluator
+            return self._fitter.fit(x, y, minimizer_kwargs=minimizer_kwargs, **kwargs)
+
+    def global_search(
+        self,
+        x: Union[xr.DataArray, np.ndarray],
+        y: Union[xr.DataArray, np.ndarray],
+        e: Union[xr.DataArray, np.ndarray],
+        method: str = 'multistart',
+        starts: int = 20,
+        workers: Optional[int] = None,
+        seed: Optional[int] = None,
+        jacobian=None,
+        **kwargs,
+    ) -> List[FitResults]:
+        """
+        Search the parameter space within the bounds of the free parameters for the lowest minima,
+        with multi-start local refinements or differential evolution followed by refinements.
+        The refinements are fits with the current minimizer, see `fit`.
+        See `easydiffraction.job.analysis.global_search.global_search`.
+
+        :return: fit results of the distinct minima found, the lowest chi-square first
+        """
+        with self.interface.batch_update():
+            problem, options = self._problem(x, y, e, kwargs)
+            return global_search(
+                problem, method, starts, workers=resolve_workers(workers), seed=seed, jacobian=jacobian, **options
+            )
+
+    def bootstrap(
+        self,
+        x: Union[xr.DataArray, np.ndarray],
+        y: Union[xr.DataArray, np.ndarray],
+        e: Union[xr.DataArray, np.ndarray],
+        samples: int = 100,
+        method: str = 'monte_carlo',
+        workers: Optional[int] = None,
+        jacobian=None,
+        **kwargs,
+    ) -> dict:
+        """
+        Distributions of the free parameters from refits to `samples` resampled datasets, starting
+        from the current (converged) values. The refits are fits with the current minimizer, see
+        `fit`. See `easydiffraction.job.analysis.bootstrap.bootstrap`.
+        """
+        with self.interface.batch_update():
+            problem, options = self._problem(x, y, e, kwargs)
+            return bootstrap(problem, samples, method, workers=resolve_workers(workers), jacobian=jacobian, **options)
+
+    def fit_problem(
+        self,
+        x: Union[xr.DataArray, np.ndarray],
+        y: Union[xr.DataArray, np.ndarray],
+        e: Union[xr.DataArray, np.ndarray],
+        **kwargs,
+    ) -> FitProblem:
+        """
+        Weighted least-squares problem of the free parameters and the data, e.g. for other minimizers.
+
+        :param kwargs: job kwargs, e.g. `_phases` and `_pattern`
+        """
+        if isinstance(x, xr.DataArray):
+            x = x.values
+        if isinstance(y, xr.DataArray):
+            y = y.values
+        if isinstance(e, xr.DataArray):
+            e = e.values
+        if len(x) != len(y) or len(x) != len(e):
+            raise ValueError('x, y and e must have the same length')
+        self._kwargs = dict(kwargs)
+        self._kwargs['weights'] = 1 / e
+        self.interface._InterfaceFactoryTemplate__interface_obj.saved_kwargs = self._kwargs
+        return FitProblem(self, self.interface, x, y, 1 / e, constraints=self._fitter.fit_constraints(), fit_kwargs=kwargs)
+
+    def _problem(self, x, y, e, kwargs: dict):
+        """
+        Fit problem of the data with the job kwargs in `kwargs`, and the other options in `kwargs`.
+        """
+        job_kwargs = {key: value for key, value in kwargs.items() if key.startswith('_')}
+        options = {key: value for key, value in kwargs.items() if not key.startswith('_')}
+        return self.fit_problem(x, y, e, **job_kwargs), options
+
     @property
     def available_minimizers(self) -> list:
         """
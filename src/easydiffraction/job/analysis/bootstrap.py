@@ -0,0 +1,148 @@
+# SPDX-FileCopyrightText: 2024 EasyDiffraction contributors
+# SPDX-License-Identifier: BSD-3-Clause
+# © 2021-2024 Contributors to the EasyDiffraction project <https://github.com/EasyScience/EasyDiffraction>
+
+from typing import Optional
+from typing import Tuple
+
+import numpy as np
+
+from easydiffraction.job.analysis.fit_problem import FitProblem
+from easydiffraction.job.analysis.fit_problem import undo_stack_disabled
+from easydiffraction.job.analysis.parallel import ParallelEvaluator
+from easydiffraction.job.analysis.parallel import worker_jacobian
+from easydiffraction.job.analysis.parallel import worker_problem
+
+METHODS = ['monte_carlo', 'residuals']
+# percentiles of the parameter distributions in the summary
+PERCENTILES = (2.5, 15.87, 50.0, 84.13, 97.5)
+
+
+def _refit(task) -> Tuple[np.ndarray, float, bool]:
+    """
+    Refit the worker problem to the dataset in `task` from the converged point, a fit with its minimizer.
+    """
+    y, options = task
+    problem = worker_problem()
+    jacobian = worker_jacobian()
+    if jacobian is not None:
+        options = dict(options, jacobian=jacobian)
+    y_problem = problem.y
+    problem.y = y
+    try:
+        result = problem.fit(problem.p0, **options)
+        p = np.array([parameter.raw_value for parameter in problem.parameters], dtype=float)
+        chi2 = float(np.sum(problem.residuals(p) ** 2))
+    finally:
+        problem.y = y_problem
+    return p, chi2, result is not None and bool(result.success)
+
+
+def _datasets(problem: FitProblem, y_calc: np.ndarray, method: str, count: int, rng: np.random.Generator):
+    """
+    `count` synthetic datasets: the measured values with added noise of their uncertainties
+    (`'monte_carlo'`), or the converged profile with resampled normalized residuals (`'residuals'`).
+    """
+    sigma = 1 / problem.weights
+    if method == 'monte_carlo':
+        return [problem.y + sigma * rng.standard_normal(len(sigma)) for _ in range(count)]
+    residuals = (problem.y - y_calc) * problem.weights
+    return [y_calc + sigma * rng.choice(residuals, len(residuals)) for _ in range(count)]
+
+
+def bootstrap(
+    problem: FitProblem,
+    samples: int = 100,
+    method: str = 'monte_carlo',
+    workers: int = 0,
+    seed: Optional[int] = None,
+    jacobian=None,
+    tolerance: Optional[float] = None,
+    max_evaluations: Optional[int] = None,
+    output: Optional[str] = None,
+    chunk_size: Optional[int] = None,
+) -> dict:
+    """
+    Distributions of the free parameters from refits of the problem to resampled datasets.
+
+    The current parameter values are taken as the converged solution: every refit starts from
+    them. The refits are fits with the minimizer of the fit object of the problem, see
+    `FitProblem.fit`. Datasets are generated and refitted in chunks, and with `output` the refitted values
+    of each chunk are appended to a CSV file as soon as they are known, with one row per
+    dataset and one column per parameter, followed by the chi-square and the success flag.
+
+    :param problem: fit problem at the converged solution
+    :param samples: number of resampled datasets
+    :param method: one of `METHODS`
+    :param workers: number of worker processes, none to refit in this process
+    :param seed: seed of the resampling
+    :param jacobian: Jacobian of the refits, see `Analysis.fit`, by default that of the minimizer
+    :param tolerance: tolerance of the minimizer in the refits, by default that of the fitter
+    :param max_evaluations: maximum number of function evaluations of each refit
+    :param output: path of the CSV file the refitted values are written to
+    :param chunk_size: number of datasets generated at once, by default 4 per worker
+    :return: dictionary with the parameter `names`, the refitted `values`, their `chi2` and
+        `success`, and the `mean`, `std`, `percentiles` and `correlation` of the successful refits
+    """
+    if method not in METHODS:
+        raise ValueError(f'Unknown resampling method: {method}, use one of {METHODS}')
+    if samples < 2:
+        raise ValueError('At least two samples are needed')
+    options = {}
+    if tolerance is not None:
+        options['tolerance'] = tolerance
+    if max_evaluations is not None:
+        options['max_evaluations'] = max_evaluations
+    chunk_size = chunk_size or 4 * max(workers, 1)
+    rng = np.random.default_rng(seed)
+    names = [parameter.unique_name for parameter in problem.parameters]
+
+    values = np.empty((samples, len(names)))
+    chi2 = np.empty(samples)
+    success = np.zeros(samples, dtype=bool)
+    stream = None
+    # the refits set the errors of the parameters too
+    errors = [parameter.error for parameter in problem.parameters]
+    # the parameters only take intermediate values here, nothing to undo
+    with undo_stack_disabled():
+        try:
+            if output is not None:
+                stream = open(output, 'w')
+                stream.write(','.join(names + ['chi2', 'success']) + '\n')
+            y_calc = problem.evaluate(problem.p0).copy()
+            with ParallelEvaluator(problem, workers, jacobian) as evaluator:
+                for start in range(0, samples, chunk_size):
+                    count = min(chunk_size, samples - start)
+                    tasks = [(y, options) for y in _datasets(problem, y_calc, method, count, rng)]
+                    for k, (x, chi2_k, success_k) in enumerate(evaluator.map(_refit, tasks), start=start):
+                        values[k], chi2[k], success[k] = x, chi2_k, success_k
+                    if stream is not None:
+                        rows = np.column_stack([values[start : start + count], chi2[start : start + count]])
+                        for row, success_k in zip(rows, success[start : start + count]):
+                            stream.write(','.join(repr(float(value)) for value in row) + f',{int(success_k)}\n')
+                        stream.flush()
+        finally:
+            if stream is not None:
+                stream.close()
+            problem.set_vector(problem.p0)
+            for parameter, error in zip(problem.parameters, errors):
+                parameter.error = error
+
+    return summarize(names, values, chi2, success)
+
+
+def summarize(names, values: np.ndarray, chi2: np.ndarray, success: np.ndarray) -> dict:
+    """
+    Summary of refitted parameter values, one row per dataset, over the successful refits.
+    """
+    converged = values[success]
+    summary = {'names': list(names), 'values': values, 'chi2': chi2, 'success': success}
+    if len(converged) < 2:
+        print('Warning: fewer than two refits converged, the parameter distributions are not summarized')
+        return summary
+    summary['mean'] = converged.mean(axis=0)
+    summary['std'] = converged.std(axis=0, ddof=1)
+    summary['percentiles'] = dict(zip(PERCENTILES, np.percentile(converged, PERCENTILES, axis=0)))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        summary['correlation'] = np.atleast_2d(np.corrcoef(converged, rowvar=False))
+    return summary
@@ -0,0 +1,169 @@
+# SPDX-FileCopyrightText: 2024 EasyDiffraction contributors
+# SPDX-License-Identifier: BSD-3-Clause
+# © 2021-2024 Contributors to the EasyDiffraction project <https://github.com/EasyScience/EasyDiffraction>
+
+import os
+import threading
+import time
+from typing import Callable
+from typing import List
+from typing import Optional
+
+import numpy as np
+from easyscience.fitting.minimizers.utils import FitResults
+
+
+class CancellationToken:
+    """
+    Flag which stops a running fit, set from any thread, e.g. by a scheduler or a user interface.
+    The fit stops before its next profile evaluation.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self) -> None:
+        self._event.set()
+
+    def reset(self) -> None:
+        self._event.clear()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+
+class FitStopped(Exception):
+    """
+    Raised in a profile evaluation to stop a fit which is out of budget or cancelled.
+    """
+
+
+class PartialFitResults(FitResults):
+    """
+    Fit results of a stopped fit, at the best parameter values found until then.
+    """
+
+    __slots__ = ['reason', 'evaluations', 'duration']
+
+    def __init__(self):
+        super().__init__()
+        # why the fit stopped: 'max_evaluations', 'max_time' or 'cancelled'
+        self.reason = ''
+        self.evaluations = 0
+        self.duration = 0.0
+
+
+class FitBudget:
+    """
+    Limits of a fit: a number of profile evaluations, a wall time and a cancellation token.
+
+    The limits are checked before every profile evaluation of the fit, so a fit stops within
+    one evaluation of reaching them. The clock starts when the budget is made and the
+    evaluations are counted over all the fits it is given to, e.g. the stages of a
+    coarse-to-fine fit. The best evaluation of the current fit is kept for the partial result.
+    """
+
+    def __init__(
+        self,
+        parameters: List,
+        max_evaluations: Optional[int] = None,
+        max_time: Optional[float] = None,
+        token: Optional[CancellationToken] = None,
+    ):
+        """
+        :param parameters: free parameters of the fit
+        :param max_evaluations: maximum number of profile evaluations
+        :param max_time: maximum wall time in seconds
+        :param token: token cancelling the fit
+        """
+        self.parameters = list(parameters)
+        self.max_evaluations = max_evaluations
+        self.max_time = max_time
+        self.token = token
+        self.evaluations = 0
+        # why the fit stopped, empty while it runs
+        self.reason = ''
+        self._started = time.monotonic()
+        # evaluations of worker processes are not checked
+        self._pid = os.getpid()
+        self.begin(np.zeros(0), np.zeros(0))
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self._started
+
+    def begin(self, y: np.ndarray, weights: np.ndarray) -> None:
+        """
+        Start a fit of `y` with `weights`, from the current parameter values.
+        """
+        self.y = np.asarray(y, dtype=float)
+        self.weights = np.asarray(weights, dtype=float)
+        self.best = np.array([parameter.raw_value for parameter in self.parameters], dtype=float)
+        self.best_chi2 = np.inf
+        self.best_y_calc = None
+
+    def wrap(self, fit_func: Callable) -> Callable:
+        """
+        `fit_func` checking the budget before and recording the profile after every evaluation.
+        """
+
+        def limited(x, *args, **kwargs):
+            self.check()
+            y_calc = fit_func(x, *args, **kwargs)
+            self.record(y_calc)
+            return y_calc
+
+        return limited
+
+    def check(self) -> None:
+        """
+        Raise `FitStopped` if the fit is cancelled or out of budget.
+        """
+        if os.getpid() != self._pid:
+            return
+        if self.token is not None and self.token.cancelled:
+            self.reason = 'cancelled'
+        elif self.max_evaluations is not None and self.evaluations >= self.max_evaluations:
+            self.reason = 'max_evaluations'
+        elif self.max_time is not None and self.elapsed >= self.max_time:
+            self.reason = 'max_time'
+        if self.reason:
+            raise FitStopped(f'Fit stopped: {self.reason}')
+
+    def record(self, y_calc: np.ndarray) -> None:
+        """
+        Record an evaluation of the profile at the current parameter values.
+        """
+        if os.getpid() != self._pid:
+            return
+        self.evaluations += 1
+        y_calc = np.asarray(y_calc, dtype=float)
+        if y_calc.shape != self.y.shape:
+            return
+        chi2 = float(np.sum(((y_calc - self.y) * self.weights) ** 2))
+        if chi2 < self.best_chi2:
+            self.best_chi2 = chi2
+            self.best = np.array([parameter.raw_value for parameter in self.parameters], dtype=float)
+            self.best_y_calc = y_calc.copy()
+
+    def result(self, x: np.ndarray, p0: np.ndarray) -> PartialFitResults:
+        """
+        Partial fit results at the best evaluation of the current fit. The parameters are not changed.
+
+        :param x: points of the fit
+        :param p0: starting values of the free parameters
+        """
+        results = PartialFitResults()
+        results.success = False
+        results.reason = self.reason
+        results.evaluations = self.evaluations
+        results.duration = self.elapsed
+        results.x = np.asarray(x)
+        results.y_obs = self.y
+        # nothing was calculated if the fit stopped before its first evaluation
+        results.y_calc = self.best_y_calc if self.best_y_calc is not None else np.full(self.y.shape, np.nan)
+        results.y_err = 1 / self.weights
+        results.p = {parameter.unique_name: value for parameter, value in zip(self.parameters, self.best)}
+        results.p0 = {parameter.unique_name: value for parameter, value in zip(self.parameters, p0)}
+        return results
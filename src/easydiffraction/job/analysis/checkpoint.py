@@ -0,0 +1,133 @@
+# SPDX-FileCopyrightText: 2024 EasyDiffraction contributors
+# SPDX-License-Identifier: BSD-3-Clause
+# © 2021-2024 Contributors to the EasyDiffraction project <https://github.com/EasyScience/EasyDiffraction>
+
+import os
+import time
+from typing import Callable
+from typing import List
+from typing import Optional
+
+import numpy as np
+
+# seconds between two writes of a checkpoint file
+CHECKPOINT_INTERVAL = 30.0
+
+
+class FitCheckpoint:
+    """
+    Periodic record of the progress of a fit: the free parameters of the best and of the last
+    evaluation, the best chi-square and the number of evaluations.
+
+    Every profile evaluation of the fit is recorded in memory, which costs one chi-square.
+    The record is written to a small `.npz` file at most every `interval` seconds, to a
+    temporary file first which then replaces the checkpoint, so a fit killed while writing
+    leaves the previous checkpoint intact.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        parameters: List,
+        y: np.ndarray,
+        weights: np.ndarray,
+        names: Optional[List[str]] = None,
+        interval: float = CHECKPOINT_INTERVAL,
+        evaluations: int = 0,
+        best_chi2: float = np.inf,
+        engine: str = '',
+    ):
+        """
+        :param path: checkpoint file, `.npz` is appended if missing
+        :param parameters: free parameters of the fit
+        :param y: measured values
+        :param weights: inverse uncertainties of `y`
+        :param names: names the parameters are stored by, by default their unique names
+        :param interval: minimum number of seconds between two writes
+        :param evaluations: evaluations done before, when resuming a fit
+        :param best_chi2: best chi-square before, when resuming a fit
+        :param engine: name of the minimizer, stored for information
+        """
+        path = str(path)
+        self.path = path if path.endswith('.npz') else path + '.npz'
+        self.parameters = list(parameters)
+        self.names = list(names) if names is not None else [parameter.unique_name for parameter in self.parameters]
+        self.y = np.asarray(y, dtype=float)
+        self.weights = np.asarray(weights, dtype=float)
+        self.interval = interval
+        self.evaluations = evaluations
+        self.best_chi2 = best_chi2
+        self.engine = engine
+        self.best = np.array([parameter.raw_value for parameter in self.parameters], dtype=float)
+        self.last = self.best.copy()
+        self._written = time.monotonic()
+        # evaluations of worker processes are not recorded
+        self._pid = os.getpid()
+
+    def wrap(self, fit_func: Callable) -> Callable:
+        """
+        `fit_func` recording every profile it calculates.
+        """
+
+        def recorded(x, *args, **kwargs):
+            y_calc = fit_func(x, *args, **kwargs)
+            self.record(y_calc)
+            return y_calc
+
+        return recorded
+
+    def record(self, y_calc: np.ndarray) -> None:
+        """
+        Record an evaluation of the profile at the current parameter values.
+        """
+        if os.getpid() != self._pid:
+            return
+        self.evaluations += 1
+        self.last = np.array([parameter.raw_value for parameter in self.parameters], dtype=float)
+        y_calc = np.asarray(y_calc, dtype=float)
+        # e.g. the rebinned stages of a coarse-to-fine fit
+        if y_calc.shape == self.y.shape:
+            chi2 = float(np.sum(((y_calc - self.y) * self.weights) ** 2))
+            if chi2 < self.best_chi2:
+                self.best_chi2 = chi2
+                self.best = self.last
+        if time.monotonic() - self._written >= self.interval:
+            self.write()
+
+    def write(self, finished: bool = False) -> None:
+        """
+        Write the checkpoint file.
+        """
+        temporary = self.path + '.tmp.npz'
+        np.savez(
+            temporary,
+            names=np.array(self.names, dtype=str),
+            best=self.best,
+            last=self.last,
+            best_chi2=self.best_chi2,
+            evaluations=self.evaluations,
+            engine=self.engine,
+            finished=finished,
+        )
+        os.replace(temporary, self.path)
+        self._written = time.monotonic()
+
+    @staticmethod
+    def load(path: str) -> dict:
+        """
+        Contents of a checkpoint file: the parameter `names`, their `best` and `last` values,
+        `best_chi2`, `evaluations`, `engine` and whether the fit had `finished`.
+        """
+        path = str(path)
+        if not path.endswith('.npz') and not os.path.exists(path):
+            path += '.npz'
+        with np.load(path) as data:
+            return {
+                'names': [str(name) for name in data['names']],
+                'best': data['best'],
+                'last': data['last'],
+                'best_chi2': float(data['best_chi2']),
+                'evaluations': int(data['evaluations']),
+                'engine': str(data['engine']),
+                'finished': bool(data['finished']),
+            }
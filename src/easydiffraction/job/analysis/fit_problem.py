@@ -0,0 +1,241 @@
+# SPDX-FileCopyrightText: 2024 EasyDiffraction contributors
+# SPDX-License-Identifier: BSD-3-Clause
+# © 2021-2024 Contributors to the EasyDiffraction project <https://github.com/EasyScience/EasyDiffraction>
+
+import threading
+from contextlib import contextmanager
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Union
+
+import numpy as np
+from easyscience import global_object
+from easyscience.fitting.minimizers.utils import FitResults
+from scipy.optimize import least_squares as scipy_least_squares
+
+# guards the undo stack of `easyscience`, which all fits share, see `undo_stack_disabled`
+_STACK_LOCK = threading.RLock()
+# fits running with the stack disabled, and whether it was enabled before the first one
+_stack_users = 0
+_stack_status = False
+
+
+@contextmanager
+def undo_stack_disabled():
+    """
+    Disable the undo stack of `easyscience` while the parameters take intermediate values.
+    Nested and concurrent uses, e.g. fits in several threads, share the disabled stack and
+    the state found by the first one is restored when the last one ends.
+    """
+    global _stack_users, _stack_status
+    with _STACK_LOCK:
+        if _stack_users == 0:
+            _stack_status = global_object.stack.enabled
+            global_object.stack.enabled = False
+        _stack_users += 1
+    try:
+        yield
+    finally:
+        with _STACK_LOCK:
+            _stack_users -= 1
+            if _stack_users == 0:
+                global_object.stack.enabled = _stack_status
+
+
+class FitProblem:
+    """
+    Weighted least-squares problem over the free parameters of a fit object, in vector form.
+
+    A parameter vector is pushed to the calculator in one batched update and the profile is
+    calculated with the fast path of the calculator interface.
+    """
+
+    # reported as `FitResults.minimizer_engine.package`
+    package = 'scipy'
+
+    def __init__(
+        self,
+        fit_object,
+        interface,
+        x: np.ndarray,
+        y: np.ndarray,
+        weights: np.ndarray,
+        constraints=None,
+        fit_kwargs: Optional[dict] = None,
+    ):
+        """
+        :param fit_object: object providing `get_fit_parameters`, and `fit` for `FitProblem.fit`
+        :param interface: calculator interface
+        :param x: points to be calculated at
+        :param y: measured values
+        :param weights: inverse uncertainties of `y`
+        :param constraints: callables applied after every parameter update
+        :param fit_kwargs: kwargs of the fits of `fit_object`, e.g. the job kwargs `_phases` and `_pattern`
+        """
+        self.fit_object = fit_object
+        self.interface = interface
+        # profile calculation, called with the points
+        self.fit_func = interface.fit_func
+        self.x = np.asarray(x)
+        self.y = np.asarray(y, dtype=float)
+        self.weights = np.asarray(weights, dtype=float)
+        self.constraints = list(constraints or [])
+        self.fit_kwargs = dict(fit_kwargs or {})
+        self.parameters = fit_object.get_fit_parameters()
+        self.p0 = np.array([par.raw_value for par in self.parameters], dtype=float)
+        self.lower = np.array([par.min for par in self.parameters], dtype=float)
+        self.upper = np.array([par.max for par in self.parameters], dtype=float)
+        # phases whose individual profiles are kept with every evaluation
+        self.phase_names: List[str] = []
+        # (parameter vector, profile, phase profiles) of the last evaluation
+        self._last = None
+        self.nfev = 0
+
+    def set_vector(self, p: np.ndarray) -> None:
+        """
+        Set the free parameters to the values in `p`, updating the calculator once.
+        """
+        self._last = None
+        with self.interface.batch_update():
+            for parameter, value in zip(self.parameters, p):
+                if parameter.raw_value != value:
+                    parameter.value = float(value)
+            for constraint in self.constraints:
+                constraint()
+
+    def evaluate(self, p: np.ndarray) -> np.ndarray:
+        """
+        Calculated profile for the parameter vector `p`. Repeated calls with the same vector are free.
+        """
+        p = np.asarray(p, dtype=float)
+        if self._last is not None and np.array_equal(self._last[0], p):
+            return self._last[1]
+        self.set_vector(p)
+        profile = np.asarray(self.fit_func(self.x), dtype=float)
+        phases = {}
+        for name in self.phase_names:
+            phases[name] = np.array(self.interface.get_phase_components(name)['profile'], dtype=float)
+        self._last = (p.copy(), profile, phases)
+        self.nfev += 1
+        return profile
+
+    def phase_profiles(self, p: np.ndarray) -> Dict[str, np.ndarray]:
+        """
+        Profiles of the individual phases in `phase_names` for the parameter vector `p`.
+        """
+        self.evaluate(p)
+        return self._last[2]
+
+    def residuals(self, p: np.ndarray) -> np.ndarray:
+        return (self.evaluate(p) - self.y) * self.weights
+
+    def fit(self, p: np.ndarray, **kwargs) -> Optional[FitResults]:
+        """
+        Fit with the minimizer of the fit object, e.g. `Analysis.fit`, as a fit of the job would,
+        starting from the parameter vector `p`. The free parameters are left at the solution.
+
+        :param kwargs: passed to the fit, with `fit_kwargs`
+        :return: fit results of the minimizer, None if the fit failed
+        """
+        self.set_vector(p)
+        return self.fit_object.fit(self.x, self.y, 1 / self.weights, **{**self.fit_kwargs, **kwargs})
+
+    def results(
+        self, p: np.ndarray, jac=None, success: bool = True, engine_result=None, apply: bool = True, errors=None
+    ) -> FitResults:
+        """
+        Set the free parameters to the solution `p`, with uncertainties from the Jacobian of the
+        residuals, or `errors`, and collect the fit results. With `apply` False the parameters
+        are not updated.
+        """
+        p = np.asarray(p, dtype=float)
+        y_calc = self.evaluate(p).copy()
+        errors = self.errors(p, jac) if errors is None else np.asarray(errors, dtype=float)
+
+        if apply:
+            self._apply(p, errors)
+
+        results = FitResults()
+        results.success = success
+        results.x = self.x
+        results.y_obs = self.y
+        results.y_calc = y_calc
+        results.y_err = 1 / self.weights
+        results.p = {par.unique_name: value for par, value in zip(self.parameters, p)}
+        results.p0 = {par.unique_name: value for par, value in zip(self.parameters, self.p0)}
+        results.minimizer_engine = self.__class__
+        results.fit_args = None
+        results.engine_result = engine_result
+        return results
+
+    def _apply(self, p: np.ndarray, errors: np.ndarray) -> None:
+        # the stack is left alone while other fits have it disabled
+        with _STACK_LOCK:
+            stack_status = global_object.stack.enabled
+            if stack_status:
+                # record the whole change from the starting values as a single undo step
+                global_object.stack.enabled = False
+                self.set_vector(self.p0)
+                global_object.stack.enabled = True
+                global_object.stack.beginMacro('Fitting routine')
+            for parameter, value, error in zip(self.parameters, p, errors):
+                parameter.value = float(value)
+                parameter.error = float(error)
+            if stack_status:
+                global_object.stack.endMacro()
+
+    def errors(self, p: np.ndarray, jac=None) -> np.ndarray:
+        """
+        Standard errors of the parameters from the Jacobian of the residuals, scaled by the reduced chi-square.
+        """
+        errors = np.zeros(len(p))
+        if jac is None or not len(p):
+            return errors
+        jac = jac.toarray() if hasattr(jac, 'toarray') else np.asarray(jac)
+        residuals = self.residuals(p)
+        dof = max(len(residuals) - len(p), 1)
+        try:
+            covariance = np.linalg.inv(jac.T @ jac) * np.sum(residuals**2) / dof
+        except np.linalg.LinAlgError:
+            return errors
+        return np.sqrt(np.abs(np.diag(covariance)))
+
+
+def least_squares(
+    problem: FitProblem,
+    jac: Union[str, Callable] = '2-point',
+    tolerance: Optional[float] = None,
+    max_evaluations: Optional[int] = None,
+    **kwargs,
+) -> FitResults:
+    """
+    Solve the fit problem with `scipy.optimize.least_squares`.
+
+    :param problem: fit problem
+    :param jac: Jacobian of the residuals, a callable or one of the scipy finite-difference schemes
+    :param tolerance: `ftol` and `xtol` of the minimizer
+    :param max_evaluations: maximum number of function evaluations
+    :param kwargs: passed to `scipy.optimize.least_squares`
+    :return: fit results
+    """
+    if tolerance is not None:
+        kwargs.setdefault('ftol', tolerance)
+        kwargs.setdefault('xtol', tolerance)
+    p0 = np.clip(problem.p0, problem.lower, problem.upper)
+
+    with undo_stack_disabled():
+        try:
+            solution = scipy_least_squares(
+                problem.residuals,
+                p0,
+                jac=jac,
+                bounds=(problem.lower, problem.upper),
+                max_nfev=max_evaluations,
+                **kwargs,
+            )
+        except Exception:
+            problem.set_vector(problem.p0)
+            raise
+    return problem.results(solution.x, solution.jac, solution.success, engine_result=solution)
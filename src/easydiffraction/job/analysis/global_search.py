@@ -0,0 +1,164 @@
+# SPDX-FileCopyrightText: 2024 EasyDiffraction contributors
+# SPDX-License-Identifier: BSD-3-Clause
+# © 2021-2024 Contributors to the EasyDiffraction project <https://github.com/EasyScience/EasyDiffraction>
+
+from typing import List
+from typing import Optional
+
+import numpy as np
+from easyscience.fitting.minimizers.utils import FitResults
+from scipy.optimize import OptimizeResult
+from scipy.optimize import differential_evolution
+from scipy.stats import qmc
+
+from easydiffraction.job.analysis.fit_problem import FitProblem
+from easydiffraction.job.analysis.fit_problem import undo_stack_disabled
+from easydiffraction.job.analysis.parallel import ParallelEvaluator
+from easydiffraction.job.analysis.parallel import worker_jacobian
+from easydiffraction.job.analysis.parallel import worker_problem
+
+METHODS = ['multistart', 'differential_evolution']
+# generations of the differential evolution, unless given
+MAX_GENERATIONS = 100
+# solutions closer than this, relative to the parameter ranges, are the same minimum
+DISTINCT_TOLERANCE = 1e-3
+
+
+def _chi2(p: np.ndarray) -> float:
+    residuals = worker_problem().residuals(p)
+    return float(np.sum(residuals**2))
+
+
+def _refine(task) -> OptimizeResult:
+    """
+    Local refinement of the worker problem from the start in `task`, a fit with its minimizer.
+    """
+    start, options = task
+    problem = worker_problem()
+    jacobian = worker_jacobian()
+    if jacobian is not None:
+        options = dict(options, jacobian=jacobian)
+    result = problem.fit(start, **options)
+    p = np.array([parameter.raw_value for parameter in problem.parameters], dtype=float)
+    errors = np.array([parameter.error or 0.0 for parameter in problem.parameters], dtype=float)
+    return OptimizeResult(
+        x=p,
+        errors=errors,
+        cost=0.5 * float(np.sum(problem.residuals(p) ** 2)),
+        success=result is not None and bool(result.success),
+        engine=None if result is None else result.minimizer_engine,
+        start=np.asarray(start),
+    )
+
+
+def _check_bounds(problem: FitProblem) -> None:
+    unbounded = [
+        par.name
+        for par, lower, upper in zip(problem.parameters, problem.lower, problem.upper)
+        if not np.isfinite(upper - lower)
+    ]
+    if unbounded:
+        raise ValueError(f'Global search needs finite bounds (min and max) on all free parameters: {", ".join(unbounded)}')
+
+
+def _distinct(items: List, problem: FitProblem, count: int, key=lambda item: item) -> List:
+    """
+    First `count` of `items` whose points `key(item)` are not the same within `DISTINCT_TOLERANCE`.
+    """
+    span = problem.upper - problem.lower
+    kept = []
+    for item in items:
+        if all(np.max(np.abs(key(item) - key(other)) / span) >= DISTINCT_TOLERANCE for other in kept):
+            kept.append(item)
+        if len(kept) == count:
+            break
+    return kept
+
+
+def global_search(
+    problem: FitProblem,
+    method: str = 'multistart',
+    starts: int = 20,
+    workers: int = 0,
+    seed: Optional[int] = None,
+    jacobian=None,
+    tolerance: Optional[float] = None,
+    max_evaluations: Optional[int] = None,
+    **options,
+) -> List[FitResults]:
+    """
+    Search the bounded parameter space of the fit problem for its lowest minima.
+
+    The local refinements are fits with the minimizer of the fit object of the problem, see
+    `FitProblem.fit`. `'multistart'` refines the current values and `starts - 1` Latin hypercube samples of the
+    parameter space. `'differential_evolution'` first evolves a population over the parameter
+    space and then refines its `starts` best distinct members. The refinements (and the
+    population of each generation) are calculated by `workers` worker processes.
+
+    :param problem: fit problem
+    :param method: one of `METHODS`
+    :param starts: number of local refinements
+    :param workers: number of worker processes, none to search in this process
+    :param seed: seed of the random sampling
+    :param jacobian: Jacobian of the refinements, see `Analysis.fit`, by default that of the minimizer
+    :param tolerance: tolerance of the minimizer in the refinements, by default that of the fitter
+    :param max_evaluations: maximum number of function evaluations of each refinement
+    :param options: passed to `scipy.optimize.differential_evolution`
+    :return: fit results of the distinct minima found, the lowest chi-square first.
+        The free parameters are set to the best solution.
+    """
+    if method not in METHODS:
+        raise ValueError(f'Unknown global search method: {method}, use one of {METHODS}')
+    _check_bounds(problem)
+    refine_options = {}
+    if tolerance is not None:
+        refine_options['tolerance'] = tolerance
+    if max_evaluations is not None:
+        refine_options['max_evaluations'] = max_evaluations
+    p0 = np.clip(problem.p0, problem.lower, problem.upper)
+
+    # the parameters only take intermediate values here, nothing to undo
+    with undo_stack_disabled():
+        try:
+            with ParallelEvaluator(problem, workers, jacobian) as evaluator:
+                if method == 'multistart':
+                    points = [p0]
+                    if starts > 1:
+                        sampler = qmc.LatinHypercube(d=len(p0), seed=seed)
+                        points += list(qmc.scale(sampler.random(starts - 1), problem.lower, problem.upper))
+                else:
+                    options.setdefault('maxiter', MAX_GENERATIONS)
+                    population = differential_evolution(
+                        _chi2,
+                        list(zip(problem.lower, problem.upper)),
+                        x0=p0,
+                        seed=seed,
+                        polish=False,
+                        updating='deferred',
+                        workers=lambda _, points: evaluator.map(_chi2, points),
+                        **options,
+                    )
+                    order = np.argsort(population.population_energies)
+                    points = _distinct([population.population[k] for k in order], problem, starts)
+                solutions = evaluator.map(_refine, [(point, refine_options) for point in points])
+            solutions.sort(key=lambda solution: solution.cost)
+            solutions = _distinct(solutions, problem, len(solutions), key=lambda solution: solution.x)
+            # the other solutions are calculated once more for their results, only the best one is left set
+            results = [_results(problem, s, apply=False) for s in solutions[1:]]
+        except Exception:
+            problem.set_vector(problem.p0)
+            raise
+    results.insert(0, _results(problem, solutions[0]))
+    return results
+
+
+def _results(problem: FitProblem, solution: OptimizeResult, apply: bool = True) -> FitResults:
+    """
+    Fit results of a refinement, reported as those of its minimizer.
+    """
+    results = problem.results(
+        solution.x, success=solution.success, engine_result=solution, apply=apply, errors=solution.errors
+    )
+    if solution.engine is not None:
+        results.minimizer_engine = solution.engine
+    return results
@@ -0,0 +1,296 @@
+# SPDX-FileCopyrightText: 2024 EasyDiffraction contributors
+# SPDX-License-Identifier: BSD-3-Clause
+# © 2021-2024 Contributors to the EasyDiffraction project <https://github.com/EasyScience/EasyDiffraction>
+
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Set
+from typing import Tuple
+
+import numpy as np
+from easyscience.fitting.minimizers.minimizer_base import MINIMIZER_PARAMETER_PREFIX
+from scipy import sparse as sp
+
+from easydiffraction.job.analysis.fit_problem import FitProblem
+from easydiffraction.job.experiment.backgrounds.point import PointBackground
+
+# relative finite-difference step, as in the scipy '2-point' scheme
+REL_STEP = np.finfo(float).eps ** 0.5
+# below this number of parameters the exact trust-region solver on a dense Jacobian converges faster
+SPARSE_MIN_PARAMETERS = 50
+
+
+def _dependents(parameter) -> Set[str]:
+    """
+    Unique names of the parameters set by the constraints of `parameter`.
+    """
+    names = set()
+    for constraint in parameter.user_constraints.values():
+        dependents = constraint.dependent_obj_ids
+        names.update([dependents] if isinstance(dependents, str) else dependents)
+    return names
+
+
+class GroupedJacobian:
+    """
+    Forward-difference Jacobian of the residuals of a fit problem, which uses the structure of
+    a diffraction job to need fewer profile evaluations than free parameters:
+
+    - parameters of a phase only change the profile of that phase, so one parameter of every
+      phase is perturbed in the same evaluation and the changes are told apart by phase profile;
+    - a phase scale multiplies the profile of its phase, its column is the profile over the scale;
+    - point background intensities enter linearly, the column of a point is its interpolation
+      hat function, which is zero away from the neighbouring points.
+
+    Other parameters (instrument, constrained, ...) get an evaluation of their own. The structure
+    is only used while the calculated profile is verified to be the sum of the phase profiles and
+    the point background, otherwise every column is differenced separately.
+    """
+
+    def __init__(self, problem: FitProblem, phases=None, pattern=None, sparse: Optional[bool] = None):
+        """
+        :param problem: fit problem to differentiate
+        :param phases: phases of the job
+        :param pattern: pattern of the job, holding the backgrounds and the zero shift
+        :param sparse: return a `scipy.sparse` matrix instead of a dense array,
+            by default only for `SPARSE_MIN_PARAMETERS` parameters or more
+        """
+        self.problem = problem
+        # object evaluating several parameter vectors at once, e.g. a `ParallelEvaluator`
+        self.evaluator = None
+        if sparse is None:
+            sparse = len(problem.parameters) >= SPARSE_MIN_PARAMETERS
+        self.sparse = sparse
+        self.pattern = pattern
+        self.background = None
+        if pattern is not None and len(pattern.backgrounds) and isinstance(pattern.backgrounds[0], PointBackground):
+            self.background = pattern.backgrounds[0]
+
+        # column -> phase name, for parameters which only change the profile of one phase
+        self.phase_columns: Dict[int, str] = {}
+        # column -> phase name, for phase scales
+        self.scale_columns: Dict[int, str] = {}
+        # column -> background point
+        self.background_columns: Dict[int, object] = {}
+        # whether the background is evaluated on the zero-shift corrected axis, once known
+        self._shifted: Optional[bool] = None
+        # constraints of the fitter may tie any parameters together
+        if not problem.constraints:
+            self._classify(phases)
+        self.global_columns = [
+            j
+            for j in range(len(problem.parameters))
+            if j not in self.phase_columns and j not in self.scale_columns and j not in self.background_columns
+        ]
+        problem.phase_names = sorted(set(self.phase_columns.values()) | set(self.scale_columns.values()))
+
+    def _classify(self, phases):
+        columns = {par.unique_name: j for j, par in enumerate(self.problem.parameters)}
+        shared = set()
+        for phase in phases or []:
+            names = {parameter.unique_name for parameter in phase.get_parameters()}
+            scale = getattr(phase, 'scale', None)
+            if scale is not None and scale.unique_name in columns and not scale.user_constraints:
+                self.scale_columns[columns[scale.unique_name]] = phase.name
+            for name in names:
+                j = columns.get(name)
+                if j is None or j in self.scale_columns:
+                    continue
+                # e.g. symmetry constraints between cell lengths keep the change within the phase
+                if not _dependents(self.problem.parameters[j]) <= names or self.phase_columns.get(j, phase.name) != phase.name:
+                    shared.add(j)
+                self.phase_columns[j] = phase.name
+        # a parameter which changes several phases can not share an evaluation
+        for j in shared:
+            del self.phase_columns[j]
+        if self.background is not None:
+            for point in self.background:
+                j = columns.get(point.y.unique_name)
+                if j is not None and not point.y.user_constraints:
+                    self.background_columns[j] = point
+
+    @property
+    def evaluations(self) -> int:
+        """
+        Number of profile evaluations needed for one structured Jacobian.
+        """
+        per_phase: Dict[str, int] = {}
+        for name in self.phase_columns.values():
+            per_phase[name] = per_phase.get(name, 0) + 1
+        return max(per_phase.values(), default=0) + len(self.global_columns)
+
+    def __call__(self, p: np.ndarray, *args, **kwargs):
+        p = np.asarray(p, dtype=float)
+        profile = self.problem.evaluate(p)
+        phase_profiles = dict(self.problem.phase_profiles(p))
+        x_eval = self._background_abscissa(p, profile, phase_profiles)
+        if x_eval is None:
+            columns = self._plain_columns(p, profile)
+        else:
+            columns = self._structured_columns(p, profile, phase_profiles, x_eval)
+
+        jac = np.empty((len(profile), len(p)))
+        for j, column in columns.items():
+            jac[:, j] = column
+        jac *= self.problem.weights[:, np.newaxis]
+        if self.sparse:
+            return sp.csr_matrix(jac)
+        return jac
+
+    def _background_abscissa(
+        self, p: np.ndarray, profile: np.ndarray, phase_profiles: Dict[str, np.ndarray]
+    ) -> Optional[np.ndarray]:
+        """
+        Points at which the calculator evaluated the background, if the profile is the sum of the
+        phase profiles and the background. None if the structure can not be used.
+        """
+        if not self.phase_columns and not self.scale_columns and not self.background_columns:
+            return None
+        remainder = profile - sum(phase_profiles.values())
+        tolerance = 1e-9 * max(np.max(np.abs(profile)), 1.0)
+        x = self.problem.x
+        if self.background is None:
+            return x if np.allclose(remainder, 0, rtol=0, atol=tolerance) else None
+        # the calculator may evaluate the background on the axis corrected for the zero shift
+        candidates = [x]
+        zero_shift = getattr(self.pattern, 'zero_shift', None)
+        if zero_shift is not None and zero_shift.raw_value:
+            candidates.append(x - zero_shift.raw_value)
+        candidates = [
+            x_eval
+            for x_eval in candidates
+            if np.allclose(remainder, self.background.calculate(x_eval), rtol=0, atol=tolerance)
+        ]
+        if len(candidates) > 1 and self.background_columns:
+            # e.g. a flat background looks the same on both axes, but its hat functions do not
+            if self._shifted is None:
+                self._shifted = self._probe_shift(p, profile, candidates)
+            return candidates[int(self._shifted)]
+        return candidates[0] if candidates else None
+
+    def _probe_shift(self, p: np.ndarray, profile: np.ndarray, candidates: List[np.ndarray]) -> bool:
+        """
+        Perturb the background points by different amounts and check which axis explains the change.
+        """
+        steps = {}
+        for k, j in enumerate(self.background_columns):
+            h = 1e-3 * (k + 1) * max(1.0, abs(p[j]))
+            steps[j] = -h if p[j] + h > self.problem.upper[j] else h
+        point = self._perturbed(p, steps)
+        ((perturbed, _),) = self.evaluate_points([point])
+        errors = []
+        for x_eval in candidates:
+            predicted = sum(h * self._hat(self.background_columns[j], x_eval) for j, h in steps.items())
+            errors.append(np.max(np.abs(perturbed - profile - predicted)))
+        return bool(np.argmin(errors))
+
+    def _hat(self, point, x_eval: np.ndarray) -> np.ndarray:
+        """
+        Change of the interpolated background per unit change of the intensity of `point`.
+        """
+        x_points = self.background.x_sorted_points
+        unit = (x_points == point.x.raw_value).astype(float)
+        return np.interp(x_eval, x_points, unit)
+
+    @staticmethod
+    def _step(p: np.ndarray, j: int, upper: np.ndarray) -> float:
+        h = REL_STEP * max(1.0, abs(p[j]))
+        if p[j] + h > upper[j]:
+            h = -h
+        return h
+
+    def _perturbed(self, p: np.ndarray, steps: Dict[int, float]) -> np.ndarray:
+        point = p.copy()
+        for j, h in steps.items():
+            point[j] += h
+        # the actual step, after rounding
+        for j in steps:
+            steps[j] = point[j] - p[j]
+        return point
+
+    def evaluate_points(self, points: List[np.ndarray]) -> List[Tuple[np.ndarray, Dict[str, np.ndarray]]]:
+        """
+        Profile and phase profiles at each parameter vector in `points`.
+        """
+        if self.evaluator is not None:
+            return self.evaluator.evaluate_points(points)
+        results = []
+        for point in points:
+            profile = self.problem.evaluate(point)
+            results.append((profile, dict(self.problem.phase_profiles(point))))
+        return results
+
+    def _plain_columns(self, p: np.ndarray, profile: np.ndarray) -> Dict[int, np.ndarray]:
+        steps = [{j: self._step(p, j, self.problem.upper)} for j in range(len(p))]
+        points = [self._perturbed(p, step) for step in steps]
+        columns = {}
+        for step, (perturbed, _) in zip(steps, self.evaluate_points(points)):
+            ((j, h),) = step.items()
+            columns[j] = (perturbed - profile) / h
+        return columns
+
+    def _structured_columns(
+        self, p: np.ndarray, profile: np.ndarray, phase_profiles: Dict[str, np.ndarray], x_eval: np.ndarray
+    ) -> Dict[int, np.ndarray]:
+        columns = {}
+        upper = self.problem.upper
+        pending = list(self.global_columns)
+
+        # linear parameters need no evaluation
+        for j, name in self.scale_columns.items():
+            if p[j] == 0:
+                pending.append(j)
+                continue
+            columns[j] = phase_profiles[name] / p[j]
+        for j, point in self.background_columns.items():
+            columns[j] = self._hat(point, x_eval)
+
+        # one parameter of every phase per evaluation
+        per_phase: Dict[str, List[int]] = {}
+        for j, name in self.phase_columns.items():
+            per_phase.setdefault(name, []).append(j)
+        groups = []
+        for g in range(max((len(js) for js in per_phase.values()), default=0)):
+            groups.append({name: js[g] for name, js in per_phase.items() if g < len(js)})
+
+        steps = [{j: self._step(p, j, upper) for j in group.values()} for group in groups]
+        steps += [{j: self._step(p, j, upper)} for j in pending]
+        points = [self._perturbed(p, step) for step in steps]
+        evaluated = self.evaluate_points(points)
+
+        for group, step, (_, perturbed_phases) in zip(groups, steps, evaluated[: len(groups)]):
+            for name, j in group.items():
+                columns[j] = (perturbed_phases[name] - phase_profiles[name]) / step[j]
+        for step, (perturbed, _) in zip(steps[len(groups) :], evaluated[len(groups) :]):
+            ((j, h),) = step.items()
+            columns[j] = (perturbed - profile) / h
+        return columns
+
+
+class LMFitJacobian:
+    """
+    Jacobian hook (`Dfun`) of the least-squares methods of lmfit, from the Jacobian of the profile
+    of a fit problem. lmfit calls it with its parameters, the data and the weights of the fit, and
+    takes the Jacobian of its residuals `(data - model) * weights` over the varying parameters.
+    """
+
+    def __init__(self, problem: FitProblem, jacobian):
+        """
+        :param problem: fit problem of the fit, with unit weights
+        :param jacobian: Jacobian of the profile of the problem, called with its parameter vector,
+            e.g. a `GroupedJacobian`
+        """
+        self.problem = problem
+        self.jacobian = jacobian
+
+    def __call__(self, params, data, weights, *args, **kwargs) -> np.ndarray:
+        values = {name[len(MINIMIZER_PARAMETER_PREFIX) :]: par.value for name, par in params.items()}
+        p = np.array([values[parameter.unique_name] for parameter in self.problem.parameters], dtype=float)
+        jac = self.jacobian(p)
+        jac = jac.toarray() if hasattr(jac, 'toarray') else np.asarray(jac)
+        columns = {parameter.unique_name: j for j, parameter in enumerate(self.problem.parameters)}
+        varying = [columns[name[len(MINIMIZER_PARAMETER_PREFIX) :]] for name, par in params.items() if par.vary]
+        if weights is None:
+            weights = 1.0
+        return -jac[:, varying] * np.reshape(weights, (-1, 1))
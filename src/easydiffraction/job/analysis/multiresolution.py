@@ -0,0 +1,105 @@
+# SPDX-FileCopyrightText: 2024 EasyDiffraction contributors
+# SPDX-License-Identifier: BSD-3-Clause
+# © 2021-2024 Contributors to the EasyDiffraction project <https://github.com/EasyScience/EasyDiffraction>
+
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+
+import numpy as np
+
+from easydiffraction.job.analysis.budget import PartialFitResults
+
+# points of the coarsest stage chosen by default
+COARSE_MIN_POINTS = 2000
+# rebinning factors tried by default, the coarsest first
+COARSE_FACTORS = (16, 4)
+# tolerance of the coarse stages, unless given
+COARSE_TOLERANCE = 1e-4
+# coarse stages are skipped once a stage changes no free parameter by more than this many sigma
+SWITCH_SHIFT = 0.1
+
+
+def rebin(x: np.ndarray, y: np.ndarray, e: np.ndarray, factor: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Merge every `factor` neighbouring points, conserving the integrated intensity: the mean
+    position and intensity of the points, and the uncertainty of their mean. The last bin
+    holds the remaining points.
+
+    A model fitted to the rebinned pattern is evaluated at the mean position of each bin,
+    not averaged over the bin. This biases the fit of peaks that are sharp on the scale of a
+    bin (the calculated peaks are higher and narrower than the binned ones), which is why the
+    last stage of `coarse_to_fine` is at full resolution.
+    """
+    x = np.asarray(x, dtype=float)
+    if factor <= 1:
+        return x, np.asarray(y, dtype=float), np.asarray(e, dtype=float)
+    starts = np.arange(0, len(x), factor)
+    counts = np.diff(np.append(starts, len(x)))
+    x_bin = np.add.reduceat(x, starts) / counts
+    y_bin = np.add.reduceat(np.asarray(y, dtype=float), starts) / counts
+    e_bin = np.sqrt(np.add.reduceat(np.asarray(e, dtype=float) ** 2, starts)) / counts
+    return x_bin, y_bin, e_bin
+
+
+def coarse_levels(points: int) -> List[int]:
+    """
+    Default rebinning factors of the stages for a pattern of `points` points, ending at full resolution.
+    """
+    return [factor for factor in COARSE_FACTORS if points // factor >= COARSE_MIN_POINTS] + [1]
+
+
+def coarse_to_fine(
+    fit,
+    parameters,
+    x: np.ndarray,
+    y: np.ndarray,
+    e: np.ndarray,
+    levels: Sequence[int],
+    fitter,
+    coarse_tolerance: Optional[float] = COARSE_TOLERANCE,
+    **kwargs,
+):
+    """
+    Fit a pattern in stages of increasing resolution, each starting from the values of the
+    previous one. The coarse stages fit the rebinned pattern with the looser `coarse_tolerance`,
+    the full-resolution stage with the `tolerance` in `kwargs`, if any.
+    Once a coarse stage changes no free parameter by more than `SWITCH_SHIFT` of its
+    uncertainty, the remaining coarse stages are skipped. The last stage is always at full
+    resolution. A stage stopped by the budget of the fit ends the fit.
+
+    :param fit: fit function of the analysis, called as `fit(x, y, e, **kwargs)`
+    :param parameters: callable returning the free parameters
+    :param levels: rebinning factors of the stages
+    :param fitter: fitter whose tolerance is set for the coarse stages
+    :param coarse_tolerance: tolerance of the coarse stages, None for that of the fitter
+    :return: fit results of the full-resolution stage
+    """
+    levels = [factor for factor in levels if factor > 1]
+    fitter_tolerance = fitter.tolerance
+    # the tolerance given for the fit is that of the full-resolution stage
+    coarse_kwargs = {key: value for key, value in kwargs.items() if key != 'tolerance'}
+    for factor in levels:
+        if len(x) // factor < 2:
+            continue
+        start = {parameter.unique_name: parameter.raw_value for parameter in parameters()}
+        if coarse_tolerance is not None:
+            fitter.tolerance = coarse_tolerance
+        try:
+            result = fit(*rebin(x, y, e, factor), **coarse_kwargs)
+        finally:
+            fitter.tolerance = fitter_tolerance
+        # out of budget
+        if isinstance(result, PartialFitResults):
+            return result
+        if result is None or not result.success:
+            continue
+        shifts = [
+            abs(parameter.raw_value - start[parameter.unique_name]) / parameter.error
+            for parameter in parameters()
+            if parameter.unique_name in start and parameter.error
+        ]
+        if shifts and max(shifts) < SWITCH_SHIFT:
+            break
+    return fit(x, y, e, **kwargs)
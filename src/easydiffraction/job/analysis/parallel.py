@@ -0,0 +1,152 @@
+# SPDX-FileCopyrightText: 2024 EasyDiffraction contributors
+# SPDX-License-Identifier: BSD-3-Clause
+# © 2021-2024 Contributors to the EasyDiffraction project <https://github.com/EasyScience/EasyDiffraction>
+
+import multiprocessing
+import os
+import threading
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+import numpy as np
+
+from easydiffraction.job.analysis.fit_problem import FitProblem
+
+# fit problem replica (and its Jacobian) of a worker process
+_problem: Optional[FitProblem] = None
+_jacobian = None
+
+
+def _init_worker(problem: FitProblem, jacobian=None):
+    global _problem, _jacobian
+    _problem = problem
+    _jacobian = jacobian
+
+
+def worker_problem() -> FitProblem:
+    """
+    Fit problem of the current worker, for functions passed to `ParallelEvaluator.map`.
+    """
+    return _problem
+
+
+def worker_jacobian():
+    """
+    Jacobian of the current worker, for functions passed to `ParallelEvaluator.map`.
+    """
+    return _jacobian
+
+
+def _ping(_) -> int:
+    return os.getpid()
+
+
+def _evaluate(point: np.ndarray) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    profile = _problem.evaluate(point)
+    return profile, _problem.phase_profiles(point)
+
+
+def _fork_unsafe_reason() -> str:
+    """
+    Why forking the worker processes from this process is not safe, empty if it is.
+    """
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        return 'the fork start method is not available'
+    # a forked process only has the forking thread, locks held by the others stay locked in it
+    if threading.active_count() > 1:
+        return 'other threads are running, e.g. of an asynchronous fit'
+    return ''
+
+
+def resolve_workers(workers: Optional[int]) -> int:
+    """
+    Number of worker processes for `workers`: None or 1 means none, 0 or negative means one per CPU.
+    """
+    if workers is None:
+        return 0
+    if workers <= 0:
+        workers = os.cpu_count() or 1
+    return workers if workers > 1 else 0
+
+
+class ParallelEvaluator:
+    """
+    Pool of worker processes which evaluate a fit problem at many parameter vectors at once.
+
+    The workers are forked from the current process, so each holds a replica of the job and its
+    calculator, and are started (and their calculators warmed up) when the pool is created.
+    Every task carries the complete vector of free parameters, so the replicas calculate exactly
+    what the current process would. Without the `fork` start method, or in a process running
+    other threads, which forking is not safe in, the points are evaluated serially with a warning.
+    """
+
+    def __init__(self, problem: FitProblem, workers: int, jacobian=None):
+        """
+        :param problem: fit problem to evaluate
+        :param workers: number of worker processes, none to evaluate serially
+        :param jacobian: Jacobian of the problem, made available to the workers
+        """
+        self.problem = problem
+        self.workers = workers
+        self.jacobian = jacobian
+        self._executor = None
+        if not workers:
+            return
+        reason = _fork_unsafe_reason()
+        if reason:
+            warnings.warn(f'Evaluating serially, no worker processes are forked as {reason}', stacklevel=2)
+            return
+        # warm the calculator up once, the workers inherit its state
+        problem.evaluate(problem.p0)
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('fork'),
+            initializer=_init_worker,
+            initargs=(problem, jacobian),
+        )
+        # start all the workers now rather than on the first Jacobian
+        list(self._executor.map(_ping, range(workers)))
+
+    def evaluate_points(self, points: List[np.ndarray]) -> List[Tuple[np.ndarray, Dict[str, np.ndarray]]]:
+        """
+        Profile and phase profiles at each parameter vector in `points`.
+        """
+        if self._executor is None or len(points) < 2:
+            results = []
+            for point in points:
+                profile = self.problem.evaluate(point)
+                results.append((profile, dict(self.problem.phase_profiles(point))))
+            return results
+        return list(self._executor.map(_evaluate, points))
+
+    def map(self, fn: Callable, items: Iterable) -> List:
+        """
+        Results of `fn(item)` for each item, calculated by the workers. `fn` must be a module-level
+        function and can use `worker_problem` and `worker_jacobian`.
+        """
+        if self._executor is not None:
+            return list(self._executor.map(fn, items))
+        # serially, on the problem of this process
+        state = (_problem, _jacobian)
+        _init_worker(self.problem, self.jacobian)
+        try:
+            return [fn(item) for item in items]
+        finally:
+            _init_worker(*state)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,76 @@
+# SPDX-FileCopyrightText: 2024 EasyDiffraction contributors
+# SPDX-License-Identifier: BSD-3-Clause
+# © 2021-2024 Contributors to the EasyDiffraction project <https://github.com/EasyScience/EasyDiffraction>
+
+import os
+from typing import Callable
+from typing import List
+from typing import Optional
+
+import numpy as np
+
+
+class FitProgress:
+    """
+    Progress events of a running fit, one per profile evaluation, passed to a callback.
+
+    An event is a dict with the number of the `evaluation`, its `chi2` and `reduced_chi`, the
+    lowest chi-square of the fit so far as `best_chi2` and the free parameter `values` by
+    their names. The callback is called in the thread of the fit and should return quickly.
+    """
+
+    def __init__(self, parameters: List, callback: Callable[[dict], None], names: Optional[List[str]] = None):
+        """
+        :param parameters: free parameters of the fit
+        :param callback: called with every event
+        :param names: names the parameters are given by, by default their unique names
+        """
+        self.parameters = list(parameters)
+        self.names = list(names) if names is not None else [parameter.unique_name for parameter in self.parameters]
+        self.callback = callback
+        self.evaluations = 0
+        # evaluations of worker processes are not reported
+        self._pid = os.getpid()
+        self.begin(np.zeros(0), np.zeros(0))
+
+    def begin(self, y: np.ndarray, weights: np.ndarray) -> None:
+        """
+        Start a fit of `y` with `weights`.
+        """
+        self.y = np.asarray(y, dtype=float)
+        self.weights = np.asarray(weights, dtype=float)
+        self.best_chi2 = np.inf
+
+    def wrap(self, fit_func: Callable) -> Callable:
+        """
+        `fit_func` reporting every profile it calculates.
+        """
+
+        def reported(x, *args, **kwargs):
+            y_calc = fit_func(x, *args, **kwargs)
+            self.record(y_calc)
+            return y_calc
+
+        return reported
+
+    def record(self, y_calc: np.ndarray) -> None:
+        """
+        Report an evaluation of the profile at the current parameter values.
+        """
+        if os.getpid() != self._pid:
+            return
+        self.evaluations += 1
+        y_calc = np.asarray(y_calc, dtype=float)
+        chi2 = np.nan
+        if y_calc.shape == self.y.shape:
+            chi2 = float(np.sum(((y_calc - self.y) * self.weights) ** 2))
+            self.best_chi2 = min(self.best_chi2, chi2)
+        self.callback(
+            {
+                'evaluation': self.evaluations,
+                'chi2': chi2,
+                'reduced_chi': chi2 / max(len(self.y) - len(self.parameters), 1),
+                'best_chi2': self.best_chi2,
+                'values': {name: parameter.raw_value for name, parameter in zip(self.names, self.parameters)},
+            }
+        )
@@ -2,6 +2,10 @@
 # SPDX-License-Identifier: BSD-3-Clause
 # © 2021-2024 Contributors to the EasyDiffraction project <https://github.com/EasyScience/EasyDiffraction>
 
+from typing import Dict
+from typing import Optional
+
+from easyscience.Datasets.xarray import xr
 from easyscience.Objects.core import ComponentSerializer
 
 from easydiffraction.job.experiment.experiment import Experiment
@@ -16,6 +20,13 @@ class DataContainer(ComponentSerializer):
         self._relations = {}
         self.coordinate_labels = []
         self.coordinate_units = []
+        # Retention policy for simulated patterns, `None` means unbounded.
+        # The most recent simulation is always kept.
+        self.max_simulations: Optional[int] = None
+        self.max_simulation_bytes: Optional[int] = None
+        # simulation names, oldest first
+        self._simulation_names: Dict[str, None] = {}
+        self._simulation_coordinates = set()
 
     @classmethod
     def prepare(cls, dataset, simulation_class, experiment_class):
@@ -57,6 +68,61 @@ class DataContainer(ComponentSerializer):
             self.store.easyscience.remove_variable(variable_name)
         self.store.easyscience.add_variable(variable_name, variable_coordinates, values)
 
+    def add_simulation_coordinate(self, coordinate_name, coordinate_values):
+        """
+        Add an x coordinate for simulated patterns. It is removed once no simulation uses it.
+        """
+        self.add_coordinate(coordinate_name, coordinate_values)
+        self._simulation_coordinates.add(coordinate_name)
+
+    def add_simulation(self, simulation_name: str, values: xr.DataArray):
+        """
+        Store a simulated pattern and apply the retention policy.
+        A result with the same shape as the stored one is written in place.
+        """
+        current = self.store.data_vars.get(simulation_name)
+        if current is not None and current.dims == values.dims and current.shape == values.shape:
+            current.variable.values[...] = values.values
+        else:
+            # own the buffer, so later in-place writes don't alter arrays returned to the user
+            self.store[simulation_name] = values.copy(deep=True)
+        self._simulation_names.pop(simulation_name, None)
+        self._simulation_names[simulation_name] = None
+        self._apply_retention()
+
+    def _apply_retention(self):
+        names = [name for name in self._simulation_names if name in self.store.data_vars]
+        self._simulation_names = dict.fromkeys(names)
+        while len(names) > 1 and (
+            (self.max_simulations is not None and len(names) > self.max_simulations)
+            or (
+                self.max_simulation_bytes is not None
+                and sum(self.store[name].nbytes for name in names) > self.max_simulation_bytes
+            )
+        ):
+            oldest = names.pop(0)
+            del self._simulation_names[oldest]
+            self.store.easyscience.remove_variable(oldest)
+        # drop simulation coordinates left behind by removed or re-shaped simulations
+        used = set()
+        for variable in self.store.data_vars.values():
+            used.update(variable.dims)
+        for coordinate_name in list(self._simulation_coordinates):
+            if coordinate_name in used:
+                continue
+            self._simulation_coordinates.discard(coordinate_name)
+            if coordinate_name in self.store.coords:
+                self.store.easyscience.remove_coordinate(coordinate_name)
+
+    def memory_usage(self) -> Dict[str, int]:
+        """
+        Bytes held by each variable and coordinate of the datastore, with the sum under `total`.
+        """
+        usage = {name: int(item.nbytes) for name, item in self.store.data_vars.items()}
+        usage.update({name: int(item.nbytes) for name, item in self.store.coords.items()})
+        usage['total'] = sum(usage.values())
+        return usage
+
     def as_dict(self, skip=None):
         """
         :return: Json-able dictionary representation.
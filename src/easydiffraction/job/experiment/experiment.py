@@ -2,6 +2,8 @@
 # SPDX-License-Identifier: BSD-3-Clause
 # © 2021-2024 Contributors to the EasyDiffraction project <https://github.com/EasyScience/EasyDiffraction>
 
+import io
+
 import numpy as np
 from easyscience.Datasets.xarray import xr
 from easyscience.Objects.job.experiment import ExperimentBase as coreExperiment
@@ -128,6 +130,59 @@ class Experiment(coreExperiment):
             self._datastore.store.easyscience.sigma_attach(self.job_name + '_' + experiment_name + f'_I{j}', data_e)
             j += 1
 
+    def update_data(self, y, e, x=None, append: bool = False) -> bool:
+        """
+        Update the measured data of the experiment, e.g. while it is being measured.
+        On an unchanged x-axis the values are overwritten in place, so the coordinate (and
+        everything calculated on it) is kept. Otherwise the data is replaced.
+
+        :param y: intensities, one row per channel for polarized data
+        :param e: uncertainties of the intensities
+        :param x: x-axis of the data, by default the current one
+        :param append: add the points to the end of the current data instead
+        :return: whether the x-axis has been kept
+        """
+        store = self._datastore.store
+        coord_name = self.job_name + '_' + self.name + '_' + self._x_axis_name
+        data_y = np.atleast_2d(np.asarray(y, dtype=float))
+        data_e = np.atleast_2d(np.asarray(e, dtype=float))
+        if data_y.shape != data_e.shape:
+            raise ValueError('Intensities and uncertainties must have the same shape')
+        var_names = [self.job_name + '_' + self.name + f'_I{i}' for i in range(len(data_y))]
+        x_old = store[coord_name].values if coord_name in store.coords else None
+        if append:
+            if x is None or x_old is None:
+                raise ValueError('Appending data needs the x values of the new points and existing data')
+            data_y = np.column_stack([np.atleast_2d([store[name].values for name in var_names]), data_y])
+            data_e = np.column_stack([np.atleast_2d([self._sigma(name).values for name in var_names]), data_e])
+            x = np.concatenate([x_old, x])
+        if x is None:
+            if x_old is None:
+                raise ValueError('The experiment has no x-axis yet, the x values are needed')
+            x = x_old
+        x = np.asarray(x, dtype=float)
+        if len(x) != data_y.shape[1]:
+            raise ValueError(f'Number of points {data_y.shape[1]} does not match the x-axis of {len(x)} points')
+
+        if x_old is not None and np.array_equal(x, x_old) and all(name in store for name in var_names):
+            for name, data_y_i, data_e_i in zip(var_names, data_y, data_e):
+                store[name].values[:] = data_y_i
+                self._sigma(name).values[:] = data_e_i
+            return True
+
+        if x_old is not None:
+            for name in [name for name, variable in store.data_vars.items() if coord_name in variable.dims]:
+                store.easyscience.remove_variable(name)
+            store.easyscience.remove_coordinate(coord_name)
+        store.easyscience.add_coordinate(coord_name, x)
+        for name, data_y_i, data_e_i in zip(var_names, data_y, data_e):
+            store.easyscience.add_variable(name, [coord_name], data_y_i)
+            store.easyscience.sigma_attach(name, data_e_i)
+        return False
+
+    def _sigma(self, var_name: str):
+        return self._datastore.store[self._datastore.store.easyscience.sigma_label_prefix + var_name]
+
     def add_experiment(self, experiment_name, file_path):
         data = np.loadtxt(file_path, unpack=True)
         coord_name = self.job_name + '_' + experiment_name + '_' + self._x_axis_name
@@ -369,12 +424,34 @@ class Experiment(coreExperiment):
         """
         with open(file_url, 'r') as f:
             data = f.read()
-        if experiment_name is None:
-            experiment_name = 'pnd'
+        self.from_xye_string(data, experiment_name=experiment_name)
+
+    def from_xye_string(self, data: str, experiment_name=None):
+        """
+        Load x, y, e columns into the experiment, with default instrumental parameters
+        as in `from_xye_file`.
+        """
+        x, y, e = np.loadtxt(io.StringIO(data), usecols=(0, 1, 2), ndmin=2, unpack=True)
+        self.from_arrays(x, y, e)
+
+    def from_arrays(self, x, y, e):
+        """
+        Load the data points into the experiment, with default instrumental parameters
+        as in `from_xye_file`.
+
+        :param x: x-axis of the data
+        :param y: intensities
+        :param e: uncertainties of the intensities
+        """
+        x, y, e = (np.asarray(values, dtype=float) for values in (x, y, e))
+        if not x.ndim == 1 or not x.shape == y.shape == e.shape:
+            raise ValueError('x, intensities and uncertainties must be 1D arrays of the same length')
         if self.is_tof:
-            string = _DEFAULT_DATA_BLOCK_NO_MEAS_PD_TOF + '\n' + data
+            string = _DEFAULT_DATA_BLOCK_NO_MEAS_PD_TOF
         else:
-            string = _DEFAULT_DATA_BLOCK_NO_MEAS_PD_CWL + '\n' + data
+            string = _DEFAULT_DATA_BLOCK_NO_MEAS_PD_CWL
+        # the calculators read the points from the CIF of the experiment, written at full precision
+        string += '\n'.join(f'{x_i!r} {y_i!r} {e_i!r}' for x_i, y_i, e_i in zip(x.tolist(), y.tolist(), e.tolist()))
         self.from_cif_string(string)
 
     def from_cif_file(self, file_url, experiment_name=None):
@@ -2,25 +2,43 @@
 # SPDX-License-Identifier: BSD-3-Clause
 # © 2021-2024 Contributors to the EasyDiffraction project <https://github.com/EasyScience/EasyDiffraction>
 
+import asyncio
 import builtins
+import functools
 import importlib.util
-import re
+import inspect
 import time
+import warnings
+from concurrent.futures import Executor
+from contextlib import contextmanager
 from copy import deepcopy
+from typing import AsyncIterator
+from typing import Callable
+from typing import Dict
+from typing import Mapping
+from typing import Optional
+from typing import Sequence
 from typing import TypeVar
 from typing import Union
 
 import numpy as np
-from easyscience import global_object
 from easyscience.Datasets.xarray import xr  # type: ignore
 
 # from easyscience.fitting.fitter import Fitter as CoreFitter
 from easyscience.Objects.job.job import JobBase
 from gemmi import cif
-from scipy.signal import find_peaks
 
 from easydiffraction.calculators.wrapper_factory import WrapperFactory
+from easydiffraction.io.events import EventHistogram
 from easydiffraction.job.analysis.analysis import Analysis
+from easydiffraction.job.analysis.budget import CancellationToken
+from easydiffraction.job.analysis.budget import FitBudget
+from easydiffraction.job.analysis.budget import PartialFitResults
+from easydiffraction.job.analysis.checkpoint import CHECKPOINT_INTERVAL
+from easydiffraction.job.analysis.checkpoint import FitCheckpoint
+from easydiffraction.job.analysis.fit_problem import FitProblem
+from easydiffraction.job.analysis.fit_problem import undo_stack_disabled
+from easydiffraction.job.analysis.progress import FitProgress
 from easydiffraction.job.experiment.backgrounds.point import BackgroundPoint
 from easydiffraction.job.experiment.backgrounds.point import PointBackground
 from easydiffraction.job.experiment.data_container import DataContainer
@@ -33,48 +51,46 @@ from easydiffraction.job.experiment.pd_1d import Powder1DParameters
 from easydiffraction.job.model.phase import Phase
 from easydiffraction.job.model.phase import Phases
 from easydiffraction.job.old_sample.old_sample import Sample
+from easydiffraction.job.parameter_paths import ParameterPaths
+from easydiffraction.job.registry import close_job
+from easydiffraction.job.registry import registering
+from easydiffraction.utils import downsample_indices
 
-try:
-    import darkdetect
-except ImportError:
-    print('darkdetect not installed')
+# Plotting and notebook helpers are imported on first use, see `_plotly_graph_objects`
+# and the chart methods below.
 
-try:
-    # import plotly.express as px # unused
+
+@functools.lru_cache(maxsize=None)
+def _plotly_graph_objects():
+    """
+    Import plotly and set the chart template matching the system theme, once.
+    """
     import plotly.graph_objects as go
     import plotly.io as pio
 
     if importlib.util.find_spec('darkdetect') is None:
         print('Warning: Darkdetect not installed. Try `pip install darkdetect`.')
     else:
-        pio.templates.default = 'plotly_dark' if darkdetect.isDark() else 'plotly_white'
-except ImportError:
-    print('plotly not installed')
+        import darkdetect
 
-try:
-    import py3Dmol
-except ImportError:
-    print('py3Dmol not installed')
-
-try:
-    import pandas as pd
-except ImportError:
-    print('pandas not installed')
+        pio.templates.default = 'plotly_dark' if darkdetect.isDark() else 'plotly_white'
+    return go
 
-try:
-    from IPython.display import HTML
-    from IPython.display import display
-except ImportError:
-    pass
 
 T_ = TypeVar('T_')
 
+# points per line drawn by the charts, longer patterns are downsampled
+CHART_MAX_POINTS = 5000
+# colors of the reflection ticks of successive phases
+BRAGG_COLORS = ['rgb(230, 171, 2)', 'rgb(148, 103, 189)', 'rgb(140, 86, 75)', 'rgb(227, 119, 194)']
+
 
 class DiffractionJob(JobBase):
     """
     This class is the base class for all diffraction specific jobs
     """
 
+    @registering
     def __init__(
         self,
         name: str = None,
@@ -104,6 +120,10 @@ class DiffractionJob(JobBase):
 
         # Fitting related attributes
         self.fitting_results = None
+        # (parameter state, x, y) of the last profile calculated for this job, see `_cached_profile`
+        self._last_profile = None
+        # refined values and chi-square after every data update, see `update_data`
+        self.acquisition_history = []
 
         # can't have type and experiment together
         if type is not None and experiment is not None:
@@ -156,6 +176,7 @@ class DiffractionJob(JobBase):
         return self._sample
 
     @sample.setter
+    @registering
     def sample(self, value: Union[Sample, None]) -> None:
         # We need to deepcopy the sample to ensure that it is not shared between jobs
         if value is not None:
@@ -190,6 +211,7 @@ class DiffractionJob(JobBase):
         return self._experiment
 
     @experiment.setter
+    @registering
     def experiment(self, value: Union[Experiment, None]) -> None:
         # We need to deepcopy the experiment to ensure that it is not shared between jobs
         if value is not None:
@@ -202,6 +224,7 @@ class DiffractionJob(JobBase):
         return self._analysis
 
     @analysis.setter
+    @registering
     def analysis(self, value: Union[Analysis, None]) -> None:
         # We need to deepcopy the analysis to ensure that it is not shared between jobs
         if value is not None:
@@ -230,6 +253,7 @@ class DiffractionJob(JobBase):
         return self._type
 
     @type.setter
+    @registering
     def type(self, value: Union[ExperimentType, str]) -> None:
         if isinstance(value, str):
             self._type = ExperimentType(value)
@@ -280,6 +304,7 @@ class DiffractionJob(JobBase):
     def backgrounds(self):
         return self.experiment.pattern.backgrounds
 
+    @registering
     def set_job_from_file(self, file_url: str) -> None:
         """
         Set the job from a CIF file.
@@ -304,6 +329,7 @@ class DiffractionJob(JobBase):
 
         self._name = block.name
 
+    @registering
     def add_phase(self, id: str = '', phase: Union[Phase, None] = None) -> None:
         """
         Add a phase to the Sample.
@@ -313,15 +339,19 @@ class DiffractionJob(JobBase):
         # self.sample.phases.append(phase)
         cif_string = phase.cif
         self.sample.add_phase_from_string(cif_string)
+        self.parameter_paths.invalidate(self.sample.unique_name)
 
+    @registering
     def remove_phase(self, id: str) -> None:
         """
         Remove a phase from the Sample.
         """
         del self.sample.phases[id]
+        self.parameter_paths.invalidate(self.sample.unique_name)
 
     # TODO: extend for analysis and info
 
+    @registering
     def update_experiment_type(self) -> None:
         """
         Update the job type based on the experiment.
@@ -347,6 +377,7 @@ class DiffractionJob(JobBase):
             if self.experiment.pattern is not None:
                 self.experiment.pattern.zero_shift.unit = 'degree'
 
+    @registering
     def update_exp_type(self) -> None:
         """
         Update the experiment type based on the job.
@@ -374,6 +405,7 @@ class DiffractionJob(JobBase):
             self.experiment.parameters = parameters
             self._kwargs['_parameters'] = self.experiment.parameters
 
+    @registering
     def update_phase_scale(self) -> None:
         """
         Update the phase scale based on the experiment.
@@ -382,6 +414,7 @@ class DiffractionJob(JobBase):
             phase.scale = self.experiment.phase_scale.get(phase.name, phase.scale)
 
     ###### BACKGROUNDS ######
+    @registering
     def set_background(self, points: list) -> None:
         """
         Sets a background on the pattern.
@@ -399,6 +432,7 @@ class DiffractionJob(JobBase):
             self.experiment.pattern.backgrounds.append(bkg)
         else:
             self.experiment.pattern.backgrounds[0] = bkg
+        self.parameter_paths.invalidate(self.experiment.unique_name)
 
     ###### CIF RELATED METHODS ######
 
@@ -429,6 +463,7 @@ class DiffractionJob(JobBase):
 
         return cls(name=job_name, sample=sample, experiment=exp)
 
+    @registering
     def add_experiment_from_file(self, file_url: str) -> None:
         """
         Add an experiment to the job from a CIF file.
@@ -471,6 +506,7 @@ class DiffractionJob(JobBase):
         ):
             self.sample.parameters.dtt2 = self.experiment.parameters.dtt2
 
+    @registering
     def add_experiment_from_string(self, cif_string: str) -> None:
         """
         Add an experiment to the job from a CIF string.
@@ -479,6 +515,32 @@ class DiffractionJob(JobBase):
         self.experiment.from_cif_string(cif_string)
         self.update_experiment_type()
 
+    @registering
+    def add_experiment_from_events(self, events: EventHistogram, **kwargs) -> None:
+        """
+        Add the pattern of histogrammed neutron events to the time-of-flight job, or replace
+        the data of its experiment with it. Binning in d-spacing uses the instrumental
+        parameters of the job unless they are given.
+
+        :param events: histogrammed events
+        :param kwargs: binning, see `EventHistogram.histogram`
+        """
+        if not self.type.is_tof:
+            raise ValueError('Event data needs a time-of-flight job')
+        if kwargs.get('d_spacing') and kwargs.get('dtt1') is None:
+            kwargs['dtt1'] = self.parameters.dtt1.raw_value
+            kwargs['dtt2'] = self.parameters.dtt2.raw_value
+            kwargs['zero'] = self.pattern.zero_shift.raw_value
+        x, y, e = events.histogram(**kwargs)
+        if self.experiment.x is not None:
+            self.experiment.update_data(y, e, x=x)
+            return
+        # a new experiment with the default instrumental parameters
+        self.experiment.from_arrays(x, y, e)
+        self.update_experiment_type()
+        self._kwargs['_parameters'] = self.experiment.parameters
+
+    @registering
     def add_sample_from_file(self, file_url: str) -> None:
         """
         Deprecated. Use add_phase_from_file instead.
@@ -495,6 +557,7 @@ class DiffractionJob(JobBase):
     # Alias to deprecated add_sample_from_file. This is for consistency with the old EDL.
     add_phase_from_file = add_sample_from_file
 
+    @registering
     def add_sample_from_string(self, cif_string: str) -> None:
         """
         Add a sample to the job from a CIF string.
@@ -505,6 +568,7 @@ class DiffractionJob(JobBase):
         # sample doesn't hold any information about the job type
         # so no call to update_experiment_type
 
+    @registering
     def add_analysis_from_file(self, file_url: str) -> None:
         """
         Add an analysis to the job from a CIF file.
@@ -538,6 +602,7 @@ class DiffractionJob(JobBase):
         return self.analysis.calculator
 
     @calculator.setter
+    @registering
     def calculator(self, value: str):
         """
         Set the calculator on the interface.
@@ -551,29 +616,42 @@ class DiffractionJob(JobBase):
         """
         return self.calculate_profile(x, simulation_name, **kwargs)
 
-    def calculate_profile(self, x: Union[xr.DataArray, np.ndarray] = None, simulation_name: str = '', **kwargs) -> np.ndarray:
+    def calculate_profile(
+        self,
+        x: Union[xr.DataArray, np.ndarray] = None,
+        simulation_name: str = '',
+        store: bool = True,
+        **kwargs,
+    ) -> np.ndarray:
         """
         Pull out necessary data from the datastore and calculate the profile.
+
+        :param x: x values, defaults to the experimental x-axis
+        :param simulation_name: suffix of the simulation name in the datastore
+        :param store: record the result (and its x coordinate) in the datastore.
+            With `store=False` the calculator is called directly, nothing is written.
         """
         if x is None:
             x_coord_name = self._name + '_' + self.experiment.name + '_' + self._x_axis_name
             if x_coord_name not in self.datastore.store:
                 raise ValueError('x-axis data not found in the datastore.')
             x = self.datastore.store[x_coord_name]
+        if not store:
+            y = self.analysis.calculate_profile(x, **kwargs)
+            if not kwargs:
+                self._remember_profile(x, y)
+            return y
         if not isinstance(x, xr.DataArray):
-            coord_name = self.datastore._simulations._simulation_prefix + self._name + '_' + self._x_axis_name
-            if coord_name in self.datastore.store and len(self.datastore.store[coord_name]) != len(x):
-                self.datastore.store.EasyScience.remove_coordinate(coord_name)
+            prefix = self.datastore._simulations._simulation_prefix
+            coord_name = prefix + self._name + '_' + self._x_axis_name
+            if coord_name in self.datastore.store and not np.array_equal(self.datastore.store[coord_name].values, x):
+                # other simulations may still use this coordinate, so the new x-axis gets its own.
+                # Coordinates no longer used are dropped by the datastore.
                 self.job_number += 1
-                coord_name = (
-                    self.datastore._simulations._simulation_prefix
-                    + self._name
-                    + str(self.job_number)
-                    + '_'
-                    + self._x_axis_name
-                )
-            self.datastore.add_coordinate(coord_name, x)
-            self.datastore.store[coord_name].name = self._x_axis_name
+                coord_name = prefix + self._name + str(self.job_number) + '_' + self._x_axis_name
+            if coord_name not in self.datastore.store:
+                self.datastore.add_simulation_coordinate(coord_name, x)
+                self.datastore.store[coord_name].name = self._x_axis_name
         else:
             coord_name = x.name
         coord = self.datastore.store[coord_name]
@@ -584,15 +662,118 @@ class DiffractionJob(JobBase):
             simulation_name = self._name
         else:
             simulation_name = self._name + '_' + simulation_name
-        self.datastore.store[self.datastore._simulations._simulation_prefix + simulation_name] = y
+        self.datastore.add_simulation(self.datastore._simulations._simulation_prefix + simulation_name, y)
         # fitter expects ndarrays
         if isinstance(y, xr.DataArray):
             y = y.values
+        if not kwargs:
+            self._remember_profile(coord.values, y)
         return y
 
-    def fit(self, **kwargs):
+    def reflections(self, phase_name: Optional[str] = None) -> Union[np.ndarray, Dict[str, np.ndarray]]:
+        """
+        Reflection tables of the calculated profile: one structured array per phase, with the
+        columns h, k, l, position (on the x axis of the pattern), d, f_squared, multiplicity,
+        fwhm and intensity. The tables come from the last calculation or fit, the profile is
+        only recalculated if a parameter has changed since.
+
+        :param phase_name: name of a single phase, by default all phases
+        :return: the table of `phase_name`, or a dictionary of the tables of all phases
+        """
+        if self._last_profile is None or self._last_profile[0] != self._parameter_state():
+            x = None if self._last_profile is None else self._last_profile[1]
+            self.calculate_profile(x, store=False)
+        if phase_name is not None:
+            return self.interface.get_reflections(phase_name)
+        phase_names = self.interface.get_component('phase_names') or []
+        return {name: self.interface.get_reflections(name) for name in phase_names}
+
+    def _parameter_state(self) -> tuple:
+        """
+        Values the calculated profile depends on: the calculator, parameters and background points.
+        """
+        parameters = list(self.get_parameters())
+        state = [self.interface.current_interface_name]
+        if self.pattern is not None:
+            parameters += self.pattern.get_parameters()
+            for background in self.pattern.backgrounds:
+                state += list(getattr(background, 'x_sorted_points', []))
+        return tuple(state + [parameter.raw_value for parameter in parameters])
+
+    def _remember_profile(self, x, y) -> None:
+        self._last_profile = (self._parameter_state(), np.array(x, dtype=float), np.array(y, dtype=float))
+
+    def _cached_profile(self, x: np.ndarray) -> Optional[np.ndarray]:
+        """
+        The last profile calculated (or fitted) for this job, if it was calculated at `x` and
+        no parameter has changed since. None otherwise.
+        """
+        if self._last_profile is None:
+            return None
+        state, x_last, y_last = self._last_profile
+        if not np.array_equal(x_last, x) or state != self._parameter_state():
+            return None
+        return y_last
+
+    @contextmanager
+    def batch_update(self):
+        """
+        Context manager which defers calculator updates from parameter changes.
+        The calculator receives a single coalesced update when the block exits.
+        """
+        with self.interface.batch_update():
+            yield self
+
+    def set_parameters(self, values: Union[Mapping, Sequence[float], np.ndarray]) -> None:
+        """
+        Set several parameter values at once, updating the calculator only once.
+
+        :param values: mapping of `Parameter` (or its unique name) to value,
+            or a vector of values ordered as `get_fit_parameters()`
+        """
+        if isinstance(values, Mapping):
+            pars = {par.unique_name: par for par in self.get_parameters()}
+            items = []
+            for key, value in values.items():
+                name = key if isinstance(key, str) else key.unique_name
+                if name not in pars:
+                    raise ValueError(f'Unknown parameter: {name}')
+                items.append((pars[name], value))
+        else:
+            fit_parameters = self.get_fit_parameters()
+            if len(values) != len(fit_parameters):
+                raise ValueError(f'Expected {len(fit_parameters)} values, got {len(values)}')
+            items = zip(fit_parameters, values)
+        with self.batch_update():
+            for parameter, value in items:
+                parameter.value = value
+
+    def fit(
+        self,
+        resume_from: Optional[str] = None,
+        checkpoint: Optional[str] = None,
+        checkpoint_interval: float = CHECKPOINT_INTERVAL,
+        max_evaluations: Optional[int] = None,
+        max_time: Optional[float] = None,
+        cancel: Optional[CancellationToken] = None,
+        progress: Optional[Callable[[dict], None]] = None,
+        **kwargs,
+    ):
         """
         Fit the profile based on current phase and experiment.
+
+        A fit with `max_evaluations`, `max_time` or `cancel` stops once it reaches any of them,
+        with the free parameters at the best values found. `fitting_results` are then
+        `PartialFitResults`, which tell why the fit stopped.
+
+        :param resume_from: checkpoint file of an interrupted fit, which continues from the best
+            values found so far. The checkpoint is then kept up to date, unless another is given.
+        :param checkpoint: file the progress of the fit is written to, see `FitCheckpoint`
+        :param checkpoint_interval: minimum number of seconds between two writes of the checkpoint
+        :param max_evaluations: maximum number of profile evaluations
+        :param max_time: maximum wall time of the fit in seconds
+        :param cancel: token cancelling the fit from another thread
+        :param progress: called with the progress event of every evaluation, see `FitProgress`
         """
         x = self.experiment.x
         y = self.experiment.y
@@ -603,6 +784,29 @@ class DiffractionJob(JobBase):
 
         kwargs.update(self._kwargs)
 
+        state = None
+        if resume_from is not None:
+            state = self._resume(resume_from)
+            checkpoint = checkpoint or resume_from
+        if checkpoint is not None:
+            parameters = self.get_fit_parameters()
+            kwargs['checkpoint'] = FitCheckpoint(
+                checkpoint,
+                parameters,
+                y.values,
+                1 / e.values,
+                names=self._checkpoint_names(parameters),
+                interval=checkpoint_interval,
+                evaluations=state['evaluations'] if state else 0,
+                best_chi2=state['best_chi2'] if state else np.inf,
+                engine=self.analysis.current_minimizer,
+            )
+        if progress is not None:
+            parameters = self.get_fit_parameters()
+            kwargs['progress'] = FitProgress(parameters, progress, names=self._checkpoint_names(parameters))
+        if max_evaluations is not None or max_time is not None or cancel is not None:
+            kwargs['budget'] = FitBudget(self.get_fit_parameters(), max_evaluations, max_time, cancel)
+
         if 'method' in kwargs and 'tolerance' in kwargs:
             kwargs['minimizer_kwargs'] = {'ftol': kwargs['tolerance'], 'xtol': kwargs['tolerance']}
             del kwargs['tolerance']
@@ -633,10 +837,278 @@ class DiffractionJob(JobBase):
             print(f'Status: {success_msg}')
             print(f'Duration: {duration_msg}')
             print(f'Reduced χ²: {reduced_chi_msg}')
+        elif isinstance(result, PartialFitResults):
+            print(f'Status: Stopped ({result.reason})')
+            print(f'Duration: {duration_msg}')
+            print(f'Reduced χ²: {result.reduced_chi:.2f}')
         else:
             print(f'Status: {failure_msg}')
 
         self.fitting_results = result
+        if result.success and result.y_calc is not None:
+            self._remember_profile(x, result.y_calc)
+        if checkpoint is not None:
+            kwargs['checkpoint'].write(finished=result.success)
+
+    async def fit_async(
+        self,
+        progress: Optional[Callable[[dict], None]] = None,
+        cancel: Optional[CancellationToken] = None,
+        executor: Optional[Executor] = None,
+        **kwargs,
+    ):
+        """
+        `fit` run in an executor, without blocking the event loop. Independent jobs can be fitted
+        concurrently, each in a thread of the executor. Cancelling the awaiting task cancels the fit.
+        The undo stack is disabled while the fit runs, so the fit is not recorded in it.
+
+        :param progress: called in the event loop with every progress event, see `FitProgress`.
+            Coroutine functions are scheduled as tasks.
+        :param cancel: token cancelling the fit
+        :param executor: executor of the fit, by default that of the event loop
+        :return: fit results, see `fitting_results`
+        """
+        loop = asyncio.get_running_loop()
+        if cancel is None:
+            cancel = CancellationToken()
+        if progress is not None:
+            # the event loop keeps weak references to tasks only
+            tasks = set()
+
+            def report(event):
+                value = progress(event)
+                if inspect.isawaitable(value):
+                    task = asyncio.ensure_future(value)
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+
+            kwargs['progress'] = functools.partial(loop.call_soon_threadsafe, report)
+
+        def run():
+            # fits of other jobs may run at once, they share the disabled stack
+            with undo_stack_disabled():
+                self.fit(cancel=cancel, **kwargs)
+
+        fit = loop.run_in_executor(executor, run)
+        try:
+            await asyncio.shield(fit)
+        except asyncio.CancelledError:
+            # the thread cannot be interrupted, the fit stops at its next evaluation
+            cancel.cancel()
+            await asyncio.wait([fit])
+            raise
+        return self.fitting_results
+
+    async def fit_events(self, cancel: Optional[CancellationToken] = None, **kwargs) -> AsyncIterator[dict]:
+        """
+        Run `fit_async`, yielding its progress events as they come. Leaving the loop over the
+        events early cancels the fit. The results are in `fitting_results` once the events end.
+        """
+        if cancel is None:
+            cancel = CancellationToken()
+        events = asyncio.Queue()
+        done = object()
+        fit = asyncio.ensure_future(self.fit_async(progress=events.put_nowait, cancel=cancel, **kwargs))
+        fit.add_done_callback(lambda _: events.put_nowait(done))
+        try:
+            while True:
+                event = await events.get()
+                if event is done:
+                    break
+                yield event
+        finally:
+            if not fit.done():
+                cancel.cancel()
+                await asyncio.wait([fit])
+        # exceptions of the fit
+        fit.result()
+
+    async def calculate_profile_async(self, *args, executor: Optional[Executor] = None, **kwargs) -> np.ndarray:
+        """
+        `calculate_profile` run in an executor, without blocking the event loop.
+
+        :param executor: executor of the calculation, by default that of the event loop
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, functools.partial(self.calculate_profile, *args, **kwargs))
+
+    def _checkpoint_names(self, parameters) -> list:
+        """
+        Names of the parameters which stay the same in a new session, e.g. `.phases['lbco'].cell.length_a`.
+        """
+        return [self.get_parent_name(parameter.unique_name) + '.' + parameter.name for parameter in parameters]
+
+    def _resume(self, path: str) -> dict:
+        """
+        Set the free parameters to the best values of a checkpoint.
+        """
+        state = FitCheckpoint.load(path)
+        parameters = self.get_fit_parameters()
+        by_name = dict(zip(self._checkpoint_names(parameters), parameters))
+        missing = [name for name in state['names'] if name not in by_name]
+        if missing:
+            warnings.warn(f'Not free parameters, kept at their values: {", ".join(missing)}', stacklevel=3)
+        with self.batch_update():
+            for name, value in zip(state['names'], state['best']):
+                if name in by_name:
+                    by_name[name].value = float(value)
+        status = 'a finished' if state['finished'] else 'an interrupted'
+        warnings.warn(
+            f'Resuming {status} fit after {state["evaluations"]} evaluations, best χ²: {state["best_chi2"]:.6g}',
+            stacklevel=3,
+        )
+        return state
+
+    def update_data(
+        self,
+        y: np.ndarray,
+        e: Optional[np.ndarray] = None,
+        x: Optional[np.ndarray] = None,
+        append: bool = False,
+        refine: bool = True,
+        max_evaluations: Optional[int] = None,
+        **kwargs,
+    ) -> dict:
+        """
+        Update the measured data during an acquisition, e.g. with the counts so far or the next
+        chunk of the pattern, and refine the free parameters starting from their current values.
+        See `Experiment.update_data`. The refined values, their uncertainties and the reduced
+        chi-square are added to `acquisition_history`, with the largest change of a value since
+        the previous update in units of its uncertainty: counting can stop once it stays small.
+
+        :param y: intensities
+        :param e: uncertainties, by default those of counting statistics
+        :param x: x-axis of the data, by default the current one
+        :param append: add the points to the end of the current data instead
+        :param refine: refine the free parameters on the updated data
+        :param max_evaluations: maximum number of function evaluations of the refinement
+        :return: the new entry of `acquisition_history`
+        """
+        if e is None:
+            e = np.sqrt(np.maximum(np.asarray(y, dtype=float), 1.0))
+        self.experiment.update_data(y, e, x=x, append=append)
+        entry = {'time': time.time(), 'points': len(self.experiment.x), 'reduced_chi': None, 'success': None}
+
+        if refine:
+            self._kwargs['_pattern'] = self.experiment.pattern
+            kwargs.update(self._kwargs)
+            fitter_max_evaluations = self.fitter.max_evaluations
+            if max_evaluations is not None:
+                self.fitter.max_evaluations = max_evaluations
+            try:
+                result = self.analysis.fit(self.experiment.x, self.experiment.y, self.experiment.e, **kwargs)
+            finally:
+                self.fitter.max_evaluations = fitter_max_evaluations
+            if result is None:
+                raise ValueError('Fitting failed')
+            self.fitting_results = result
+            if result.success and result.y_calc is not None:
+                self._remember_profile(self.experiment.x, result.y_calc)
+            entry['reduced_chi'] = result.reduced_chi
+            entry['success'] = result.success
+
+        parameters = self.analysis.get_fit_parameters()
+        entry['values'] = {parameter.unique_name: parameter.raw_value for parameter in parameters}
+        entry['errors'] = {parameter.unique_name: parameter.error for parameter in parameters}
+        entry['max_shift'] = None
+        if self.acquisition_history:
+            previous = self.acquisition_history[-1]
+            shifts = [
+                abs(value - previous['values'][name]) / entry['errors'][name]
+                for name, value in entry['values'].items()
+                if name in previous['values'] and entry['errors'][name]
+            ]
+            entry['max_shift'] = max(shifts, default=None)
+        self.acquisition_history.append(entry)
+
+        message = f'Update {len(self.acquisition_history)}: {entry["points"]} points'
+        if entry['reduced_chi'] is not None:
+            message += f', reduced χ²: {entry["reduced_chi"]:.2f}'
+        if entry['max_shift'] is not None:
+            message += f', largest change: {entry["max_shift"]:.2g} σ'
+        print(message)
+        return entry
+
+    def global_search(self, method: str = 'multistart', starts: int = 20, workers: Optional[int] = None, **kwargs) -> list:
+        """
+        Search for the lowest minima within the bounds (min and max) of the free parameters,
+        see `Analysis.global_search`. The parameters are left at the best solution.
+
+        :param method: 'multistart' or 'differential_evolution'
+        :param starts: number of local refinements
+        :param workers: number of worker processes, 0 for one per CPU
+        :return: fit results of the distinct minima found, the lowest chi-square first
+        """
+        self._kwargs['_pattern'] = self.experiment.pattern
+        kwargs.update(self._kwargs)
+
+        start = time.time()
+        results = self.analysis.global_search(
+            self.experiment.x, self.experiment.y, self.experiment.e, method=method, starts=starts, workers=workers, **kwargs
+        )
+        end = time.time()
+
+        print('Global search result')
+        print(f'Duration: {end - start:.2f} s')
+        for rank, result in enumerate(results, start=1):
+            status = 'converged' if result.success else 'not converged'
+            print(f'{rank:3d}. Reduced χ²: {result.reduced_chi:.2f} ({status})')
+
+        self.fitting_results = results[0]
+        self._remember_profile(self.experiment.x, results[0].y_calc)
+        return results
+
+    def fit_problem(self, step: int = 1) -> FitProblem:
+        """
+        Weighted least-squares problem of the free parameters and the measured data of the job,
+        see `Analysis.fit_problem`.
+
+        :param step: use every `step`-th point only, e.g. for a quick look
+        """
+        self._kwargs['_pattern'] = self.experiment.pattern
+        x, y, e = (self.experiment.x[::step], self.experiment.y[::step], self.experiment.e[::step])
+        return self.analysis.fit_problem(x, y, e, **self._kwargs)
+
+    def bootstrap(
+        self,
+        samples: int = 100,
+        method: str = 'monte_carlo',
+        workers: Optional[int] = None,
+        output: Optional[str] = None,
+        **kwargs,
+    ) -> dict:
+        """
+        Estimate the uncertainties of the free parameters by refitting resampled datasets,
+        starting from the current values, see `Analysis.bootstrap`. The job should be fitted first.
+
+        :param samples: number of resampled datasets
+        :param method: 'monte_carlo' (measured values with noise of their uncertainties) or
+            'residuals' (calculated profile with resampled residuals)
+        :param workers: number of worker processes, 0 for one per CPU
+        :param output: path of a CSV file the refitted values are written to while they come in
+        :return: summary of the parameter distributions
+        """
+        if self.fitting_results is None:
+            print('Warning: the job has not been fitted, resampling around the current parameter values')
+        self._kwargs['_pattern'] = self.experiment.pattern
+        kwargs.update(self._kwargs)
+
+        start = time.time()
+        summary = self.analysis.bootstrap(
+            self.experiment.x, self.experiment.y, self.experiment.e, samples, method, workers=workers, output=output, **kwargs
+        )
+        end = time.time()
+
+        print('Bootstrap result')
+        print(f'Duration: {end - start:.2f} s')
+        print(f'Converged refits: {int(summary["success"].sum())} of {samples}')
+        if 'std' in summary:
+            parameters = {parameter.unique_name: parameter for parameter in self.analysis.get_fit_parameters()}
+            for name, mean, std in zip(summary['names'], summary['mean'], summary['std']):
+                parameter = parameters[name]
+                fit = f'{parameter.raw_value:.6g} ± {parameter.error:.2g}'
+                print(f'{parameter.name}: {fit} (fit), {mean:.6g} ± {std:.2g} (bootstrap)')
+        return summary
 
     ###### UTILITY METHODS ######
     def add_datastore(self, datastore: xr.Dataset):
@@ -649,6 +1121,7 @@ class DiffractionJob(JobBase):
             Experiment,  # *type.datastore_classes
         )
 
+    @registering
     def update_interface(self):
         """
         Update the interface based on the current job.
@@ -659,6 +1132,31 @@ class DiffractionJob(JobBase):
             )
         self.interface.generate_bindings(self)
         self.generate_bindings()
+        self.parameter_paths.build()
+
+    def close(self) -> None:
+        """
+        Release the job. The objects it made, see `object_registry`, are removed from the global
+        object map, unless another open job uses them, and its data and results are dropped.
+        The job can't be used afterwards. A job used in a `with` block is closed on leaving it.
+
+        Each job names and records its own objects, so jobs can be built, used and closed in
+        several threads at once. Fits running at once in threads should be run with `fit_async`,
+        as all fits share the undo stack of `easyscience`, see `undo_stack_disabled`.
+        """
+        close_job(self)
+        store = self.datastore.store
+        for name in list(store.data_vars) + list(store.coords):
+            del store[name]
+        self.fitting_results = None
+        self._last_profile = None
+        self.acquisition_history = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
 
     # Charts
 
@@ -674,6 +1172,8 @@ class DiffractionJob(JobBase):
             print('Warning: phase id is not given.')
             return
 
+        import py3Dmol
+
         phase = self.phases[id]
         cif = phase.cif
 
@@ -682,8 +1182,11 @@ class DiffractionJob(JobBase):
         structure_view.setStyle(
             {'sphere': {'colorscheme': 'Jmol', 'scale': 0.2}, 'stick': {'colorscheme': 'Jmol', 'radius': 0.1}}
         )
-        if importlib.util.find_spec('darkdetect') is not None and darkdetect.isDark():
-            structure_view.setBackgroundColor('#111')
+        if importlib.util.find_spec('darkdetect') is not None:
+            import darkdetect
+
+            if darkdetect.isDark():
+                structure_view.setBackgroundColor('#111')
         structure_view.addUnitCell()
         structure_view.replicateUnitCell(2, 2, 2)
         structure_view.zoomTo()  # To zoom in to the center of the structure
@@ -706,6 +1209,7 @@ class DiffractionJob(JobBase):
         if importlib.util.find_spec('plotly') is None:
             print('Warning: Plotly not installed. Try `pip install plotly`.')
             return
+        go = _plotly_graph_objects()
 
         if self.type.is_pd and self.type.is_cwl:
             x_axis_title = '2θ (degree)'
@@ -779,6 +1283,7 @@ class DiffractionJob(JobBase):
         if importlib.util.find_spec('plotly') is None:
             print('Warning: Plotly not installed. Try `pip install plotly`.')
             return
+        go = _plotly_graph_objects()
 
         if self.type.is_pd and self.type.is_cwl:
             x_axis_title = '2θ (degree)'
@@ -826,13 +1331,18 @@ class DiffractionJob(JobBase):
 
         fig.show()
 
-    def show_analysis_chart(self, show_legend=True):
+    def show_analysis_chart(self, show_legend=True, max_points: int = CHART_MAX_POINTS):
         """
         Show the analysis chart.
+
+        The last calculated (or fitted) profile is reused if no parameter has changed since.
+        Lines with more than `max_points` points are downsampled, keeping their shape; in a
+        notebook with `anywidget` installed the visible range is redrawn in detail on zoom.
         """
         if importlib.util.find_spec('plotly') is None:
             print('Warning: Plotly not installed. Try `pip install plotly`.')
             return
+        go = _plotly_graph_objects()
 
         if self.type.is_pd and self.type.is_cwl:
             x_axis_title = '2θ (degree)'
@@ -846,25 +1356,53 @@ class DiffractionJob(JobBase):
         resid_height = 2
         full_height = resid_height + bragg_height + main_height
 
-        x_min = self.experiment.x.data.min()
-        x_max = self.experiment.x.data.max()
+        x = np.asarray(self.experiment.x.data)
+        y_meas = np.asarray(self.experiment.y.data)
+        e_meas = np.asarray(self.experiment.e.data)
+        x_min = x.min()
+        x_max = x.max()
 
-        main_y_range = self.experiment.y.data.max() - self.experiment.y.data.min()
-        main_y_min = self.experiment.y.data.min() - main_y_range / 10
-        main_y_max = self.experiment.y.data.max() + main_y_range / 10
+        main_y_range = y_meas.max() - y_meas.min()
+        main_y_min = y_meas.min() - main_y_range / 10
+        main_y_max = y_meas.max() + main_y_range / 10
         resid_y_range = (main_y_max - main_y_min) * resid_height / main_height
         resid_y_min = -resid_y_range / 2
         resid_y_max = resid_y_range / 2
 
-        y_calc = self.calculate_profile()
-
-        peak_idx, _ = find_peaks(y_calc)
-        x_bragg = self.experiment.x.data[peak_idx]
-        y_bragg = np.zeros_like(x_bragg)
+        y_calc = self._cached_profile(x)
+        if y_calc is None:
+            y_calc = self.calculate_profile()
+        lines = {
+            'resid': y_meas - y_calc,
+            'bkg': np.asarray(self.background),
+            'meas': y_meas,
+            'meas_lower': y_meas - e_meas,
+            'meas_upper': y_meas + e_meas,
+            'calc': y_calc,
+        }
+        shape_lines = [lines['meas'], lines['calc'], lines['resid']]
+        idx = downsample_indices(x, shape_lines, max_points)
+
+        bragg = self._bragg_positions(x_min, x_max)
+        traces_bragg = []
+        for row, (phase_name, positions, labels) in enumerate(bragg):
+            traces_bragg.append(
+                go.Scatter(
+                    x=positions,
+                    y=np.full_like(positions, -row),
+                    text=labels,
+                    xaxis='x2',
+                    yaxis='y2',
+                    line=dict(color=BRAGG_COLORS[row % len(BRAGG_COLORS)]),
+                    mode='markers',
+                    marker=dict(symbol='line-ns-open', size=10, line=dict(width=1)),
+                    name='Bragg peaks' if len(bragg) == 1 else f'Bragg peaks ({phase_name})',
+                )
+            )
 
         trace_resid = go.Scatter(
-            x=self.experiment.x.data,
-            y=self.experiment.y.data - y_calc,
+            x=x[idx],
+            y=lines['resid'][idx],
             xaxis='x',
             yaxis='y',
             line=dict(color='rgb(44, 160, 44)'),
@@ -872,20 +1410,9 @@ class DiffractionJob(JobBase):
             name='Residual (Imeas - Icalc)',
         )
 
-        trace_bragg = go.Scatter(
-            x=x_bragg,
-            y=y_bragg,
-            xaxis='x2',
-            yaxis='y2',
-            line=dict(color='rgb(230, 171, 2)'),  # color=px.colors.qualitative.Plotly[9]),
-            mode='markers',
-            marker=dict(symbol='line-ns-open', size=10, line=dict(width=1)),
-            name='Bragg peaks',
-        )
-
         trace_bkg = go.Scatter(
-            x=self.experiment.x.data,
-            y=self.background,
+            x=x[idx],
+            y=lines['bkg'][idx],
             xaxis='x3',
             yaxis='y3',
             line=dict(color='gray'),
@@ -894,8 +1421,8 @@ class DiffractionJob(JobBase):
         )
 
         trace_calc = go.Scatter(
-            x=self.experiment.x.data,
-            y=y_calc,
+            x=x[idx],
+            y=lines['calc'][idx],
             xaxis='x3',
             yaxis='y3',
             line=dict(color='rgb(214, 39, 40)'),
@@ -904,8 +1431,8 @@ class DiffractionJob(JobBase):
         )
 
         trace_meas = go.Scatter(
-            x=self.experiment.x.data,
-            y=self.experiment.y.data,
+            x=x[idx],
+            y=lines['meas'][idx],
             xaxis='x3',
             yaxis='y3',
             line=dict(color='rgb(31, 119, 180)'),
@@ -914,8 +1441,8 @@ class DiffractionJob(JobBase):
         )
 
         trace_meas_upper = go.Scatter(
-            x=self.experiment.x.data,
-            y=self.experiment.y.data + self.experiment.e.data,
+            x=x[idx],
+            y=lines['meas_upper'][idx],
             xaxis='x3',
             yaxis='y3',
             mode='lines',
@@ -925,8 +1452,8 @@ class DiffractionJob(JobBase):
         )
 
         trace_meas_lower = go.Scatter(
-            x=self.experiment.x.data,
-            y=self.experiment.y.data - self.experiment.e.data,
+            x=x[idx],
+            y=lines['meas_lower'][idx],
             xaxis='x3',
             yaxis='y3',
             mode='lines',
@@ -937,7 +1464,8 @@ class DiffractionJob(JobBase):
             showlegend=False,
         )
 
-        data = [trace_bragg, trace_resid, trace_bkg, trace_meas, trace_meas_lower, trace_meas_upper, trace_calc]
+        line_names = ['resid', 'bkg', 'meas', 'meas_lower', 'meas_upper', 'calc']
+        data = traces_bragg + [trace_resid, trace_bkg, trace_meas, trace_meas_lower, trace_meas_upper, trace_calc]
 
         layout = go.Layout(
             # autosize = True,
@@ -973,6 +1501,7 @@ class DiffractionJob(JobBase):
             ),
             yaxis2=dict(
                 domain=[resid_height / full_height + 0.01, (resid_height + bragg_height) / full_height - 0.01],
+                range=[-len(bragg) + 0.5, 0.5],
                 showline=True,
                 mirror=True,
                 showgrid=False,
@@ -993,7 +1522,50 @@ class DiffractionJob(JobBase):
 
         fig.update_layout(showlegend=show_legend)
 
-        fig.show()
+        if len(x) <= max_points or not self.is_notebook() or importlib.util.find_spec('anywidget') is None:
+            fig.show()
+            return
+
+        # redraw the visible range in detail on zoom
+        fig = go.FigureWidget(fig)
+        line_traces = fig.data[len(traces_bragg) :]
+
+        def redraw(layout, x_range):
+            visible = downsample_indices(x, shape_lines, max_points, x_range)
+            with fig.batch_update():
+                for trace, name in zip(line_traces, line_names):
+                    trace.x = x[visible]
+                    trace.y = lines[name][visible]
+
+        fig.layout.on_change(redraw, 'xaxis.range')
+        from IPython.display import display
+
+        display(fig)
+
+    def _bragg_positions(self, x_min: float, x_max: float) -> list:
+        """
+        Reflection positions of every phase within [x_min, x_max], on the x axis of the pattern,
+        from the last calculation: list of (phase name, positions, hkl labels).
+        """
+        try:
+            phase_names = self.interface.get_component('phase_names') or []
+            reflections = [(name, self.interface.get_phase_components(name)['hkl']) for name in phase_names]
+        except (AttributeError, KeyError, TypeError):
+            return []
+        zero_shift = self.pattern.zero_shift.raw_value if self.pattern is not None else 0.0
+        positions = []
+        for name, hkl in reflections:
+            if 'ttheta' in hkl:
+                x_hkl = np.degrees(hkl['ttheta']) + zero_shift
+            elif 'time' in hkl:
+                x_hkl = np.asarray(hkl['time']) + zero_shift
+            else:
+                continue
+            inside = (x_hkl >= x_min) & (x_hkl <= x_max)
+            indices = zip(hkl['h'][inside], hkl['k'][inside], hkl['l'][inside])
+            labels = ['({} {} {})'.format(*index) for index in indices]
+            positions.append((name, x_hkl[inside], labels))
+        return positions
 
     def is_notebook(self):
         """
@@ -1001,32 +1573,20 @@ class DiffractionJob(JobBase):
         """
         return hasattr(builtins, '__IPYTHON__')
 
+    @property
+    def parameter_paths(self) -> ParameterPaths:
+        """
+        Index of the paths from this job to its parameters, built on first use.
+        """
+        if getattr(self, '_parameter_paths', None) is None or self._parameter_paths.root != self.unique_name:
+            self._parameter_paths = ParameterPaths(self.unique_name)
+        return self._parameter_paths
+
     def get_parent_name(self, unique_name: str) -> str:
         """
         Get the pretty name of the parameter.
         """
-        full_name_items = global_object.map.find_path('DiffractionJob_0', unique_name)
-        str_name = ''
-        for item in full_name_items:
-            if re.match('^Phase_[0-9]+$', item):
-                phase_name = global_object.map.get_item_by_key(item).name
-                str_name += f".phases['{phase_name}']"
-            if re.match('^PeriodicLattice_[0-9]+$', item):
-                str_name += '.cell'
-            if re.match('^Site_[0-9]+$', item):
-                atom_site_name = global_object.map.get_item_by_key(item).name
-                str_name += f".atom_sites['{atom_site_name}']"
-            if re.match('^Instrument1D(CW|TOF)Parameters_[0-9]+$', item):
-                str_name += '.instrument'
-            if re.match('^Powder1DParameters_[0-9]+$', item):
-                str_name += '.pattern'
-            if re.match('^PointBackground_[0-9]+$', item):
-                container_idx = int(re.sub(r'\D', '', item)) - 1
-                str_name += f'.backgrounds[{container_idx}]'
-            if re.match('^BackgroundPoint_[0-9]+$', item):
-                name = global_object.map.get_item_by_key(item).name
-                str_name += f"['{name}']"
-        return str_name
+        return self.parameter_paths.name(unique_name)
 
     def get_full_parameter_name(self, unique_name: str, display_name: str, url: str) -> str:
         parent_name = self.get_parent_name(unique_name)
@@ -1067,6 +1627,8 @@ class DiffractionJob(JobBase):
         Show parameters.
         """
         if importlib.util.find_spec('pandas') is not None:
+            import pandas as pd
+
             df = pd.DataFrame(parameters)
             df.index += 1
             if self.is_notebook():
@@ -1082,6 +1644,9 @@ class DiffractionJob(JobBase):
                 # align the cells in the column 'unit' to the left and remove the left padding
                 html = html.replace('<td><unit>', '<td style="text-align: left; padding-left: 0px">')
                 html = html.replace('</unit></td>', '</td>')
+                from IPython.display import HTML
+                from IPython.display import display
+
                 display(HTML(html))
             else:
                 print(df)
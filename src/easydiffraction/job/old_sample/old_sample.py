@@ -3,11 +3,12 @@
 # © 2021-2024 Contributors to the EasyDiffraction project <https://github.com/EasyScience/EasyDiffraction>
 
 import os
+import shutil
 import tempfile
+import weakref
 from typing import ClassVar
 from typing import Union
 
-from cryspy.A_functions_base.function_2_space_group import get_default_it_coordinate_system_code_by_it_number
 from easycrystallography.Structures.Phase import Phases as ecPhases
 from easyscience.Datasets.xarray import xr
 from easyscience.global_object.undo_redo import property_stack_deco
@@ -96,14 +97,25 @@ class Sample(BaseObj):
 
             self._update_bases(TOF)
 
-        self.filename = os.path.join(tempfile.gettempdir(), 'easydiffraction_temp.cif')
-        # print(f"Temp CIF: {self.filename}")
+        # Per-instance scratch directory for file based calculators, created on first use
+        self._scratch_dir = None
         self.output_index = None
         if interface is not None:
             self.interface = interface
         else:
             self.interface = WrapperFactory()
 
+    @property
+    def filename(self) -> str:
+        """
+        Scratch CIF file name unique to this sample.
+        The directory is created on first access and removed together with the sample.
+        """
+        if self._scratch_dir is None:
+            self._scratch_dir = tempfile.mkdtemp(prefix='easydiffraction_')
+            weakref.finalize(self, shutil.rmtree, self._scratch_dir, ignore_errors=True)
+        return os.path.join(self._scratch_dir, 'easydiffraction_temp.cif')
+
     def add_phase_from_cif(self, cif_file):
         cif_string = ''
         with open(cif_file, 'r') as f:
@@ -111,15 +123,18 @@ class Sample(BaseObj):
         self.add_phase_from_string(cif_string)
 
     def add_phase_from_string(self, cif_string):
+        from cryspy.A_functions_base.function_2_space_group import get_default_it_coordinate_system_code_by_it_number
+
         phase = Phase.from_cif_string(cif_string)
         # update the settings
         if phase[0].space_group.setting is None:
             group_number = phase[0].space_group.int_number
             default_setting = get_default_it_coordinate_system_code_by_it_number(group_number)
             phase[0].space_group.setting = default_setting
-        fixed_cif = phase.cif
-        if self._interface is not None:
-            self._interface.updateModelCif(fixed_cif)
+        # Calculators reading the CIF of the phases (pdffit2, CrysFML) regenerate it lazily,
+        # only those taking the model CIF up front need it generated here.
+        if self._interface is not None and hasattr(self._interface(), 'updateModelCif'):
+            self._interface.updateModelCif(phase.cif)
         for p in phase:
             self.phases.append(p)
 
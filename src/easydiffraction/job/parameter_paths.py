@@ -0,0 +1,170 @@
+# SPDX-FileCopyrightText: 2024 EasyDiffraction contributors
+# SPDX-License-Identifier: BSD-3-Clause
+# © 2021-2024 Contributors to the EasyDiffraction project <https://github.com/EasyScience/EasyDiffraction>
+
+import re
+from typing import Dict
+from typing import Optional
+from typing import Set
+from typing import Tuple
+
+from easyscience import global_object
+
+# object graph node -> part of the pretty parameter name it stands for, the names of objects
+# made by a job carry the number of its registry, see `ObjectRegistry`
+_NAMED_NODES = [
+    (re.compile('^Phase_[0-9]+(_[0-9]+)?$'), 'phase'),
+    (re.compile('^PeriodicLattice_[0-9]+(_[0-9]+)?$'), 'cell'),
+    (re.compile('^Site_[0-9]+(_[0-9]+)?$'), 'site'),
+    (re.compile('^Instrument1D(CW|TOF)Parameters_[0-9]+(_[0-9]+)?$'), 'instrument'),
+    (re.compile('^Powder1DParameters_[0-9]+(_[0-9]+)?$'), 'pattern'),
+    (re.compile('^PointBackground_[0-9]+(_[0-9]+)?$'), 'background'),
+    (re.compile('^BackgroundPoint_[0-9]+(_[0-9]+)?$'), 'point'),
+]
+
+
+def _kind(key: str) -> Optional[str]:
+    for pattern, kind in _NAMED_NODES:
+        if pattern.match(key):
+            return kind
+    return None
+
+
+class ParameterPaths:
+    """
+    Index of the paths from a job to the objects below it in the global object graph, used for
+    the pretty names of parameters, e.g. `.phases['lbco'].atom_sites['La']`.
+
+    Every node below the job is indexed once, with its parent, its children and the named nodes
+    on its path. Subtrees marked as changed with `invalidate` are re-indexed on the next lookup,
+    where only the children added or removed since the last lookup are visited again. A lookup
+    of an unknown parameter, e.g. of an atom added to a phase directly, re-checks the whole job.
+    """
+
+    def __init__(self, root: str):
+        """
+        :param root: unique name of the job
+        """
+        self.root = root
+        # node -> parent node
+        self._parents: Dict[str, Optional[str]] = {}
+        # node -> its children when indexed
+        self._children: Dict[str, Tuple[str, ...]] = {}
+        # node -> named nodes on the path from the job to the node
+        self._named: Dict[str, Tuple[str, ...]] = {}
+        # nodes whose subtree has to be checked before the next lookup
+        self._dirty: Set[str] = set()
+        # parameters not below the job at the last full check
+        self._unreachable: Set[str] = set()
+
+    def build(self) -> None:
+        """
+        Index the whole object graph below the job.
+        """
+        self._parents = {self.root: None}
+        self._children = {}
+        self._named = {self.root: ()}
+        self._dirty.clear()
+        self._unreachable.clear()
+        self._index(self.root)
+
+    def invalidate(self, key: Optional[str] = None) -> None:
+        """
+        Mark the subtree of node `key` (by default the whole job) as changed.
+        """
+        self._dirty.add(key or self.root)
+        self._unreachable.clear()
+
+    @staticmethod
+    def _edges(key: str) -> Tuple[str, ...]:
+        obj = global_object.map.get_item_by_key(key)
+        if obj is None:
+            return ()
+        return tuple(global_object.map.get_edges(obj))
+
+    def _index(self, key: str) -> None:
+        """
+        Index the subtree of `key`, which has already been given its parent.
+        """
+        # depth first, in the order of `Map.find_path`, so every node gets the same path
+        self._children[key] = self._edges(key)
+        stack = [(child, key) for child in reversed(self._children[key])]
+        while stack:
+            node, parent = stack.pop()
+            if node in self._parents:
+                continue
+            self._add(node, parent)
+            children = self._edges(node)
+            self._children[node] = children
+            stack.extend((child, node) for child in reversed(children))
+
+    def _add(self, node: str, parent: str) -> None:
+        self._parents[node] = parent
+        self._named[node] = self._named[parent] + ((node,) if _kind(node) is not None else ())
+
+    def _drop(self, key: str) -> None:
+        stack = [key]
+        while stack:
+            node = stack.pop()
+            stack.extend(child for child in self._children.pop(node, ()) if self._parents.get(child) == node)
+            self._parents.pop(node, None)
+            self._named.pop(node, None)
+
+    def _sync(self, key: str) -> None:
+        """
+        Bring the index of the subtree of `key` up to date with the object graph.
+        """
+        if key not in self._parents:
+            return
+        stack = [key]
+        while stack:
+            node = stack.pop()
+            old = self._children.get(node, ())
+            new = self._edges(node)
+            if new != old:
+                for child in old:
+                    if child not in new and self._parents.get(child) == node:
+                        self._drop(child)
+                self._children[node] = new
+                for child in new:
+                    if child not in self._parents:
+                        self._add(child, node)
+                        self._index(child)
+            stack.extend(child for child in new if self._parents.get(child) == node)
+
+    def path(self, unique_name: str) -> Tuple[str, ...]:
+        """
+        Named nodes on the path from the job to the object `unique_name`.
+        """
+        if not self._parents:
+            self.build()
+        while self._dirty:
+            self._sync(self._dirty.pop())
+        if unique_name not in self._named and unique_name not in self._unreachable:
+            self._sync(self.root)
+            if unique_name not in self._named:
+                self._unreachable.add(unique_name)
+        return self._named.get(unique_name, ())
+
+    def name(self, unique_name: str) -> str:
+        """
+        Pretty name of the object holding the parameter `unique_name`, relative to the job.
+        """
+        str_name = ''
+        for key in self.path(unique_name):
+            kind = _kind(key)
+            if kind in ('cell', 'instrument', 'pattern'):
+                str_name += f'.{kind}'
+                continue
+            obj = global_object.map.get_item_by_key(key)
+            if kind == 'phase':
+                str_name += f".phases['{obj.name}']"
+            elif kind == 'site':
+                str_name += f".atom_sites['{obj.name}']"
+            elif kind == 'background':
+                container = global_object.map.get_item_by_key(self._parents[key]) or ()
+                index = next((i for i, item in enumerate(container) if item is obj), 0)
+                str_name += f'.backgrounds[{index}]'
+            elif kind == 'point':
+                str_name += f"['{obj.name}']"
+        return str_name
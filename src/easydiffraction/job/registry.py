@@ -0,0 +1,191 @@
+# SPDX-FileCopyrightText: 2024 EasyDiffraction contributors
+# SPDX-License-Identifier: BSD-3-Clause
+# © 2021-2024 Contributors to the EasyDiffraction project <https://github.com/EasyScience/EasyDiffraction>
+
+import functools
+import itertools
+import weakref
+from contextvars import ContextVar
+from typing import Callable
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Set
+
+from easyscience import global_object
+
+
+class ObjectRegistry:
+    """
+    Objects made by one job, by their unique names, and the names given to them.
+
+    While a method of the job runs, see `registering`, new objects are named by the registry
+    instead of the global object map and recorded in it as they are made. The names carry the
+    number of the registry, e.g. `Phase_3_0`, so jobs name their objects independently of each
+    other and the names of released objects are never given again.
+    """
+
+    _numbers = itertools.count()
+
+    def __init__(self):
+        self.number = next(ObjectRegistry._numbers)
+        # name prefix -> numbers of the names given
+        self._counters: Dict[str, itertools.count] = {}
+        # unique name -> weak reference to the object
+        self._objects: Dict[str, weakref.ref] = {}
+
+    def unique_name(self, name_prefix: str) -> str:
+        counter = self._counters.setdefault(name_prefix, itertools.count())
+        return f'{name_prefix}_{self.number}_{next(counter)}'
+
+    def add(self, obj) -> None:
+        self._objects[obj.unique_name] = weakref.ref(obj)
+
+    def __contains__(self, unique_name: str) -> bool:
+        return unique_name in self._objects
+
+    def __len__(self) -> int:
+        return len(self._objects)
+
+    def names(self) -> List[str]:
+        return list(self._objects)
+
+    def release(self, keep: Iterable[str] = ()) -> Set[str]:
+        """
+        Remove the objects from the object map, except those linked below any of the objects
+        `keep`, e.g. a phase made by one job and added to another. The map then does not hold
+        them until they are garbage collected. The registry is emptied.
+
+        :param keep: unique names of objects whose objects stay in the map
+        :return: unique names of the removed objects
+        """
+        kept = set()
+        for key in keep:
+            kept |= objects_below(key)
+        released = set()
+        for name, ref in list(self._objects.items()):
+            obj = ref()
+            if obj is None or name in kept or not global_object.map.is_known(obj):
+                continue
+            global_object.map.prune(name)
+            released.add(name)
+        self._objects.clear()
+        return released
+
+
+class _ObjectStore(weakref.WeakValueDictionary):
+    """
+    Store of the global object map whose `keys` is the view of the keys of the underlying dict.
+    The map only tests names for membership in it, or lists them, which is then a single step,
+    instead of a scan of the weak references that fails if another thread adds an object.
+    """
+
+    def keys(self):
+        return self.data.keys()
+
+
+# registry of the job whose method runs in the current thread or task
+_active: ContextVar[Optional[ObjectRegistry]] = ContextVar('easydiffraction_registry', default=None)
+# open jobs by the number of their registry
+_jobs: Dict[int, weakref.ref] = {}
+
+# The object map of `easyscience` names and adds every object as it is made, without a hook
+# for scoping it, so its name generator and `add_vertex` are wrapped once, here.
+_generate_unique_name = global_object.generate_unique_name
+_add_vertex = global_object.map.add_vertex
+
+
+def _unique_name(name_prefix: str) -> str:
+    registry = _active.get()
+    if registry is None:
+        return _generate_unique_name(name_prefix)
+    return registry.unique_name(name_prefix)
+
+
+def _register(obj, obj_type: Optional[str] = None) -> None:
+    _add_vertex(obj, obj_type=obj_type)
+    registry = _active.get()
+    if registry is not None:
+        registry.add(obj)
+
+
+_store = _ObjectStore()
+_store.update(global_object.map._store)
+global_object.map._store = _store
+global_object.generate_unique_name = _unique_name
+global_object.map.add_vertex = _register
+# The script recorder of `easyscience` logs every read of a parameter from outside of its
+# object, without bound, and scans the whole map for each. It is not used here and can't be
+# used by jobs in several threads.
+global_object.script.enabled = False
+
+
+def registry_of(job) -> ObjectRegistry:
+    """
+    Registry of the job, made on first use.
+    """
+    registry = getattr(job, 'object_registry', None)
+    if registry is None:
+        registry = ObjectRegistry()
+        job.object_registry = registry
+        number = registry.number
+        _jobs[number] = weakref.ref(job, lambda _: _jobs.pop(number, None))
+    return registry
+
+
+def registering(method: Callable) -> Callable:
+    """
+    Run a method of a job with its registry active: the objects made meanwhile in the same
+    thread are named by and recorded in the `object_registry` of the job.
+    """
+
+    @functools.wraps(method)
+    def scoped(job, *args, **kwargs):
+        token = _active.set(registry_of(job))
+        try:
+            return method(job, *args, **kwargs)
+        finally:
+            _active.reset(token)
+
+    return scoped
+
+
+def open_jobs() -> list:
+    """
+    The jobs which are not closed or garbage collected.
+    """
+    jobs = [ref() for ref in list(_jobs.values())]
+    return [job for job in jobs if job is not None]
+
+
+def close_job(job) -> Set[str]:
+    """
+    Release the objects of the job, keeping those another open job uses.
+
+    :return: unique names of the removed objects
+    """
+    registry = registry_of(job)
+    _jobs.pop(registry.number, None)
+    return registry.release(keep=[other.unique_name for other in open_jobs() if other is not job])
+
+
+def _edges(key: str):
+    try:
+        return global_object.map.get_edges(global_object.map.get_item_by_key(key))
+    except (AttributeError, KeyError, ValueError):
+        return []
+
+
+def objects_below(root: str) -> Set[str]:
+    """
+    Unique names of the object `root` and of all the objects linked below it in the object map.
+    """
+    found = {root}
+    stack = [root]
+    while stack:
+        for child in _edges(stack.pop()):
+            if child not in found:
+                found.add(child)
+                stack.append(child)
+    return found
@@ -2,6 +2,7 @@
 # SPDX-License-Identifier: BSD-3-Clause
 # © 2021-2024 Contributors to the EasyDiffraction project <https://github.com/EasyScience/EasyDiffraction>
 
+import numpy as np
 import pooch
 
 
@@ -25,3 +26,48 @@ def download_from_repository(file_name: str, branch: str = 'master', destination
         fname=file_name,
         path=destination,
     )
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Indices of the points kept by Largest-Triangle-Three-Buckets downsampling,
+    which preserves the visual shape (peaks included) of a line.
+
+    :param x: sorted x values
+    :param y: y values
+    :param n_out: number of points to keep
+    :return: sorted indices of the kept points, all of them if there are no more than `n_out`
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    # the first and the last point are kept, the others are split in n_out - 2 buckets
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    indices = np.empty(n_out, dtype=int)
+    indices[0] = 0
+    indices[-1] = n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, stop = edges[i], edges[i + 1]
+        # the third corner is the average of the next bucket
+        following = slice(stop, edges[i + 2]) if i + 2 < len(edges) else slice(n - 1, n)
+        cx = x[following].mean()
+        cy = y[following].mean()
+        areas = np.abs((x[a] - cx) * (y[start:stop] - y[a]) - (x[a] - x[start:stop]) * (cy - y[a]))
+        a = start + int(np.argmax(areas))
+        indices[i + 1] = a
+    return indices
+
+
+def downsample_indices(x: np.ndarray, ys, n_out: int, x_range=None) -> np.ndarray:
+    """
+    Indices of the points to draw for lines sharing the sorted `x`: the union of the LTTB
+    points of every line in `ys`, within `x_range` (and one point beyond each end) if given.
+    """
+    start, stop = 0, len(x)
+    if x_range is not None:
+        start = max(int(np.searchsorted(x, x_range[0])) - 1, 0)
+        stop = min(int(np.searchsorted(x, x_range[1], side='right')) + 1, len(x))
+    x = x[start:stop]
+    indices = [lttb_indices(x, np.asarray(y)[start:stop], n_out) for y in ys]
+    return start + np.unique(np.concatenate(indices))
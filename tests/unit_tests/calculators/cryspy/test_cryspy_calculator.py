@@ -0,0 +1,150 @@
+import numpy as np
+
+from easydiffraction.calculators.cryspy.calculator import Cryspy
+
+
+def test_update_before_first_calculation(make_lbco_job):
+    # changed before the cryspy dictionary exists, the change must not be lost
+    job = make_lbco_job()
+    job.phases['lbco'].cell.length_a = 3.85
+    before = np.array(job.calculate_profile(store=False))
+
+    job = make_lbco_job()
+    job.calculate_profile(store=False)
+    job.phases['lbco'].cell.length_a = 3.85
+    after = np.array(job.calculate_profile(store=False))
+    assert np.allclose(before, after)
+
+
+def test_update_of_second_phase(make_lbco_job):
+    job = make_lbco_job('tests/data/lbco.cif', 'tests/data/si.cif')
+    job.calculate_profile(store=False)
+
+    def component(name):
+        return np.array(job.interface.get_phase_components(name)['profile'])
+
+    lbco, si = component('lbco'), component('si')
+    job.phases['si'].atom_sites['Si'].occupancy = 0.5
+    job.calculate_profile(store=False)
+    # the atom of the second crystal block is changed, not one of the first
+    assert np.allclose(component('lbco'), lbco)
+    assert not np.allclose(component('si'), si)
+
+
+def test_removed_atoms_and_phases_leave_no_entries(make_lbco_job):
+    job = make_lbco_job('tests/data/lbco.cif', 'tests/data/si.cif')
+    job.calculate_profile(store=False)
+    calculator = job.interface().calculator
+
+    def atoms():
+        return [atom for key in calculator.current_crystal for atom in calculator.storage[key].atom_site.items]
+
+    def indices():
+        return {
+            'atom_keys': set(calculator._atom_keys),
+            'atom_space_groups': set(calculator._atom_space_groups),
+            'space_group_crystals': set(calculator._space_group_crystals.values()),
+            'crystals': {id(crystal) for crystal, _ in calculator._crystal_locations.values()},
+        }
+
+    assert indices()['atom_keys'] == {id(atom) for atom in atoms()}
+
+    job.phases['lbco'].remove_atom('O')
+    assert indices()['atom_keys'] == {id(atom) for atom in atoms()}
+    assert indices()['atom_space_groups'] == {id(atom) for atom in atoms()}
+
+    crystals = {key: calculator.storage[key] for key in calculator.current_crystal}
+    job.remove_phase('si')
+    (si,) = [crystal for key, crystal in crystals.items() if key not in calculator.current_crystal]
+    job.calculate_profile(store=False)
+    assert indices()['atom_keys'] == {id(atom) for atom in atoms()}
+    assert indices()['atom_space_groups'] == {id(atom) for atom in atoms()}
+    assert len(indices()['space_group_crystals']) == 1
+    assert id(si) not in indices()['crystals']
+
+
+def test_atoms_formed_on_their_current_wyckoff_position(tmp_path, make_lbco_job):
+    cif = open('tests/data/lbco.cif').read()
+
+    def job(x):
+        path = tmp_path / f'lbco_{x}.cif'
+        path.write_text(cif.replace('O O 0 0.5 0.5', f'O O {x} 0.5 0.5'))
+        return make_lbco_job(str(path))
+
+    def reform(calculator):
+        for space_group, crystal in list(calculator._space_group_crystals.items()):
+            calculator.assignSpaceGroup_toCrystal(space_group, crystal)
+        calculator.updateModelCif(calculator.cif_str)
+
+    def oxygen(calculator):
+        (atom,) = [item for item in calculator.storage.values() if getattr(item, 'label', None) == 'O']
+        return atom
+
+    fresh = job(0.1)
+    reference = np.array(fresh.calculate_profile(store=False))
+
+    cached = job(0.0)
+    calculator = cached.interface().calculator
+    before = np.array(cached.calculate_profile(store=False))
+    # the atoms are already formed with this space group
+    reform(calculator)
+    assert np.allclose(cached.calculate_profile(store=False), before)
+
+    # moved from 3c to 6f, the atom must be formed again
+    cached.phases['lbco'].atom_sites['O'].fract_x = 0.1
+    reform(calculator)
+    assert np.allclose(cached.calculate_profile(store=False), reference)
+    formed, expected = oxygen(calculator), oxygen(fresh.interface().calculator)
+    assert (formed.multiplicity, formed.wyckoff_symbol) == (expected.multiplicity, expected.wyckoff_symbol)
+
+
+def _magnetic_crystal(atoms):
+    # atoms: label -> susceptibility arguments, None for a non-magnetic atom
+    calculator = Cryspy()
+    key = calculator.createEmptyCrystal('fe')
+    calculator.assignCell_toCrystal(calculator.createCell('cell'), key)
+    calculator.assignSpaceGroup_toCrystal(calculator.createSpaceGroup('sg', name_hm_alt='P 1'), key)
+    for idx, (label, msp) in enumerate(atoms.items()):
+        calculator.createAtom(label, label=label, type_symbol=label[:-1], fract_x=0.1 * idx, fract_y=0.0, fract_z=0.0)
+        calculator.assignAtom_toCrystal(label, key)
+        if msp is not None:
+            calculator.attachMSP(label, msp['chi_type'], {k: v for k, v in msp.items() if k != 'chi_type'})
+    return calculator, calculator.storage[key]
+
+
+def _scaffold(calculator, crystal):
+    calculator._update_msp_scaffold(crystal)
+    if not hasattr(crystal, 'atom_site_susceptibility'):
+        assert not hasattr(crystal, 'atom_site_scat')
+        return None
+    return crystal.atom_site_susceptibility.to_cif(), crystal.atom_site_scat.to_cif()
+
+
+def _fresh_scaffold(atoms):
+    return _scaffold(*_magnetic_crystal(atoms))
+
+
+def test_msp_scaffold_matches_a_fresh_one():
+    fe1 = {'chi_type': 'Ciso', 'chi_11': 1.5}
+    fe2 = {'chi_type': 'Cani', 'chi_11': 0.5, 'chi_22': 0.7, 'chi_33': 0.9}
+    calculator, crystal = _magnetic_crystal({'Fe1': fe1, 'Fe2': None, 'O1': None})
+    assert _scaffold(calculator, crystal) == _fresh_scaffold({'Fe1': fe1, 'Fe2': None, 'O1': None})
+    susceptibilities = crystal.atom_site_susceptibility
+
+    # parameters are updated in place, the lists are kept
+    calculator.genericUpdate('Fe1_Ciso', chi_11=2.0)
+    fe1 = {'chi_type': 'Ciso', 'chi_11': 2.0}
+    assert _scaffold(calculator, crystal) == _fresh_scaffold({'Fe1': fe1, 'Fe2': None, 'O1': None})
+    assert crystal.atom_site_susceptibility is susceptibilities
+
+    calculator.attachMSP('Fe2', 'Cani', {k: v for k, v in fe2.items() if k != 'chi_type'})
+    assert _scaffold(calculator, crystal) == _fresh_scaffold({'Fe1': fe1, 'Fe2': fe2, 'O1': None})
+
+    calculator.genericUpdate('Fe2', label='Fe3')
+    assert _scaffold(calculator, crystal) == _fresh_scaffold({'Fe1': fe1, 'Fe3': fe2, 'O1': None})
+
+    # the susceptibility of a removed atom is dropped
+    calculator.removeAtom_fromCrystal('Fe1', 'fe')
+    assert _scaffold(calculator, crystal) == _fresh_scaffold({'Fe3': fe2, 'O1': None})
+    calculator.removeAtom_fromCrystal('Fe2', 'fe')
+    assert _scaffold(calculator, crystal) is None
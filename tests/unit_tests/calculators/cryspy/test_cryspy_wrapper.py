@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from easydiffraction.calculators.cryspy.wrapper import POL
+from easydiffraction.calculators.cryspy.wrapper import CryspyWrapper
+
+
+def test_combine_channels():
+    up = np.array([1.0, 2.0, 3.0])
+    down = np.array([0.5, 1.0, 1.5])
+    bg = np.array([0.1, 0.1, 0.1])
+    out = np.empty((5, 3))
+
+    result = POL.combine_channels(up, down, ['sum', 'diff', 'up', 'down', POL.up_plus_down], [1, 2, 1, 1, 1], bg=bg, out=out)
+
+    assert result is out
+    assert np.allclose(result[0], up + down + 2 * bg)
+    assert np.allclose(result[1], 2 * (up - down))
+    assert np.allclose(result[2], up + bg)
+    assert np.allclose(result[3], down + bg)
+    assert np.allclose(result[4], result[0])
+
+    with pytest.raises(ValueError):
+        POL.combine_channels(up, down, ['sum', 'diff'], [1.0])
+    with pytest.raises(ValueError):
+        POL.combine_channels(up, down, ['total'])
+
+
+def test_pol_fit_function_returns_new_arrays(monkeypatch):
+    wrapper = CryspyWrapper()
+    x = np.array([10.0, 20.0, 30.0])
+    calls = []
+
+    def calculate_channels(x_array, channels, weights=None, out=None, **kwargs):
+        calls.append(len(calls) + 1)
+        up, down = len(calls) * x_array, np.ones_like(x_array)
+        return POL.combine_channels(up, down, channels, weights, out=out)
+
+    monkeypatch.setattr(wrapper, 'calculate_channels', calculate_channels)
+    dummy_x, y, f = wrapper.generate_pol_fit_func(x, x, np.ones(3), ['sum', 'diff'])
+    # the channels of each point are interleaved
+    assert np.array_equal(dummy_x, [10.0, 10.0, 20.0, 20.0, 30.0, 30.0])
+    assert np.array_equal(y, [11.0, 9.0, 21.0, 19.0, 31.0, 29.0])
+
+    first = f(dummy_x)
+    kept = first.copy()
+    second = f(dummy_x)
+    assert np.array_equal(first, kept)
+    assert np.array_equal(first, y)
+    assert np.array_equal(second, [21.0, 19.0, 41.0, 39.0, 61.0, 59.0])
@@ -0,0 +1,193 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+pytest.importorskip('diffpy.pdffit2')
+
+from easydiffraction.calculators.pdffit2 import calculator  # noqa: E402
+
+CIF = """data_test
+_cell_length_a 5.0
+_cell_length_b 5.0
+_cell_length_c 5.0
+_cell_angle_alpha 90
+_cell_angle_beta 90
+_cell_angle_gamma 90
+_symmetry_space_group_name_H-M '{space_group}'
+loop_
+_atom_site_label
+_atom_site_type_symbol
+_atom_site_fract_x
+_atom_site_fract_y
+_atom_site_fract_z
+_atom_site_occupancy
+_atom_site_U_iso_or_equiv
+{atoms}
+"""
+
+
+class _PdfFit:
+    engines = []
+
+    def __init__(self):
+        self.setvars = []
+        _PdfFit.engines.append(self)
+
+    def add_structure(self, structure):
+        self.structure = structure
+
+    def read_data_lists(self, stype, qmax, qdamp, r, dr):
+        self.r = r
+
+    def setvar(self, name, value):
+        self.setvars.append((name, value))
+
+    def calc(self):
+        pass
+
+    def getpdf_fit(self):
+        return list(np.zeros(len(self.r)))
+
+
+def _value(value):
+    return SimpleNamespace(raw_value=value)
+
+
+def _atom(label, specie, x, y, z, occupancy=1.0, uiso=0.01):
+    return SimpleNamespace(
+        label=_value(label),
+        specie=specie,
+        fract_x=_value(x),
+        fract_y=_value(y),
+        fract_z=_value(z),
+        occupancy=_value(occupancy),
+        adp=SimpleNamespace(Uiso=_value(uiso)),
+    )
+
+
+def _cif(phase):
+    atoms = [
+        ' '.join(
+            str(value)
+            for value in [
+                atom.label.raw_value,
+                atom.specie,
+                atom.fract_x.raw_value,
+                atom.fract_y.raw_value,
+                atom.fract_z.raw_value,
+                atom.occupancy.raw_value,
+                atom.adp.Uiso.raw_value,
+            ]
+        )
+        for atom in phase.atoms
+    ]
+    return CIF.format(space_group=phase.space_group.space_group_HM_name.raw_value, atoms='\n'.join(atoms))
+
+
+class _Parser(calculator.cif_parser):
+    parsed = 0
+
+    def parse(self, s):
+        _Parser.parsed += 1
+        return super().parse(s)
+
+
+@pytest.fixture
+def pdffit2(monkeypatch):
+    monkeypatch.setattr(calculator, 'pdf_calc', _PdfFit)
+    monkeypatch.setattr(calculator, 'cif_parser', _Parser)
+    _PdfFit.engines = []
+    _Parser.parsed = 0
+    pdffit2 = calculator.Pdffit2()
+    pdffit2.model = SimpleNamespace(
+        **{name: _value(value) for name, value in pdffit2.conditions.items()},
+    )
+    cell = SimpleNamespace(
+        **{name: _value(5.0) for name in ['length_a', 'length_b', 'length_c']},
+        **{name: _value(90.0) for name in ['angle_alpha', 'angle_beta', 'angle_gamma']},
+    )
+    phase = SimpleNamespace(
+        cell=cell,
+        scale=_value(1.0),
+        space_group=SimpleNamespace(space_group_HM_name=_value('P 1')),
+        atoms=[],
+    )
+    pdffit2.phases = [phase]
+    # the CIF is regenerated from the phase when read, as by the CIF cache of the wrapper
+    pdffit2.cif_cache = SimpleNamespace(cif=lambda: _cif(phase))
+    return pdffit2
+
+
+def _calculate(pdffit2, *atoms):
+    if atoms:
+        pdffit2.phases[0].atoms = list(atoms)
+    pdffit2.calculate(np.linspace(1.0, 10.0, 10))
+    engine = _PdfFit.engines[-1]
+    setvars = dict(engine.setvars)
+    engine.setvars.clear()
+    return setvars
+
+
+def test_coordinates_and_occupancies_are_set_on_the_engine(pdffit2):
+    setvars = _calculate(pdffit2, _atom('Si1', 'Si', 0, 0, 0), _atom('O1', 'O', 0.5, 0.5, 0.5))
+    assert len(_PdfFit.engines) == 1
+    # loaded with the structure, not set again
+    assert 'x(1)' not in setvars
+
+    si, o = pdffit2.phases[0].atoms
+    si.fract_x.raw_value = 0.1
+    o.occupancy.raw_value = 0.8
+    setvars = _calculate(pdffit2)
+    assert len(_PdfFit.engines) == 1
+    assert setvars['x(1)'] == pytest.approx(0.1)
+    assert setvars['occ(2)'] == pytest.approx(0.8)
+    assert 'y(1)' not in setvars and 'x(2)' not in setvars
+
+
+def test_structure_parsed_once_per_topology(pdffit2):
+    _calculate(pdffit2, _atom('Si1', 'Si', 0, 0, 0), _atom('O1', 'O', 0.5, 0.5, 0.5))
+    si, o = pdffit2.phases[0].atoms
+    for value in [0.1, 0.2, 0.3]:
+        si.fract_z.raw_value = value
+        o.adp.Uiso.raw_value = value / 10
+        _calculate(pdffit2)
+    assert _Parser.parsed == 1
+
+    o.label.raw_value = 'O2'
+    _calculate(pdffit2)
+    assert _Parser.parsed == 2
+    assert len(_PdfFit.engines) == 1
+
+
+def test_values_set_on_all_the_atoms_of_the_unit_cell(pdffit2):
+    pdffit2.phases[0].space_group.space_group_HM_name.raw_value = 'P m -3 m'
+    _calculate(pdffit2, _atom('Co1', 'Co', 0.5, 0.5, 0.5, uiso=0.01), _atom('O1', 'O', 0, 0.5, 0.5, uiso=0.02))
+    assert len(_PdfFit.engines[-1].structure) == 4
+
+    co, o = pdffit2.phases[0].atoms
+    o.occupancy.raw_value = 0.9
+    o.adp.Uiso.raw_value = 0.03
+    setvars = _calculate(pdffit2)
+    assert _Parser.parsed == 1
+    for i_atom in [2, 3, 4]:
+        assert setvars['occ({})'.format(i_atom)] == pytest.approx(0.9)
+        assert setvars['u11({})'.format(i_atom)] == pytest.approx(0.03)
+    assert 'u11(1)' not in setvars
+
+    # off the special position, O has 6 sites in the unit cell
+    o.fract_x.raw_value = 0.1
+    _calculate(pdffit2)
+    assert _Parser.parsed == 2
+    assert len(_PdfFit.engines) == 2
+    assert len(_PdfFit.engines[-1].structure) == 7
+
+
+def test_engine_rebuilt_when_the_atoms_change(pdffit2):
+    _calculate(pdffit2, _atom('Si1', 'Si', 0, 0, 0), _atom('O1', 'O', 0.5, 0.5, 0.5))
+    _calculate(pdffit2, _atom('Si1', 'Si', 0, 0, 0), _atom('C1', 'C', 0.5, 0.5, 0.5))
+    assert len(_PdfFit.engines) == 2
+    _calculate(pdffit2, _atom('Si1', 'Si', 0, 0, 0), _atom('C1', 'C', 0.5, 0.5, 0.5), _atom('C2', 'C', 0.5, 0, 0))
+    assert len(_PdfFit.engines) == 3
+    _calculate(pdffit2, _atom('Si1', 'Si', 0, 0, 0), _atom('C1', 'C', 0.5, 0.5, 0.5), _atom('C2', 'C', 0.5, 0.2, 0))
+    assert len(_PdfFit.engines) == 3
@@ -0,0 +1,117 @@
+import gc
+import importlib
+import os
+import re
+import sys
+from types import ModuleType
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from easydiffraction.calculators.wrapper_base import WrapperBase
+from easydiffraction.job.model.phase import Phases
+from easydiffraction.job.old_sample.old_sample import Sample
+
+# profile calculated for each phase, by the name of its CIF data block
+YCALC = {'lbco': 1.0, 'si': 10.0}
+
+
+class _CIFFile:
+    def __init__(self, file):
+        with open(file) as f:
+            block = re.search(r'data_(\S+)', f.read()).group(1)
+        self.cell = SimpleNamespace(reciprocal_cell_vol=1.0)
+        self.space_group = None
+        self.atom_list = None
+        self.job_info = SimpleNamespace(block=block)
+
+
+class _ReflectionList:
+    nref = 0
+
+    def __init__(self, cell, space_group, flag, job_info):
+        pass
+
+    def compute_structure_factors(self, space_group, atom_list, job_info):
+        pass
+
+
+class _DiffractionPattern:
+    def __init__(self, job_info, reflection_list, volume):
+        x_min, x_max = job_info.range_2theta
+        points = int(round((x_max - x_min) / job_info.theta_step)) + 1
+        self.ycalc = np.full(points, YCALC[job_info.block])
+
+
+@pytest.fixture
+def wrapper(monkeypatch):
+    cfml_api = ModuleType('CFML_api')
+    cfml_api.CIFFile = _CIFFile
+    cfml_api.ReflectionList = _ReflectionList
+    cfml_api.DiffractionPattern = _DiffractionPattern
+    monkeypatch.setitem(sys.modules, 'CFML_api', cfml_api)
+    for name in ['easydiffraction.calculators.pycrysfml.wrapper', 'easydiffraction.calculators.pycrysfml.calculator']:
+        monkeypatch.delitem(sys.modules, name, raising=False)
+    wrapper = importlib.import_module('easydiffraction.calculators.pycrysfml.wrapper')
+    yield wrapper
+    # the wrapper is not made available to other tests
+    WrapperBase._interfaces.remove(wrapper.PycrysfmlWrapper)
+
+
+def _sample(*cif_files):
+    phases = Phases('Phases')
+    for cif_file in cif_files:
+        phases.append(Phases.from_cif_file(cif_file)[0])
+    return Sample(phases=phases)
+
+
+def _create(wrapper, sample):
+    interface = wrapper.PycrysfmlWrapper()
+    interface.create(sample.phases)
+    for phase in sample.phases:
+        interface.create(phase)
+    interface.create(sample)
+    interface.calculator.createConditions()
+    return interface
+
+
+def test_samples_do_not_share_files(wrapper):
+    samples = [_sample('tests/data/lbco.cif'), _sample('tests/data/lbco.cif')]
+    interfaces = [_create(wrapper, sample) for sample in samples]
+    x = np.linspace(10, 20, 11)
+    for interface in interfaces:
+        interface.fit_func(x)
+    files = [list(interface.calculator.phase_cifs.values()) for interface in interfaces]
+    assert os.path.dirname(samples[0].filename) != os.path.dirname(samples[1].filename)
+    for sample, phase_files in zip(samples, files):
+        assert len(phase_files) == 1
+        assert os.path.dirname(phase_files[0]) == os.path.dirname(sample.filename)
+        assert os.path.isfile(phase_files[0])
+
+
+def test_phase_order(wrapper):
+    sample = _sample('tests/data/lbco.cif', 'tests/data/si.cif')
+    interface = _create(wrapper, sample)
+    lbco, si = [phase.unique_name for phase in sample.phases]
+    interface.calculator.setPhaseScale(lbco, 2.0)
+    interface.calculator.setPhaseScale(si, 3.0)
+    x = np.linspace(10, 20, 11)
+    interface.fit_func(x)
+    # files indexed in another order, e.g. the second phase written first
+    interface.calculator.phase_cifs = dict(reversed(interface.calculator.phase_cifs.items()))
+    y = interface.calculator.calculate(x)
+
+    phases = interface.calculator.additional_data['phases']
+    assert np.allclose(phases[(lbco, 'lbco')]['profile'], 2.0 * YCALC['lbco'])
+    assert np.allclose(phases[(si, 'si')]['profile'], 3.0 * YCALC['si'])
+    assert np.allclose(y, 2.0 * YCALC['lbco'] + 3.0 * YCALC['si'])
+
+
+def test_scratch_directory_removed_with_sample():
+    sample = _sample('tests/data/lbco.cif')
+    directory = os.path.dirname(sample.filename)
+    assert os.path.isdir(directory)
+    del sample
+    gc.collect()
+    assert not os.path.exists(directory)
@@ -0,0 +1,34 @@
+from easydiffraction.calculators.cif_cache import PhaseCifCache
+from easydiffraction.job.model.phase import Phase
+from easydiffraction.job.model.phase import Phases
+
+
+def _phases():
+    phases = Phases('phases')
+    phase_a = Phase('a')
+    phase_a.add_atom('Fe', 'Fe')
+    phases.append(phase_a)
+    phases.append(Phase('b'))
+    return phases
+
+
+def test_cif_is_regenerated_only_for_changed_phase():
+    phases = _phases()
+    cache = PhaseCifCache(phases)
+    cif_a = cache.phase_cif(phases[0])
+    cif_b = cache.phase_cif(phases[1])
+    assert cache.phase_cif(phases[0]) is cif_a
+
+    phases[0].cell.length_a = 5.0
+    cache.invalidate(phases[0].cell.unique_name)
+    assert cache.phase_cif(phases[0]) is not cif_a
+    assert '5.00000000' in cache.phase_cif(phases[0])
+    assert cache.phase_cif(phases[1]) is cif_b
+
+
+def test_cif_unknown_key_is_ignored():
+    phases = _phases()
+    cache = PhaseCifCache(phases)
+    cif_a = cache.phase_cif(phases[0])
+    cache.invalidate('not_a_phase_component')
+    assert cache.phase_cif(phases[0]) is cif_a
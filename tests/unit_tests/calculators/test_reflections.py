@@ -0,0 +1,41 @@
+import numpy as np
+
+from easydiffraction.calculators.reflections import REFLECTION_DTYPE
+from easydiffraction.calculators.reflections import integrate
+from easydiffraction.calculators.reflections import peak_widths
+
+
+def test_peak_widths():
+    x = np.linspace(0, 100, 2001)
+    sigmas = np.array([0.5, 1.0, 2.0])
+    shapes = np.exp(-0.5 * ((x[:, np.newaxis] - [30.0, 50.0, 70.0]) / sigmas) ** 2)
+    # a peak cut by the end of the range and an empty one have no width
+    shapes = np.column_stack([shapes, np.exp(-0.5 * (x - 0.5) ** 2), np.zeros_like(x)])
+    widths = peak_widths(x, shapes)
+    assert np.allclose(widths[:3], 2 * np.sqrt(2 * np.log(2)) * sigmas, rtol=1e-3)
+    assert np.isnan(widths[3:]).all()
+    assert np.allclose(integrate(x, shapes[:, :3]), np.sqrt(2 * np.pi) * sigmas)
+
+
+def test_job_reflections(lbco_job):
+    job = lbco_job
+    job.pattern.zero_shift = 0.5
+    y = job.calculate_profile()
+    table = job.reflections('lbco')
+    assert table.dtype == REFLECTION_DTYPE
+    assert len(table) == len(job.interface.get_phase_components('lbco')['hkl']['h'])
+    # {1 0 0} of the cubic cell
+    first = table[np.argmax(table['d'])]
+    assert sorted(np.abs([first['h'], first['k'], first['l']])) == [0, 0, 1]
+    assert first['multiplicity'] == 6
+    assert np.isclose(first['d'], job.phases['lbco'].cell.length_a.raw_value)
+    # the positions follow Bragg's law on the shifted axis
+    wavelength = job.parameters.wavelength.raw_value
+    ttheta = 2 * np.degrees(np.arcsin(wavelength / (2 * table['d'])))
+    assert np.allclose(table['position'], ttheta + 0.5)
+    assert (table['fwhm'] > 0).all() and (table['f_squared'] >= 0).all()
+    # the reflections share out the phase profile
+    x = job.experiment.x.data
+    background = job.pattern.backgrounds[0].calculate(x - 0.5)
+    assert np.isclose(table['intensity'].sum(), integrate(x, (y - background)[:, np.newaxis])[0], rtol=1e-2)
+    assert list(job.reflections()) == ['lbco']
@@ -0,0 +1,63 @@
+import pickle
+
+import numpy as np
+import pytest
+
+from easydiffraction.calculators import wrapper_factory
+from easydiffraction.calculators.wrapper_base import WrapperBase
+from easydiffraction.calculators.wrapper_factory import WrapperFactory
+
+
+@pytest.fixture
+def dummy():
+    class DummyWrapper(WrapperBase):
+        name = 'Dummy'
+
+        def create(self, model):
+            return []
+
+        def link_atom(self, model_name, atom):
+            pass
+
+        def remove_atom(self, model_name, atom):
+            pass
+
+        def fit_func(self, x_array):
+            return np.zeros_like(x_array)
+
+        def get_hkl(self, x_array=None, idx=None):
+            return {}
+
+        def get_calculated_y_for_phase(self, phase_idx):
+            return []
+
+        def get_total_y_for_phases(self):
+            return []
+
+        def is_tof(self):
+            return False
+
+    yield DummyWrapper
+    WrapperBase._interfaces.remove(DummyWrapper)
+
+
+def test_create_and_switch():
+    factory = WrapperFactory()
+    assert factory.current_interface_name == 'CrysPy'
+    assert factory().name == 'CrysPy'
+    with pytest.raises(AttributeError):
+        factory.switch('unknown')
+    assert factory.current_interface_name == 'CrysPy'
+    restored = pickle.loads(pickle.dumps(factory))  # noqa: S301
+    assert restored.current_interface_name == 'CrysPy'
+
+
+def test_registered_calculator_after_one_not_imported(dummy, monkeypatch):
+    # a calculator which is installed but not imported yet is listed before the registered one
+    monkeypatch.setattr(wrapper_factory, 'installed_calculators', lambda: ['CrysPy', 'Pdffit2'])
+    factory = WrapperFactory(interface_name='Dummy')
+    assert isinstance(factory(), dummy)
+    factory.switch('CrysPy')
+    assert factory().name == 'CrysPy'
+    factory.switch('Dummy')
+    assert isinstance(factory(), dummy)
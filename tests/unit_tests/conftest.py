@@ -0,0 +1,26 @@
+import pytest
+
+import easydiffraction as ed
+
+
+@pytest.fixture
+def make_lbco_job():
+    """
+    Factory of LBCO jobs on the HRPT data, with a background and no free parameters.
+    Other phase files can be given instead of LBCO.
+    """
+
+    def make(*phases):
+        job = ed.Job()
+        for phase in phases or ['tests/data/lbco.cif']:
+            job.add_phase_from_file(phase)
+        job.add_experiment_from_file('tests/data/hrpt.xye')
+        job.set_background([(10.0, 170), (165.0, 170)])
+        return job
+
+    return make
+
+
+@pytest.fixture
+def lbco_job(make_lbco_job):
+    return make_lbco_job()
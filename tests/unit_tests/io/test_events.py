@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from easydiffraction.io.events import EventHistogram
+from easydiffraction.job.job import DiffractionJob as Job
+
+
+def _events(seed=0):
+    rng = np.random.default_rng(seed)
+    tof = rng.uniform(1000, 2000, 100_000)
+    detector_id = rng.integers(0, 4, len(tof))
+    return tof, detector_id
+
+
+def test_histogram_in_chunks(tmp_path):
+    tof, detector_id = _events()
+    np.save(tmp_path / 'tof.npy', tof)
+    np.save(tmp_path / 'id.npy', detector_id)
+    events = EventHistogram(1000, 2000, resolution=0.5, chunk_size=7_000)
+    events.add_npy(tmp_path / 'tof.npy', tmp_path / 'id.npy', detectors=[1, 2])
+    assert events.events == len(tof)
+
+    x, y, e = events.histogram(width=10)
+    expected, edges = np.histogram(tof[np.isin(detector_id, [1, 2])], bins=np.arange(1000, 2001, 10))
+    assert np.allclose(x, (edges[1:] + edges[:-1]) / 2)
+    assert np.array_equal(y, expected)
+    assert np.allclose(e, np.sqrt(expected))
+
+    # re-binned in d-spacing from the same events
+    x, y, _ = events.histogram(width=0.001, relative=True, d_spacing=True, dtt1=1000.0, x_min=1.0, x_max=2.0)
+    assert np.all(np.diff(np.log(x)) > 0)
+    assert y.sum() <= expected.sum()
+
+
+def test_weighted_events():
+    tof, _ = _events()
+    weights = np.full(len(tof), 0.5)
+    events = EventHistogram(1000, 2000, resolution=1.0)
+    events.add_events(tof, weights=weights)
+    x, y, e = events.histogram(edges=[1000, 1500, 2000])
+    counts = np.histogram(tof, bins=[1000, 1500, 2000])[0]
+    assert np.allclose(y, 0.5 * counts)
+    assert np.allclose(e, 0.5 * np.sqrt(counts))
+
+
+def test_hdf5_events(tmp_path):
+    h5py = pytest.importorskip('h5py')
+    tof, detector_id = _events(1)
+    with h5py.File(tmp_path / 'events.h5', 'w') as f:
+        f['entry/tof'] = tof
+    events = EventHistogram(1000, 2000, chunk_size=10_000)
+    events.add_hdf5(tmp_path / 'events.h5', 'entry/tof')
+    _, y, _ = events.histogram(width=100)
+    assert y.sum() == len(tof)
+
+
+def test_job_from_events():
+    tof, _ = _events()
+    events = EventHistogram(1000, 2000)
+    events.add_events(tof)
+    job = Job(type='tof')
+    job.add_experiment_from_events(events, width=5)
+    assert job.type.is_tof
+    assert len(job.experiment.x) == 200
+    x, y, e = events.histogram(width=5)
+    # the points as they are
+    assert np.array_equal(job.experiment.x, x)
+    assert np.array_equal(job.experiment.y.values, y)
+    assert np.array_equal(job.experiment.e.values, e)
+    # the same binning again updates the data in place
+    job.add_experiment_from_events(events, width=5)
+    with pytest.raises(ValueError):
+        Job().add_experiment_from_events(events, width=5)
@@ -0,0 +1,15 @@
+from types import SimpleNamespace
+
+import pytest
+
+
+@pytest.fixture
+def make_parameter():
+    """
+    Factory of parameter stubs with the attributes the fit monitors read.
+    """
+
+    def make(unique_name, raw_value, error=0.0):
+        return SimpleNamespace(unique_name=unique_name, raw_value=raw_value, error=error)
+
+    return make
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from easydiffraction.job.analysis import bootstrap as bootstrap_module
+from easydiffraction.job.analysis.bootstrap import bootstrap
+
+
+@pytest.mark.parametrize('method', ['monte_carlo', 'residuals'])
+def test_bootstrap_streams_and_summarizes(method, tmp_path, lbco_job):
+    job = lbco_job
+    job.phases['lbco'].scale = 6
+    job.phases['lbco'].scale.free = True
+    job.phases['lbco'].scale.error = 0.5
+    problem = job.fit_problem(step=10)
+    output = tmp_path / 'samples.csv'
+    summary = bootstrap(problem, samples=3, method=method, seed=1, output=str(output), chunk_size=2)
+
+    assert summary['names'] == [job.phases['lbco'].scale.unique_name]
+    assert summary['values'].shape == (3, 1)
+    assert summary['success'].all()
+    assert summary['std'][0] > 0
+    # the parameters are left at the starting values, with their errors
+    assert job.phases['lbco'].scale.raw_value == 6
+    assert job.phases['lbco'].scale.error == 0.5
+
+    header, *rows = output.read_text().splitlines()
+    assert header == f'{summary["names"][0]},chi2,success'
+    written = np.array([[float(value) for value in row.split(',')] for row in rows])
+    assert np.array_equal(written[:, 0], summary['values'][:, 0])
+    assert np.array_equal(written[:, 1], summary['chi2'])
+
+
+def test_bootstrap_refits_with_minimizer(lbco_job, monkeypatch):
+    job = lbco_job
+    job.phases['lbco'].scale = 6
+    job.phases['lbco'].scale.free = True
+    problem = job.fit_problem(step=10)
+    problem.fit(problem.p0)
+    expected = job.phases['lbco'].scale.raw_value
+    problem.set_vector(problem.p0)
+
+    # refits to the measured data find the solution of a normal fit
+    monkeypatch.setattr(bootstrap_module, '_datasets', lambda problem, y_calc, method, count, rng: [problem.y] * count)
+    summary = bootstrap(problem, samples=2)
+    assert summary['success'].all()
+    assert summary['values'][:, 0] == pytest.approx([expected, expected], rel=1e-12)
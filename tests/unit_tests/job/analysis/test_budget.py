@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from easydiffraction.job.analysis.budget import CancellationToken
+from easydiffraction.job.analysis.budget import FitBudget
+from easydiffraction.job.analysis.budget import FitStopped
+from easydiffraction.job.analysis.budget import PartialFitResults
+
+
+def test_budget_stops_at_max_evaluations(make_parameter):
+    a = make_parameter('a', 1.0)
+    y = np.array([1.0, 2.0, 3.0])
+    budget = FitBudget([a], max_evaluations=2)
+    budget.begin(y, np.ones(3))
+    fit_func = budget.wrap(lambda x: a.raw_value * x)
+    fit_func(y)
+    a.raw_value = 0.5
+    fit_func(y)
+    with pytest.raises(FitStopped):
+        fit_func(y)
+    assert budget.reason == 'max_evaluations'
+
+    result = budget.result(y, [2.0])
+    assert isinstance(result, PartialFitResults)
+    assert not result.success
+    assert result.evaluations == 2
+    assert result.p == {'a': 1.0}
+    assert result.p0 == {'a': 2.0}
+    assert result.chi2 == 0.0
+
+
+def test_budget_cancelled():
+    token = CancellationToken()
+    budget = FitBudget([], token=token)
+    budget.check()
+    token.cancel()
+    with pytest.raises(FitStopped):
+        budget.check()
+    assert budget.reason == 'cancelled'
+
+
+@pytest.mark.parametrize('kwargs', [{}, {'jacobian': '2-point'}])
+def test_fit_returns_partial_result(kwargs, lbco_job):
+    job = lbco_job
+    job.phases['lbco'].cell.length_a = 3.88
+    job.phases['lbco'].cell.length_a.free = True
+    job.fit(max_evaluations=4, **kwargs)
+    result = job.fitting_results
+    assert isinstance(result, PartialFitResults)
+    assert result.reason == 'max_evaluations'
+    assert result.evaluations == 4
+    # the parameters are left at the best values found
+    assert job.phases['lbco'].cell.length_a.raw_value == pytest.approx(list(result.p.values())[0])
+    assert result.reduced_chi < 52.2
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from easydiffraction.job.analysis.checkpoint import FitCheckpoint
+
+
+def test_checkpoint_keeps_best_evaluation(tmp_path, make_parameter):
+    a, b = make_parameter('a', 1.0), make_parameter('b', 2.0)
+    y = np.array([1.0, 2.0, 3.0])
+    checkpoint = FitCheckpoint(tmp_path / 'fit', [a, b], y, np.ones(3), interval=3600)
+    fit_func = checkpoint.wrap(lambda x: a.raw_value * x)
+    fit_func(y)
+    a.raw_value = 0.5
+    fit_func(y)
+    # nothing written within the interval
+    assert not (tmp_path / 'fit.npz').exists()
+    checkpoint.write()
+
+    state = FitCheckpoint.load(tmp_path / 'fit')
+    assert state['names'] == ['a', 'b']
+    assert state['evaluations'] == 2
+    assert np.array_equal(state['best'], [1.0, 2.0])
+    assert np.array_equal(state['last'], [0.5, 2.0])
+    assert state['best_chi2'] == 0.0
+    assert not state['finished']
+
+
+def _job(make_lbco_job):
+    job = make_lbco_job()
+    job.phases['lbco'].cell.length_a = 3.88
+    job.phases['lbco'].cell.length_a.free = True
+    return job
+
+
+def test_fit_resumes_from_checkpoint(tmp_path, make_lbco_job):
+    path = tmp_path / 'fit.npz'
+    job = _job(make_lbco_job)
+    # an interrupted fit
+    job.fitter.max_evaluations = 3
+    job.fit(jacobian='2-point', checkpoint=path, checkpoint_interval=0)
+    state = FitCheckpoint.load(path)
+    assert state['names'] == [".phases['lbco'].cell.length_a", ".phases['lbco'].scale"]
+    assert state['evaluations'] >= 3
+
+    job = _job(make_lbco_job)
+    job.fit(jacobian='2-point', resume_from=path)
+    # the fit continued from the checkpoint, which is kept up to date
+    resumed = FitCheckpoint.load(path)
+    assert resumed['finished']
+    assert resumed['evaluations'] > state['evaluations']
+    assert resumed['best_chi2'] <= state['best_chi2']
+    assert np.isclose(job.phases['lbco'].cell.length_a.raw_value, 3.8698, atol=1e-3)
+
+
+def test_resumed_fit_keeps_best_chi2(tmp_path, make_lbco_job):
+    path = tmp_path / 'fit.npz'
+    job = _job(make_lbco_job)
+    job.fitter.max_evaluations = 3
+    job.fit(jacobian='2-point', checkpoint=path, checkpoint_interval=0)
+    state = FitCheckpoint.load(path)
+
+    job = _job(make_lbco_job)
+    with pytest.warns(UserWarning, match='Resuming an interrupted fit'):
+        # stopped before its first evaluation
+        job.fit(jacobian='2-point', resume_from=path, max_evaluations=0)
+    resumed = FitCheckpoint.load(path)
+    assert resumed['evaluations'] == state['evaluations']
+    assert resumed['best_chi2'] == state['best_chi2']
+    assert np.array_equal(resumed['best'], state['best'])
@@ -0,0 +1,33 @@
+import threading
+
+import pytest
+from easyscience import global_object
+
+from easydiffraction.job.analysis.fit_problem import undo_stack_disabled
+
+
+@pytest.mark.parametrize('enabled', [False, True])
+def test_undo_stack_disabled_in_threads(enabled):
+    global_object.stack.enabled = enabled
+    try:
+        entered = threading.Barrier(4)
+        states = []
+
+        def fit():
+            with undo_stack_disabled():
+                entered.wait()
+                with undo_stack_disabled():
+                    states.append(global_object.stack.enabled)
+                # the others may still be running
+                entered.wait()
+                states.append(global_object.stack.enabled)
+
+        threads = [threading.Thread(target=fit) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert states == [False] * 8
+        assert global_object.stack.enabled is enabled
+    finally:
+        global_object.stack.enabled = False
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from easydiffraction.job.analysis.global_search import global_search
+
+
+def _free(job):
+    job.pattern.zero_shift = 0.5
+    job.phases['lbco'].scale = 6
+    job.phases['lbco'].cell.length_a.free = True
+    job.phases['lbco'].scale.free = True
+
+
+def test_global_search_needs_bounds(lbco_job):
+    _free(lbco_job)
+    problem = lbco_job.fit_problem(step=10)
+    with pytest.raises(ValueError, match='length_a'):
+        global_search(problem, starts=2)
+
+
+def test_global_search_ranks_solutions(lbco_job):
+    job = lbco_job
+    _free(job)
+    job.phases['lbco'].cell.length_a.min = 3.80
+    job.phases['lbco'].cell.length_a.max = 3.95
+    job.phases['lbco'].scale.min = 1
+    job.phases['lbco'].scale.max = 20
+    problem = job.fit_problem(step=10)
+
+    start_chi2 = np.sum(problem.residuals(problem.p0) ** 2)
+    results = global_search(problem, starts=4, seed=1)
+    chi2 = [result.chi2 for result in results]
+    assert chi2 == sorted(chi2)
+    assert chi2[0] < start_chi2
+    # the parameters are left at the best solution
+    best = np.array(list(results[0].p.values()))
+    assert np.array_equal(best, [par.raw_value for par in problem.parameters])
+
+
+def test_global_search_refines_with_minimizer(lbco_job):
+    job = lbco_job
+    _free(job)
+    job.phases['lbco'].cell.length_a.min = 3.80
+    job.phases['lbco'].cell.length_a.max = 3.95
+    job.phases['lbco'].scale.min = 1
+    job.phases['lbco'].scale.max = 20
+    problem = job.fit_problem(step=10)
+    expected = problem.fit(problem.p0)
+    length_a = job.phases['lbco'].cell.length_a.raw_value
+    problem.set_vector(problem.p0)
+
+    (result,) = global_search(problem, starts=1)
+    assert result.minimizer_engine is expected.minimizer_engine
+    assert result.minimizer_engine.package == job.analysis._fitter.minimizer.package
+    assert job.phases['lbco'].cell.length_a.raw_value == pytest.approx(length_a, rel=1e-8)
@@ -0,0 +1,100 @@
+import threading
+
+import numpy as np
+import pytest
+
+from easydiffraction.job.analysis.jacobian import GroupedJacobian
+from easydiffraction.job.analysis.parallel import ParallelEvaluator
+
+
+def _problem(job):
+    job.pattern.zero_shift = 0.5
+    job.phases['lbco'].cell.length_a.free = True
+    job.phases['lbco'].atom_sites['La'].b_iso_or_equiv.free = True
+    job.phases['lbco'].scale.free = True
+    job.pattern.backgrounds[0][0].y.free = True
+    job.pattern.backgrounds[0][1].y.free = True
+    job.instrument.resolution_u.free = True
+    return job.fit_problem(step=10)
+
+
+def test_grouped_jacobian_matches_finite_differences(lbco_job):
+    problem = _problem(lbco_job)
+    jacobian = GroupedJacobian(problem, lbco_job.phases, lbco_job.pattern, sparse=False)
+    assert len(jacobian.scale_columns) == 1
+    assert len(jacobian.background_columns) == 2
+    assert len(jacobian.phase_columns) == 2
+    # two phase parameters and the resolution need an evaluation each
+    assert jacobian.evaluations == 3
+
+    p = problem.p0
+    grouped = jacobian(p)
+    profile = problem.evaluate(p)
+    plain = jacobian._plain_columns(p, profile)
+    for j, column in plain.items():
+        expected = column * problem.weights
+        assert np.allclose(grouped[:, j], expected, rtol=1e-5, atol=1e-5 * np.abs(expected).max())
+
+
+def test_parallel_jacobian_is_identical_to_serial(lbco_job):
+    problem = _problem(lbco_job)
+    jacobian = GroupedJacobian(problem)
+    p = problem.p0.copy()
+    p[0] += 1e-3
+    serial = jacobian(p)
+    with ParallelEvaluator(problem, 2) as evaluator:
+        assert evaluator._executor is not None
+        jacobian.evaluator = evaluator
+        parallel = jacobian(p)
+    assert np.array_equal(serial, parallel)
+
+
+def test_parallel_evaluation_is_serial_in_threads(lbco_job):
+    problem = _problem(lbco_job)
+    jacobian = GroupedJacobian(problem)
+    serial = jacobian(problem.p0)
+    results = {}
+
+    def evaluate():
+        # forking is not safe with the main thread running as well
+        with pytest.warns(UserWarning, match='serially'):
+            with ParallelEvaluator(problem, 2) as evaluator:
+                results['workers'] = evaluator._executor
+                jacobian.evaluator = evaluator
+                results['jacobian'] = jacobian(problem.p0)
+
+    thread = threading.Thread(target=evaluate)
+    thread.start()
+    thread.join()
+    assert results['workers'] is None
+    assert np.array_equal(results['jacobian'], serial)
+
+
+def _free(job):
+    job.phases['lbco'].cell.length_a.free = True
+    job.phases['lbco'].scale.free = True
+    job.pattern.backgrounds[0][0].y.free = True
+    return job
+
+
+@pytest.mark.parametrize('kwargs', [{'jacobian': 'grouped'}, {'jacobian': '2-point'}, {'workers': 2}])
+def test_fit_passes_jacobian_to_minimizer(make_lbco_job, kwargs):
+    job = _free(make_lbco_job())
+    job.fit()
+    expected = job.fitting_results
+    length_a = job.phases['lbco'].cell.length_a.raw_value
+
+    job = _free(make_lbco_job())
+    job.fit(**kwargs)
+    results = job.fitting_results
+    assert results.minimizer_engine is expected.minimizer_engine
+    assert results.reduced_chi == pytest.approx(expected.reduced_chi, rel=1e-6)
+    assert job.phases['lbco'].cell.length_a.raw_value == pytest.approx(length_a, rel=1e-4)
+
+
+@pytest.mark.parametrize('kwargs', [{'jacobian': 'grouped'}, {'workers': 2}])
+def test_jacobian_needs_minimizer_with_hook(lbco_job, kwargs):
+    _free(lbco_job)
+    lbco_job.analysis.current_minimizer = 'Bumps'
+    with pytest.raises(ValueError, match='Jacobian hook'):
+        lbco_job.fit(**kwargs)
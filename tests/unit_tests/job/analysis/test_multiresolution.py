@@ -0,0 +1,60 @@
+import numpy as np
+
+from easydiffraction.job.analysis.multiresolution import coarse_levels
+from easydiffraction.job.analysis.multiresolution import coarse_to_fine
+from easydiffraction.job.analysis.multiresolution import rebin
+
+
+def test_rebin_conserves_intensity():
+    x = np.linspace(0, 10, 1001)
+    y = np.exp(-((x - 5) ** 2))
+    e = np.full_like(x, 0.1)
+    x_bin, y_bin, e_bin = rebin(x, y, e, 4)
+    assert len(x_bin) == 251
+    # the last bin holds the one remaining point
+    assert x_bin[-1] == x[-1]
+    assert np.isclose(np.sum(y_bin[:-1] * 4 * 0.01), np.sum(y[:-1] * 0.01))
+    assert np.allclose(e_bin[:-1], 0.05)
+    assert coarse_levels(100_000) == [16, 4, 1]
+    assert coarse_levels(1000) == [1]
+
+
+class _Fitter:
+    tolerance = None
+
+
+def test_coarse_to_fine_stages(make_parameter):
+    parameter = make_parameter('p', 0.0, error=1.0)
+    fitter = _Fitter()
+    stages = []
+
+    class Result:
+        success = True
+
+    def fit(x, y, e, **kwargs):
+        stages.append((len(x), kwargs.get('tolerance', fitter.tolerance)))
+        # the first stage moves the parameter, the second one does not
+        parameter.raw_value = 1.0
+        return Result()
+
+    x = np.arange(1000.0)
+    coarse_to_fine(fit, lambda: [parameter], x, x, x, [16, 4, 2], fitter, coarse_tolerance=1e-3)
+    # the stage at a factor of 2 is skipped, the last one is at full resolution with the tolerance of the fitter
+    assert stages == [(63, 1e-3), (250, 1e-3), (1000, None)]
+
+    stages.clear()
+    parameter.raw_value = 0.0
+    coarse_to_fine(fit, lambda: [parameter], x, x, x, [16], fitter, coarse_tolerance=1e-3, tolerance=1e-8)
+    # the tolerance given for the fit is used at full resolution only
+    assert stages == [(63, 1e-3), (1000, 1e-8)]
+
+
+def test_job_fit_coarse_to_fine(lbco_job):
+    job = lbco_job
+    job.phases['lbco'].cell.length_a = 3.88
+    job.phases['lbco'].cell.length_a.free = True
+    job.fit(jacobian='2-point', coarse_to_fine=[4])
+    assert job.fitting_results.success
+    assert len(job.fitting_results.x) == len(job.experiment.x)
+    # the minimum of the direct fit
+    assert np.isclose(job.phases['lbco'].cell.length_a.raw_value, 3.8698, atol=1e-3)
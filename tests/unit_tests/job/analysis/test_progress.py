@@ -0,0 +1,24 @@
+import numpy as np
+
+from easydiffraction.job.analysis.progress import FitProgress
+
+
+def test_progress_reports_every_evaluation(make_parameter):
+    a = make_parameter('a', 0.5)
+    y = np.array([1.0, 2.0, 3.0])
+    events = []
+    progress = FitProgress([a], events.append, names=['scale'])
+    progress.begin(y, np.ones(3))
+    fit_func = progress.wrap(lambda x: a.raw_value * x)
+    fit_func(y)
+    a.raw_value = 1.0
+    fit_func(y)
+    # e.g. a rebinned stage of a coarse-to-fine fit
+    fit_func(y[:2])
+
+    assert [event['evaluation'] for event in events] == [1, 2, 3]
+    assert events[0]['chi2'] == 3.5
+    assert events[0]['reduced_chi'] == 1.75
+    assert events[1]['values'] == {'scale': 1.0}
+    assert np.isnan(events[2]['chi2'])
+    assert events[2]['best_chi2'] == 0.0
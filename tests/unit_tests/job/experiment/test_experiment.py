@@ -71,3 +71,23 @@ def test_add_experiment(setup_experiment):
 
     # Clean up the temporary file
     os.remove(file_path)
+
+
+def test_from_arrays():
+    from easydiffraction import Job
+
+    x = np.linspace(10.0, 20.0, 11)
+    y = np.sqrt(x) * 100
+    e = np.sqrt(y) / 3
+    job = Job()
+    job.experiment.from_arrays(x, y, e)
+    assert np.array_equal(job.experiment.x, x)
+    assert np.array_equal(job.experiment.y.values, y)
+    assert np.array_equal(job.experiment.e.values, e)
+
+    other = Job()
+    other.experiment.from_xye_string('\n'.join(f'{x_i} {y_i} {e_i}' for x_i, y_i, e_i in zip(x, y, e)))
+    assert np.array_equal(other.experiment.y.values, y)
+
+    with pytest.raises(ValueError):
+        Job().experiment.from_arrays(x, y[:-1], e)
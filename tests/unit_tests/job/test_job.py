@@ -1,7 +1,9 @@
+import asyncio
 import copy
 
 import numpy as np
 import pytest
+from easyscience import global_object
 
 import easydiffraction as ed
 from easydiffraction.calculators.wrapper_factory import WrapperFactory
@@ -179,3 +181,144 @@ def _test_copy():
     assert j2.analysis._name == j.analysis._name
     assert j2.type.type_str == j.type.type_str
     assert j2.parameters == j.parameters
+
+
+def test_set_parameters_coalesces_updates(monkeypatch):
+    j = Job()
+    j.add_sample_from_file('tests/data/PbSO4.cif')
+    phase = j.phases[0]
+    calls = []
+    generic_update = j.interface().calculator.genericUpdate
+
+    def counting_update(item_key, **kwargs):
+        calls.append((item_key, kwargs))
+        return generic_update(item_key, **kwargs)
+
+    monkeypatch.setattr(j.interface().calculator, 'genericUpdate', counting_update)
+    # re-bind so the counting setter is used
+    j.interface.generate_bindings(phase.cell)
+    # the calculator is left as it was
+    assert 'create' not in vars(j.interface())
+    calls.clear()
+
+    with j.batch_update():
+        phase.cell.length_a = 8.5
+        phase.cell.length_b = 5.4
+        assert phase.cell.length_a.raw_value == 8.5
+        assert calls == []
+    assert len(calls) == 1
+    assert calls[0][1] == {'length_a': 8.5, 'length_b': 5.4}
+
+    j.set_parameters({phase.cell.length_c: 7.0, phase.cell.length_a.unique_name: 8.4})
+    assert len(calls) == 2
+    assert phase.cell.length_c.raw_value == 7.0
+    assert phase.cell.length_a.raw_value == 8.4
+    with pytest.raises(ValueError):
+        j.set_parameters([1.0, 2.0])
+
+
+def test_calculate_profile_without_store():
+    j = Job()
+    j.add_sample_from_file('tests/data/PbSO4.cif')
+    x = np.linspace(10.0, 150.0, 200)
+    y = j.calculate_profile(x, store=False)
+    assert isinstance(y, np.ndarray)
+    assert not any(name.startswith('sim_') for name in j.datastore.store.variables)
+    y_stored = j.calculate_profile(x)
+    np.testing.assert_allclose(y, y_stored)
+
+
+def test_simulation_retention():
+    j = Job()
+    j.add_sample_from_file('tests/data/PbSO4.cif')
+    j.datastore.max_simulations = 2
+    y_first = j.calculate_profile(np.linspace(10.0, 150.0, 100), simulation_name='a')
+    y_copy = y_first.copy()
+    j.calculate_profile(np.linspace(10.0, 150.0, 100), simulation_name='a')
+    np.testing.assert_array_equal(y_first, y_copy)
+    j.calculate_profile(np.linspace(10.0, 150.0, 50), simulation_name='b')
+    j.calculate_profile(np.linspace(10.0, 150.0, 80), simulation_name='c')
+    simulations = [name for name in j.datastore.store.data_vars if name.startswith('sim_')]
+    assert simulations == ['sim_sim__b', 'sim_sim__c']
+    # coordinates of dropped simulations are removed as well
+    assert len(j.datastore.store.coords) == 2
+    usage = j.datastore.memory_usage()
+    assert usage['total'] == sum(value for key, value in usage.items() if key != 'total')
+    assert usage['sim_sim__c'] == 80 * 8
+
+
+def test_parameter_names_follow_changes(make_lbco_job):
+    first = Job()
+    job = make_lbco_job()
+    # the names are relative to this job, not to the first job of the process
+    assert first.unique_name != job.unique_name
+    length_a = job.phases['lbco'].cell.length_a
+    assert job.get_parent_name(length_a.unique_name) == ".phases['lbco'].cell"
+    assert job.get_parent_name(job.instrument.resolution_u.unique_name) == '.instrument'
+
+    job.add_phase_from_file('tests/data/si.cif')
+    assert job.get_parent_name(job.phases['si'].scale.unique_name) == ".phases['si']"
+    job.set_background([(10.0, 170), (100.0, 160), (165.0, 170)])
+    point = job.pattern.backgrounds[0][1]
+    assert job.get_parent_name(point.y.unique_name) == f".pattern.backgrounds[0]['{point.name}']"
+
+
+def test_update_data(lbco_job):
+    job = lbco_job
+    x, y, e = np.loadtxt('tests/data/hrpt.xye', unpack=True)
+    half = len(x) // 2
+
+    # the pattern comes in two chunks
+    job.update_data(y[:half], e[:half], x=x[:half])
+    assert len(job.experiment.x) == half
+    job.update_data(y[half:], e[half:], x=x[half:], append=True)
+    assert np.array_equal(job.experiment.x.values, x)
+    assert np.array_equal(job.experiment.e.values, e)
+    # more counts on the same points are written in place
+    assert job.experiment.update_data(2 * y, np.sqrt(2) * e)
+    assert np.array_equal(job.experiment.y.values, 2 * y)
+    entry = job.update_data(2 * y, np.sqrt(2) * e)
+
+    assert len(job.acquisition_history) == 3
+    assert entry['points'] == len(x) and entry['success']
+    scale = job.phases['lbco'].scale
+    assert entry['values'][scale.unique_name] == scale.raw_value
+    assert entry['max_shift'] is not None and entry['max_shift'] >= 0
+    # counting statistics by default
+    job.update_data(y, refine=False)
+    assert np.allclose(job.experiment.e.values, np.sqrt(np.maximum(y, 1)))
+    with pytest.raises(ValueError):
+        job.update_data(y[:10], e[:10])
+
+
+def test_fit_async(make_lbco_job):
+    async def run(first, second):
+        events = []
+        results = await asyncio.gather(first.fit_async(progress=events.append), second.fit_async())
+        profile = await first.calculate_profile_async(store=False)
+        return events, results, profile
+
+    first, second = make_lbco_job(), make_lbco_job()
+    global_object.stack.enabled = True
+    try:
+        events, results, profile = asyncio.run(run(first, second))
+        # restored once both fits end
+        assert global_object.stack.enabled
+    finally:
+        global_object.stack.enabled = False
+    assert all(result.success for result in results)
+    assert [event['evaluation'] for event in events] == list(range(1, len(events) + 1))
+    scale = first.phases['lbco'].scale
+    assert events[-1]['values'][".phases['lbco'].scale"] == scale.raw_value
+    assert np.isclose(second.phases['lbco'].scale.raw_value, scale.raw_value)
+    assert np.allclose(profile, results[0].y_calc)
+
+    # leaving the events early cancels the fit
+    async def first_events(job):
+        async for event in job.fit_events():
+            if event['evaluation'] == 3:
+                break
+
+    job = make_lbco_job()
+    asyncio.run(first_events(job))
+    assert job.fitting_results.reason == 'cancelled'
@@ -0,0 +1,84 @@
+import gc
+import re
+import threading
+
+from easyscience import global_object
+
+import easydiffraction as ed
+
+
+def test_jobs_built_in_threads(make_lbco_job):
+    jobs = []
+    errors = []
+
+    def build():
+        try:
+            jobs.append(make_lbco_job())
+        except Exception as ex:
+            errors.append(ex)
+
+    threads = [threading.Thread(target=build) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    names = [parameter.unique_name for job in jobs for parameter in job.get_parameters()]
+    assert len(names) == len(set(names))
+    for job in jobs:
+        job.close()
+
+
+def test_jobs_name_their_objects():
+    first = ed.Job()
+    first.add_phase_from_file('tests/data/lbco.cif')
+    second = ed.Job()
+    second.add_phase_from_file('tests/data/lbco.cif')
+
+    for job in (first, second):
+        number = job.object_registry.number
+        phase = job.phases['lbco']
+        assert re.fullmatch(f'Phase_{number}_[0-9]+', phase.unique_name)
+        assert {parameter.unique_name for parameter in job.get_parameters()} <= set(job.object_registry.names())
+    assert not set(first.object_registry.names()) & set(second.object_registry.names())
+    first.close()
+    second.close()
+
+
+def test_close_releases_objects():
+    other = ed.Job()
+    other.add_phase_from_file('tests/data/lbco.cif')
+    with ed.Job() as job:
+        job.add_phase_from_file('tests/data/lbco.cif')
+        job.add_experiment_from_file('tests/data/hrpt.xye')
+        names = set(job.object_registry.names())
+
+    after = set(global_object.map.vertices())
+    assert not names & after
+    assert len(job.object_registry) == 0
+    assert not job.datastore.store.variables
+    # the other job is untouched
+    assert {parameter.unique_name for parameter in other.get_parameters()} <= after
+    assert other.unique_name in after
+    assert other.phases['lbco'].cell.length_a.raw_value == 3.88
+    other.close()
+
+
+def test_released_names_are_not_reused():
+    closed = ed.Job()
+    closed.add_phase_from_file('tests/data/lbco.cif')
+    released = set(closed.object_registry.names())
+    closed.close()
+    job = ed.Job()
+    job.add_phase_from_file('tests/data/lbco.cif')
+    names = {parameter.unique_name for parameter in job.get_parameters()}
+    assert not names & released
+
+    # the objects of the closed job do not remove the names of others when they are collected
+    del closed
+    gc.collect()
+    vertices = set(global_object.map.vertices())
+    assert names <= vertices
+    assert job.phases['lbco'].cell.length_a.raw_value == 3.88
+    job.close()
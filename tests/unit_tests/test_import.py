@@ -0,0 +1,16 @@
+import subprocess
+import sys
+
+LAZY_MODULES = ['plotly', 'py3Dmol', 'darkdetect', 'IPython', 'scipy.signal', 'cryspy', 'diffpy.pdffit2', 'CFML_api']
+
+
+def test_import_does_not_load_optional_modules():
+    code = 'import sys, easydiffraction; print("loaded:" + ",".join(m for m in {} if m in sys.modules))'.format(LAZY_MODULES)
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)  # noqa: S603
+    assert result.stdout.strip().splitlines()[-1] == 'loaded:'
+
+
+def test_calculator_is_loaded_on_first_use():
+    code = 'import sys, easydiffraction; easydiffraction.Job(); print("cryspy" in sys.modules)'
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)  # noqa: S603
+    assert result.stdout.strip().splitlines()[-1] == 'True'
@@ -0,0 +1,27 @@
+import numpy as np
+
+from easydiffraction.utils import downsample_indices
+from easydiffraction.utils import lttb_indices
+
+
+def test_lttb_keeps_peaks_and_ends():
+    x = np.linspace(0, 100, 100_000)
+    y = 1000 * np.exp(-(((x - 37.3) / 0.05) ** 2)) + 50 * np.exp(-(((x - 80) / 0.02) ** 2))
+    indices = lttb_indices(x, y, 500)
+    assert len(indices) == 500
+    assert indices[0] == 0 and indices[-1] == len(x) - 1
+    assert np.all(np.diff(indices) > 0)
+    assert y[indices].max() > 0.99 * y.max()
+    # the narrow second peak survives too
+    assert y[indices][x[indices] > 60].max() > 45
+    # short lines are kept as they are
+    assert np.array_equal(lttb_indices(x[:10], y[:10], 500), np.arange(10))
+
+
+def test_downsample_indices_within_range():
+    x = np.linspace(0, 100, 10_000)
+    indices = downsample_indices(x, [np.sin(x), np.cos(x)], 100, x_range=(20, 30))
+    # one point beyond each end of the range
+    assert x[indices[0]] < 20 < x[indices[1]]
+    assert x[indices[-2]] < 30 < x[indices[-1]]
+    assert len(indices) <= 200
@@ -0,0 +1,11 @@
+echo "\033[0;33m:::::: Add src to pythonpath\033[0m"
+export PYTHONPATH="${PWD}/src:${PYTHONPATH}"
+echo "PYTHONPATH: ${PYTHONPATH}"
+
+echo "\033[0;33m:::::: Wall time of 'import easydiffraction' (fresh interpreter, 5 runs)\033[0m"
+for i in 1 2 3 4 5; do
+    python -c "import time; t = time.perf_counter(); import easydiffraction; print(f'{time.perf_counter() - t:.3f} s')"
+done
+
+echo "\033[0;33m:::::: Slowest imports (cumulative, us)\033[0m"
+python -X importtime -c "import easydiffraction" 2>&1 | sort -t'|' -k2 -n | tail -15